@@ -1,5 +1,9 @@
 from decimal import Decimal, ROUND_HALF_UP
-from django.db.models import Q
+from typing import Any, Dict, List, Optional
+from django.db import transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import Rank
+from django.utils import timezone
 from .models import ConsolidadoBimestral, ConsolidadoUGEL, Bimestre, Curso
 from .dtos import ConsolidadoBimestralDTO, ConsolidadoUGELDTO, PrecondicionDTO
 from django.contrib.auth import get_user_model
@@ -29,18 +33,21 @@ class ConsolidacionService:
         """
         Verifica precondiciones para consolidar un bimestre.
         """
+        return ConsolidacionService._precondiciones(Bimestre.objects.filter(id=bimestre_id).first())
+
+    @staticmethod
+    def _precondiciones(bimestre: Optional[Bimestre]) -> PrecondicionDTO:
+        """Precondiciones con el bimestre ya leído (None si no existe)."""
         errores = []
         detalles = []
         
         # Verificar si el bimestre está cerrado
-        try:
-            bimestre = Bimestre.objects.get(id=bimestre_id)
-            if not bimestre.cerrado:
-                errores.append("El bimestre no está cerrado")
-            else:
-                detalles.append("Bimestre: Cerrado")
-        except Bimestre.DoesNotExist:
+        if bimestre is None:
             errores.append("Bimestre no encontrado")
+        elif not bimestre.cerrado:
+            errores.append("El bimestre no está cerrado")
+        else:
+            detalles.append("Bimestre: Cerrado")
         
         # Verificar datos mínimos disponibles
         # En este caso, asumimos que las notas vienen del módulo notas
@@ -109,9 +116,7 @@ class ConsolidacionService:
             )
         
         # Calcular promedio final con regla 50-50
-        suma = promedio_mensual + examen_bimestral
-        promedio_final = suma / 2
-        promedio_final = Decimal(str(promedio_final)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        promedio_final = ConsolidacionService._promedio_50_50(promedio_mensual, examen_bimestral)
         
         # Crear o actualizar consolidado bimestral
         consolidado, created = ConsolidadoBimestral.objects.update_or_create(
@@ -124,10 +129,9 @@ class ConsolidacionService:
             }
         )
         
-        # Calcular posición
-        posicion = ConsolidacionService._calcular_posicion(curso_id, bimestre_id, promedio_final)
+        # Recalcular posiciones de todo el curso (las de los demás también cambian)
+        posicion = ConsolidacionService.recalcular_posiciones(curso_id, bimestre_id)[consolidado.id]
         consolidado.posicion = posicion
-        consolidado.save()
         
         return ConsolidadoBimestralDTO(
             id=consolidado.id,
@@ -148,9 +152,121 @@ class ConsolidacionService:
         )
     
     @staticmethod
-    def consolidar_ugel(estudiante_id: int, curso_id: int) -> ConsolidadoUGELDTO:
+    def _promedio_50_50(promedio_mensual: Decimal, examen_bimestral: Decimal) -> Decimal:
+        return Decimal(str((promedio_mensual + examen_bimestral) / 2)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    @staticmethod
+    def consolidar_bimestre_curso(curso_id: int, bimestre_id: int,
+                                  entradas: List[Dict[str, Any]]) -> List[ConsolidadoBimestralDTO]:
+        """
+        Versión masiva de consolidar_bimestre para un curso y bimestre.
+        'entradas': [{estudiante_id, promedio_mensual, examen_bimestral}].
+        Curso, bimestre, estudiantes y consolidados existentes se leen una
+        vez; las filas se crean/actualizan con bulk_create/bulk_update en una
+        transacción, y las posiciones de todo el curso se recalculan con
+        recalcular_posiciones dentro de la misma transacción.
+        Retorna un DTO por entrada, en el mismo orden.
+        """
+        ids = [e['estudiante_id'] for e in entradas]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Hay estudiantes repetidos en la lista")
+
+        curso = Curso.objects.filter(id=curso_id).first()
+        bimestre = Bimestre.objects.filter(id=bimestre_id).first()
+        estudiantes = {u.id: u for u in User.objects.filter(id__in=ids)}
+        precondiciones = ConsolidacionService._precondiciones(bimestre)
+
+        def _sin_consolidar(e, nombre, errores) -> ConsolidadoBimestralDTO:
+            return ConsolidadoBimestralDTO(
+                id=0,
+                estudiante_id=e['estudiante_id'],
+                estudiante_nombre=nombre,
+                curso_id=curso_id,
+                curso_nombre=curso.nombre if curso else "No encontrado",
+                bimestre_id=bimestre_id,
+                bimestre_nombre=bimestre.nombre if bimestre else "No encontrado",
+                promedio_mensual_1=None,
+                promedio_mensual_2=None,
+                examen_bimestral=None,
+                promedio_final=None,
+                posicion=None,
+                cerrado=False,
+                precondiciones_cumplidas=False,
+                errores=errores
+            )
+
+        if curso is None or bimestre is None:
+            return [_sin_consolidar(e, "No encontrado", ["Datos no encontrados"]) for e in entradas]
+        if not precondiciones.cumplida:
+            return [_sin_consolidar(e, str(estudiantes[e['estudiante_id']]) if e['estudiante_id'] in estudiantes
+                                    else "No encontrado", precondiciones.detalles) for e in entradas]
+
+        validas = [e for e in entradas if e['estudiante_id'] in estudiantes]
+        finales = {e['estudiante_id']: ConsolidacionService._promedio_50_50(e['promedio_mensual'], e['examen_bimestral'])
+                   for e in validas}
+
+        ahora = timezone.now()
+        with transaction.atomic():
+            filas = list(ConsolidadoBimestral.objects.select_for_update().filter(curso_id=curso_id, bimestre_id=bimestre_id))
+            existentes = {c.estudiante_id: c for c in filas if c.estudiante_id in finales}
+            actualizados = list(existentes.values())
+            nuevos = []
+            for estudiante_id, promedio_final in finales.items():
+                consolidado = existentes.get(estudiante_id)
+                if consolidado is None:
+                    consolidado = ConsolidadoBimestral(estudiante_id=estudiante_id, curso_id=curso_id,
+                                                       bimestre_id=bimestre_id)
+                    nuevos.append(consolidado)
+                    existentes[estudiante_id] = consolidado
+                consolidado.promedio_final = promedio_final
+                consolidado.cerrado = True
+                consolidado.fecha_calculo = ahora
+
+            ConsolidadoBimestral.objects.bulk_create(nuevos)
+            ConsolidadoBimestral.objects.bulk_update(actualizados, ['promedio_final', 'cerrado', 'fecha_calculo'])
+            if nuevos and nuevos[0].pk is None:
+                # Backends sin RETURNING en bulk_create: recuperar los ids.
+                ids_nuevos = dict(ConsolidadoBimestral.objects.filter(
+                    curso_id=curso_id, bimestre_id=bimestre_id, estudiante_id__in=[c.estudiante_id for c in nuevos]
+                ).values_list('estudiante_id', 'id'))
+                for c in nuevos:
+                    c.pk = ids_nuevos[c.estudiante_id]
+            # Ranking de todo el curso: los demás estudiantes también se reubican.
+            posiciones = ConsolidacionService.recalcular_posiciones(curso_id, bimestre_id)
+
+        dtos = []
+        for e in entradas:
+            estudiante = estudiantes.get(e['estudiante_id'])
+            if estudiante is None:
+                dtos.append(_sin_consolidar(e, "No encontrado", ["Estudiante no encontrado"]))
+                continue
+            consolidado = existentes[estudiante.id]
+            dtos.append(ConsolidadoBimestralDTO(
+                id=consolidado.id,
+                estudiante_id=estudiante.id,
+                estudiante_nombre=str(estudiante),
+                curso_id=curso_id,
+                curso_nombre=curso.nombre,
+                bimestre_id=bimestre_id,
+                bimestre_nombre=bimestre.nombre,
+                promedio_mensual_1=e['promedio_mensual'],
+                promedio_mensual_2=None,
+                examen_bimestral=e['examen_bimestral'],
+                promedio_final=consolidado.promedio_final,
+                posicion=posiciones[consolidado.id],
+                cerrado=True,
+                precondiciones_cumplidas=True,
+                errores=[]
+            ))
+        return dtos
+
+    @staticmethod
+    def consolidar_ugel(estudiante_id: int, curso_id: int, recalcular_posiciones: bool = True) -> ConsolidadoUGELDTO:
         """
         Consolida las notas para el reporte UGEL según las reglas específicas.
+        Con recalcular_posiciones=False no se rankea el curso (el llamador
+        consolida varios estudiantes y llama a recalcular_posiciones_anual
+        una sola vez al final); posicion_curso queda como estaba.
         """
         # Obtener todos los bimestres consolidados para este estudiante y curso
         consolidados_bimestrales = ConsolidadoBimestral.objects.filter(
@@ -193,9 +309,6 @@ class ConsolidacionService:
         # Generar comentario automático
         comentario = ConsolidacionService._generar_comentario(promedio_final, letra, bimestres_disponibles)
         
-        # Calcular posición en el curso
-        posicion_curso = ConsolidacionService._calcular_posicion_anual(curso_id, promedio_final)
-        
         try:
             estudiante = User.objects.get(id=estudiante_id)
             curso = Curso.objects.get(id=curso_id)
@@ -229,11 +342,16 @@ class ConsolidacionService:
                 'bimestre_4': bimestre_4,
                 'promedio_final': promedio_final,
                 'letra': letra,
-                'posicion_curso': posicion_curso,
                 'comentario': comentario
             }
         )
         
+        # Posición en el curso, recalculada para todos sus estudiantes
+        if recalcular_posiciones:
+            posicion_curso = ConsolidacionService.recalcular_posiciones_anual(curso_id).get(consolidado_ugel.id)
+        else:
+            posicion_curso = consolidado_ugel.posicion_curso
+        
         return ConsolidadoUGELDTO(
             id=consolidado_ugel.id,
             estudiante_id=estudiante_id,
@@ -253,31 +371,45 @@ class ConsolidacionService:
         )
     
     @staticmethod
-    def _calcular_posicion(curso_id: int, bimestre_id: int, promedio_actual: Decimal) -> int:
+    def _rankear(queryset, campo_posicion: str) -> Dict[int, int]:
         """
-        Calcula la posición del estudiante en el curso para un bimestre específico.
-        Maneja empates correctamente.
+        Asigna a cada fila del queryset su puesto por promedio_final
+        descendente, con empates estilo competencia (1, 2, 2, 4), en una
+        sola consulta con RANK() OVER. Persiste con un bulk_update solo las
+        filas cuyo puesto cambió. Retorna {id: puesto}.
         """
-        mejores = ConsolidadoBimestral.objects.filter(
-            curso_id=curso_id,
-            bimestre_id=bimestre_id,
-            promedio_final__gt=promedio_actual,
-            cerrado=True
-        ).count()
-        
-        return mejores + 1
-    
+        filas = list(
+            queryset.filter(promedio_final__isnull=False)
+            .annotate(puesto=Window(expression=Rank(), order_by=F('promedio_final').desc()))
+            .only('id', campo_posicion)
+        )
+        cambiadas = []
+        for fila in filas:
+            if getattr(fila, campo_posicion) != fila.puesto:
+                setattr(fila, campo_posicion, fila.puesto)
+                cambiadas.append(fila)
+        if cambiadas:
+            queryset.model.objects.bulk_update(cambiadas, [campo_posicion])
+        return {fila.id: fila.puesto for fila in filas}
+
     @staticmethod
-    def _calcular_posicion_anual(curso_id: int, promedio_actual: Decimal) -> int:
+    def recalcular_posiciones(curso_id: int, bimestre_id: int) -> Dict[int, int]:
         """
-        Calcula la posición del estudiante en el curso para el promedio anual.
+        Puestos de todos los consolidados cerrados del curso en el bimestre.
+        Retorna {id de ConsolidadoBimestral: posicion}.
         """
-        mejores = ConsolidadoUGEL.objects.filter(
-            curso_id=curso_id,
-            promedio_final__gt=promedio_actual
-        ).count()
-        
-        return mejores + 1
+        return ConsolidacionService._rankear(
+            ConsolidadoBimestral.objects.filter(curso_id=curso_id, bimestre_id=bimestre_id, cerrado=True),
+            'posicion',
+        )
+
+    @staticmethod
+    def recalcular_posiciones_anual(curso_id: int) -> Dict[int, int]:
+        """
+        Puestos anuales de todos los consolidados UGEL del curso.
+        Retorna {id de ConsolidadoUGEL: posicion_curso}.
+        """
+        return ConsolidacionService._rankear(ConsolidadoUGEL.objects.filter(curso_id=curso_id), 'posicion_curso')
     
     @staticmethod
     def _generar_comentario(promedio: Decimal, letra: str, bimestres_disponibles: int) -> str:
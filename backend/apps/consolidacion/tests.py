@@ -0,0 +1,130 @@
+# backend/apps/consolidacion/tests.py
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .consolidacion_service import ConsolidacionService
+from .models import Bimestre, ConsolidadoBimestral, Curso
+
+User = get_user_model()
+
+
+class ConsolidarCursoTests(TestCase):
+    def setUp(self):
+        self.curso = Curso.objects.create(nombre="Matemática", codigo="MAT")
+        self.bimestre = Bimestre.objects.create(nombre="I", fecha_inicio=date(2025, 3, 1),
+                                                fecha_fin=date(2025, 5, 1), cerrado=True)
+        self.alumnos = [User.objects.create(username=f"alumno{i}") for i in range(4)]
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username="docente"))
+
+    def _entradas(self, notas):
+        return [{"estudiante_id": a.id, "promedio_mensual": Decimal(m), "examen_bimestral": Decimal(e)}
+                for a, (m, e) in zip(self.alumnos, notas)]
+
+    def test_igual_que_uno_por_uno(self):
+        notas = [("15", "16"), ("18", "19"), ("15", "16"), ("10", "11")]
+        # Un alumno ya consolidado antes, con otro promedio: se actualiza.
+        ConsolidadoBimestral.objects.create(estudiante=self.alumnos[3], curso=self.curso, bimestre=self.bimestre,
+                                            promedio_final=Decimal("20"), cerrado=True, posicion=1)
+
+        # 3 lecturas + SAVEPOINT, SELECT, INSERT, UPDATE, RANK() de recalcular_posiciones, UPDATE de puestos, RELEASE
+        with self.assertNumQueries(10):
+            dtos = ConsolidacionService.consolidar_bimestre_curso(self.curso.id, self.bimestre.id,
+                                                                  self._entradas(notas))
+
+        self.assertEqual([d.promedio_final for d in dtos],
+                         [Decimal("15.50"), Decimal("18.50"), Decimal("15.50"), Decimal("10.50")])
+        self.assertEqual([d.posicion for d in dtos], [2, 1, 2, 4])
+        filas = {c.estudiante_id: c for c in ConsolidadoBimestral.objects.all()}
+        self.assertEqual(len(filas), 4)
+        self.assertEqual([filas[a.id].posicion for a in self.alumnos], [2, 1, 2, 4])
+        self.assertEqual([d.id for d in dtos], [filas[a.id].id for a in self.alumnos])
+
+        # El último en consolidarse uno por uno ve a todo el curso: misma posición.
+        uno = ConsolidacionService.consolidar_bimestre(self.alumnos[3].id, self.curso.id, self.bimestre.id,
+                                                       Decimal("10"), Decimal("11"))
+        self.assertEqual((uno.promedio_final, uno.posicion), (dtos[3].promedio_final, dtos[3].posicion))
+
+    def test_precondiciones_y_estudiante_inexistente(self):
+        entradas = self._entradas([("15", "16")]) + [
+            {"estudiante_id": 9999, "promedio_mensual": Decimal("12"), "examen_bimestral": Decimal("12")}]
+        dtos = ConsolidacionService.consolidar_bimestre_curso(self.curso.id, self.bimestre.id, entradas)
+        self.assertEqual(dtos[1].errores, ["Estudiante no encontrado"])
+        self.assertTrue(dtos[0].cerrado)
+
+        Bimestre.objects.filter(pk=self.bimestre.pk).update(cerrado=False)
+        dtos = ConsolidacionService.consolidar_bimestre_curso(self.curso.id, self.bimestre.id, entradas[:1])
+        self.assertFalse(dtos[0].precondiciones_cumplidas)
+
+        with self.assertRaises(ValueError):
+            ConsolidacionService.consolidar_bimestre_curso(self.curso.id, self.bimestre.id, entradas[:1] * 2)
+
+    def test_endpoint(self):
+        url = "/api/consolidacion/consolidados-bimestrales/consolidar_curso/"
+        body = {
+            "curso_id": self.curso.id,
+            "bimestre_id": self.bimestre.id,
+            "estudiantes": [{"estudiante_id": a.id, "promedio_mensual": 14, "examen_bimestral": 16}
+                            for a in self.alumnos[:2]],
+        }
+        resp = self.client.post(url, body, format="json")
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual([c["promedio_final"] for c in resp.json()["consolidados"]], [15.0, 15.0])
+        self.assertEqual([c["posicion"] for c in resp.json()["consolidados"]], [1, 1])
+
+        body["estudiantes"][0]["examen_bimestral"] = "x"
+        resp = self.client.post(url, body, format="json")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("estudiantes[0]", resp.json()["error"])
+
+
+class RecalcularPosicionesTests(TestCase):
+    def setUp(self):
+        self.curso = Curso.objects.create(nombre="Comunicación", codigo="COM")
+        self.bimestre = Bimestre.objects.create(nombre="I", fecha_inicio=date(2025, 3, 1),
+                                                fecha_fin=date(2025, 5, 1), cerrado=True)
+        self.alumnos = [User.objects.create(username=f"alumno{i}") for i in range(5)]
+
+    def test_posiciones_de_los_anteriores_no_quedan_viejas(self):
+        notas = [("12", "12"), ("16", "16"), ("16", "16"), ("18", "18")]
+        for alumno, (m, e) in zip(self.alumnos, notas):
+            ConsolidacionService.consolidar_bimestre(alumno.id, self.curso.id, self.bimestre.id, Decimal(m), Decimal(e))
+        posiciones = dict(ConsolidadoBimestral.objects.values_list("estudiante_id", "posicion"))
+        self.assertEqual([posiciones[a.id] for a in self.alumnos[:4]], [4, 2, 2, 1])
+
+        # Sin cerrar o sin promedio no entran al ranking.
+        ConsolidadoBimestral.objects.create(estudiante=self.alumnos[4], curso=self.curso, bimestre=self.bimestre,
+                                            promedio_final=Decimal("20"), cerrado=False)
+        with self.assertNumQueries(1):  # nada cambió: solo la consulta con RANK()
+            self.assertEqual(sorted(ConsolidacionService.recalcular_posiciones(self.curso.id, self.bimestre.id)
+                                    .values()), [1, 2, 2, 4])
+
+    def test_ranking_anual_y_reporte(self):
+        from .models import ConsolidadoUGEL
+
+        for alumno, nota in zip(self.alumnos[:3], ("15", "19", "15")):
+            ConsolidacionService.consolidar_bimestre(alumno.id, self.curso.id, self.bimestre.id,
+                                                     Decimal(nota), Decimal(nota))
+            ConsolidacionService.consolidar_ugel(alumno.id, self.curso.id)
+        posiciones = dict(ConsolidadoUGEL.objects.values_list("estudiante_id", "posicion_curso"))
+        self.assertEqual([posiciones[a.id] for a in self.alumnos[:3]], [2, 1, 2])
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username="docente"))
+        resp = client.get("/api/consolidacion/consolidados-ugel/reporte_ugel/", {"curso_id": self.curso.id})
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual(sorted(r["posicion_curso"] for r in resp.json()), [1, 2, 2])
+
+    def test_consolidar_curso_reubica_a_los_demas(self):
+        for alumno, nota in zip(self.alumnos[:3], ("15", "17", "13")):
+            ConsolidacionService.consolidar_bimestre(alumno.id, self.curso.id, self.bimestre.id,
+                                                     Decimal(nota), Decimal(nota))
+        ConsolidacionService.consolidar_bimestre_curso(self.curso.id, self.bimestre.id, [
+            {"estudiante_id": self.alumnos[3].id, "promedio_mensual": Decimal("20"), "examen_bimestral": Decimal("20")},
+        ])
+        posiciones = dict(ConsolidadoBimestral.objects.values_list("estudiante_id", "posicion"))
+        self.assertEqual([posiciones[a.id] for a in self.alumnos[:4]], [3, 2, 4, 1])
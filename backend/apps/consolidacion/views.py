@@ -12,6 +12,25 @@ from .serializers import (
 )
 
 
+def _bimestral_a_dict(consolidado_dto):
+    return {
+        'id': consolidado_dto.id,
+        'estudiante_id': consolidado_dto.estudiante_id,
+        'estudiante_nombre': consolidado_dto.estudiante_nombre,
+        'curso_id': consolidado_dto.curso_id,
+        'curso_nombre': consolidado_dto.curso_nombre,
+        'bimestre_id': consolidado_dto.bimestre_id,
+        'bimestre_nombre': consolidado_dto.bimestre_nombre,
+        'promedio_mensual_1': float(consolidado_dto.promedio_mensual_1) if consolidado_dto.promedio_mensual_1 else None,
+        'examen_bimestral': float(consolidado_dto.examen_bimestral) if consolidado_dto.examen_bimestral else None,
+        'promedio_final': float(consolidado_dto.promedio_final) if consolidado_dto.promedio_final else None,
+        'posicion': consolidado_dto.posicion,
+        'cerrado': consolidado_dto.cerrado,
+        'precondiciones_cumplidas': consolidado_dto.precondiciones_cumplidas,
+        'errores': consolidado_dto.errores
+    }
+
+
 class ConsolidadoBimestralViewSet(viewsets.ModelViewSet):
     queryset = ConsolidadoBimestral.objects.all()
     serializer_class = ConsolidadoBimestralSerializer
@@ -41,22 +60,7 @@ class ConsolidadoBimestralViewSet(viewsets.ModelViewSet):
             )
             
             # Convertir DTO a formato de respuesta
-            response_data = {
-                'id': consolidado_dto.id,
-                'estudiante_id': consolidado_dto.estudiante_id,
-                'estudiante_nombre': consolidado_dto.estudiante_nombre,
-                'curso_id': consolidado_dto.curso_id,
-                'curso_nombre': consolidado_dto.curso_nombre,
-                'bimestre_id': consolidado_dto.bimestre_id,
-                'bimestre_nombre': consolidado_dto.bimestre_nombre,
-                'promedio_mensual_1': float(consolidado_dto.promedio_mensual_1) if consolidado_dto.promedio_mensual_1 else None,
-                'examen_bimestral': float(consolidado_dto.examen_bimestral) if consolidado_dto.examen_bimestral else None,
-                'promedio_final': float(consolidado_dto.promedio_final) if consolidado_dto.promedio_final else None,
-                'posicion': consolidado_dto.posicion,
-                'cerrado': consolidado_dto.cerrado,
-                'precondiciones_cumplidas': consolidado_dto.precondiciones_cumplidas,
-                'errores': consolidado_dto.errores
-            }
+            response_data = _bimestral_a_dict(consolidado_dto)
             
             return Response(response_data)
             
@@ -66,6 +70,53 @@ class ConsolidadoBimestralViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=False, methods=['post'])
+    def consolidar_curso(self, request):
+        """
+        Consolida un curso completo en un bimestre.
+        Body: {curso_id, bimestre_id, estudiantes: [{estudiante_id, promedio_mensual, examen_bimestral}]}
+        Responde un consolidado por estudiante, en el orden recibido.
+        """
+        curso_id = request.data.get('curso_id')
+        bimestre_id = request.data.get('bimestre_id')
+        estudiantes = request.data.get('estudiantes')
+        
+        if not all([curso_id, bimestre_id, estudiantes]) or not isinstance(estudiantes, list):
+            return Response(
+                {'error': 'Se requieren: curso_id, bimestre_id y estudiantes (lista)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        entradas = []
+        for i, e in enumerate(estudiantes):
+            try:
+                entradas.append({
+                    'estudiante_id': int(e['estudiante_id']),
+                    'promedio_mensual': Decimal(str(e['promedio_mensual'])),
+                    'examen_bimestral': Decimal(str(e['examen_bimestral'])),
+                })
+            except (TypeError, KeyError, ValueError, ArithmeticError):
+                return Response(
+                    {'error': f'estudiantes[{i}]: se requieren estudiante_id, promedio_mensual y examen_bimestral numéricos'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        
+        try:
+            consolidados = ConsolidacionService.consolidar_bimestre_curso(curso_id, bimestre_id, entradas)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response(
+                {'error': f'Error en consolidación: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        
+        return Response({
+            'curso_id': curso_id,
+            'bimestre_id': bimestre_id,
+            'consolidados': [_bimestral_a_dict(dto) for dto in consolidados],
+        })
+    
     @action(detail=False, methods=['get'])
     def verificar_precondiciones(self, request):
         """Verifica precondiciones para consolidación."""
@@ -166,10 +217,18 @@ class ConsolidadoUGELViewSet(viewsets.ModelViewSet):
         for consolidado in queryset:
             consolidado_dto = ConsolidacionService.consolidar_ugel(
                 consolidado.estudiante_id, 
-                consolidado.curso_id
+                consolidado.curso_id,
+                recalcular_posiciones=False
             )
             consolidados_actualizados.append(consolidado_dto)
         
+        # Un solo ranking por curso, con todos los promedios ya actualizados
+        posiciones = {}
+        for curso in {dto.curso_id for dto in consolidados_actualizados}:
+            posiciones.update(ConsolidacionService.recalcular_posiciones_anual(curso))
+        for dto in consolidados_actualizados:
+            dto.posicion_curso = posiciones.get(dto.id, dto.posicion_curso)
+        
         serializer = ConsolidadoUGELReportSerializer(consolidados_actualizados, many=True)
         return Response(serializer.data)
 
@@ -8,4 +8,4 @@ class LibretasConfig(AppConfig):
         # elimina o comenta esto si lo tienes:
         # from .services import excel_adapter
         # excel_adapter.dataport = excel_adapter.ExcelDataPort()
-        pass
+        from . import signals  # noqa: F401  (registra receivers de Nota)
@@ -0,0 +1,50 @@
+# backend/apps/libretas/management/commands/benchmark_libretas.py
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.libretas.services.benchmark_service import comparar, ejecutar_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide bimestral_pdf, render_bimestral_pdf (ReportLab) y el export UGEL sobre un colegio "
+        "sintético. No deja datos en la BD. Escribe JSON para comparar entre versiones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--grados", type=int, default=3)
+        parser.add_argument("--alumnos", type=int, default=30, help="Alumnos por grado")
+        parser.add_argument("--asignaturas", type=int, default=12)
+        parser.add_argument("--notas", type=int, default=4, help="Notas por alumno y asignatura")
+        parser.add_argument("--repeticiones", type=int, default=3)
+        parser.add_argument("--bimestre", type=int, default=1)
+        parser.add_argument("--motor", default="", help="weasyprint | reportlab (default: settings)")
+        parser.add_argument("--modo", default="", help="simple | paralelo | incremental (default: settings)")
+        parser.add_argument("--semilla", type=int, default=0)
+        parser.add_argument("--salida", default="", help="Archivo JSON de resultados (default: stdout)")
+        parser.add_argument("--comparar", default="", help="JSON de una corrida anterior para ver la variación")
+
+    def handle(self, *args, **opts):
+        for campo in ("grados", "alumnos", "asignaturas", "repeticiones"):
+            if opts[campo] < 1:
+                raise CommandError(f"--{campo} debe ser >= 1")
+
+        resultado = ejecutar_benchmark(
+            grados=opts["grados"], alumnos=opts["alumnos"], asignaturas=opts["asignaturas"],
+            notas=opts["notas"], repeticiones=opts["repeticiones"], bimestre=opts["bimestre"],
+            motor=opts["motor"], modo=opts["modo"], semilla=opts["semilla"],
+        )
+        if opts["comparar"]:
+            base = json.loads(Path(opts["comparar"]).read_text(encoding="utf-8"))
+            resultado["variacion_pct"] = comparar(resultado, base)
+
+        texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+        if opts["salida"]:
+            Path(opts["salida"]).write_text(texto + "\n", encoding="utf-8")
+            for nombre, r in resultado["resultados"].items():
+                self.stdout.write(f"{nombre}: mediana {r['mediana_ms']} ms ({r['bytes']} bytes)")
+            self.stdout.write(self.style.SUCCESS(f"Resultados en {opts['salida']}"))
+        else:
+            self.stdout.write(texto)
@@ -0,0 +1,17 @@
+# backend/apps/libretas/management/commands/limpiar_lotes_libretas.py
+from django.core.management.base import BaseCommand
+
+from apps.libretas.services.lote_service import barrer_terminados
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra los lotes de libretas terminados hace más de LIBRETAS_LOTE_TTL y sus ZIP, más los archivos "
+        "de LIBRETAS_LOTES_DIR que ya no tienen lote. Pensado para cron."
+    )
+
+    def handle(self, *args, **opts):
+        r = barrer_terminados()
+        self.stdout.write(self.style.SUCCESS(
+            f"Lotes de libretas: {r['lotes']} lotes y {r['archivos']} archivos eliminados."
+        ))
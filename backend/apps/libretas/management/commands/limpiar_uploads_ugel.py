@@ -0,0 +1,21 @@
+# backend/apps/libretas/management/commands/limpiar_uploads_ugel.py
+from django.core.management.base import BaseCommand
+
+from apps.libretas.services.ugel_export_jobs import barrer_terminados
+from apps.libretas.services.ugel_uploads import barrer, bytes_en_disco
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra tokens UGEL vencidos, aplica LIBRETAS_UGEL_UPLOADS_MAX_BYTES y elimina de UPLOAD_TMP_DIR "
+        "los archivos que ya no referencia ningún token. También borra los exports asíncronos terminados "
+        "hace más de LIBRETAS_UGEL_EXPORT_TTL y sus .xlsx. Pensado para cron."
+    )
+
+    def handle(self, *args, **opts):
+        r = barrer()
+        e = barrer_terminados()
+        self.stdout.write(self.style.SUCCESS(
+            f"Uploads UGEL: {r['tokens']} tokens y {r['archivos']} archivos eliminados; "
+            f"{bytes_en_disco()} bytes en uso. Exports UGEL: {e['jobs']} jobs y {e['archivos']} archivos eliminados."
+        ))
@@ -0,0 +1,16 @@
+# backend/apps/libretas/management/commands/reanudar_exports_ugel.py
+from django.core.management.base import BaseCommand
+
+from apps.libretas.services.ugel_export_jobs import reanudar_pendientes, _get_ejecutor
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa los exports UGEL que quedaron pendientes o huérfanos (sin latido) después de un "
+        "reinicio. Espera a que terminen antes de salir."
+    )
+
+    def handle(self, *args, **opts):
+        ids = reanudar_pendientes()
+        _get_ejecutor().shutdown(wait=True)
+        self.stdout.write(self.style.SUCCESS(f"Exports UGEL reanudados: {len(ids)}."))
@@ -0,0 +1,16 @@
+# backend/apps/libretas/management/commands/reanudar_lotes_libretas.py
+from django.core.management.base import BaseCommand
+
+from apps.libretas.services.lote_service import reanudar_pendientes, _get_ejecutor
+
+
+class Command(BaseCommand):
+    help = (
+        "Procesa los lotes de libretas que quedaron pendientes o huérfanos (sin latido) después de un "
+        "reinicio. Espera a que terminen antes de salir."
+    )
+
+    def handle(self, *args, **opts):
+        ids = reanudar_pendientes()
+        _get_ejecutor().shutdown(wait=True)
+        self.stdout.write(self.style.SUCCESS(f"Lotes de libretas reanudados: {len(ids)}."))
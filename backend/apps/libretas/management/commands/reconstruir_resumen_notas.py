@@ -0,0 +1,18 @@
+# backend/apps/libretas/management/commands/reconstruir_resumen_notas.py
+from django.core.management.base import BaseCommand
+
+from apps.libretas.services.resumen_notas import reconstruir
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconstruye ResumenNotaBimestre desde la tabla nota. Usar en la carga inicial y después de "
+        "operaciones masivas (bulk_create, update/delete por QuerySet) que no disparan signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bimestre", type=int, default=None, help="Solo este bimestre (default: todos)")
+
+    def handle(self, *args, **opts):
+        creadas = reconstruir(bimestre=opts["bimestre"])
+        self.stdout.write(self.style.SUCCESS(f"Resumen reconstruido: {creadas} filas."))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:05
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibretaLote',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('bimestre', models.IntegerField()),
+                ('grados', models.JSONField(default=list)),
+                ('seccion', models.CharField(default='A', max_length=5)),
+                ('nivel', models.CharField(blank=True, max_length=20)),
+                ('modo', models.CharField(blank=True, max_length=20)),
+                ('base_url', models.CharField(blank=True, max_length=300)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En proceso'), ('COMPLETADO', 'Completado'), ('ERROR', 'Error')], default='PENDIENTE', max_length=20)),
+                ('total', models.IntegerField(default=0)),
+                ('procesados', models.IntegerField(default=0)),
+                ('archivo', models.CharField(blank=True, max_length=500)),
+                ('error', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_en', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_en', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Lote de Libretas',
+                'verbose_name_plural': 'Lotes de Libretas',
+                'ordering': ['-creado_en'],
+            },
+        ),
+    ]
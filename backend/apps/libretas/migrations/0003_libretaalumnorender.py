@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0002_libretalote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibretaAlumnoRender',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bimestre', models.IntegerField()),
+                ('nivel', models.CharField(max_length=20)),
+                ('huella', models.CharField(max_length=64)),
+                ('version', models.CharField(max_length=50)),
+                ('sucio', models.BooleanField(default=False)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('alumno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renders_libreta', to='libretas.alumno')),
+            ],
+            options={
+                'verbose_name': 'Render de Libreta por Alumno',
+                'verbose_name_plural': 'Renders de Libreta por Alumno',
+                'unique_together': {('alumno', 'bimestre', 'nivel')},
+            },
+        ),
+    ]
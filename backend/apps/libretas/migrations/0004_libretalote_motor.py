@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0003_libretaalumnorender'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libretalote',
+            name='motor',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0004_libretalote_motor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradoTrabajado',
+            fields=[
+                ('idgrado_trabajado', models.IntegerField(db_column='idgrado_trabajado', primary_key=True, serialize=False)),
+                ('grado', models.IntegerField(db_column='grado')),
+                ('seccion', models.CharField(db_column='seccion', default='A', max_length=5)),
+                ('idtutor', models.IntegerField(blank=True, db_column='idtutor', null=True)),
+                ('anio', models.IntegerField(blank=True, db_column='anio', null=True)),
+            ],
+            options={
+                'db_table': 'grado_trabajado',
+                'managed': True,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='alumno',
+            index=models.Index(fields=['idgrado_trabajado'], name='alumno_grado_trab_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nota',
+            index=models.Index(fields=['bimestre', 'idalumno', 'idasignatura_trabajada', 'calificacion'], name='nota_bim_alum_asig_cal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gradotrabajado',
+            index=models.Index(fields=['grado', 'seccion'], name='grado_trab_grado_secc_idx'),
+        ),
+    ]
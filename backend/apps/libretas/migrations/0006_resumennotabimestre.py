@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0005_gradotrabajado_indices_nota'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenNotaBimestre',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bimestre', models.IntegerField()),
+                ('cantidad', models.IntegerField(default=0)),
+                ('suma', models.DecimalField(decimal_places=2, default=0, max_digits=9)),
+                ('promedio', models.DecimalField(decimal_places=4, default=0, max_digits=8)),
+                ('letra', models.CharField(max_length=2)),
+                ('notas', models.JSONField(default=list)),
+                ('primera_nota', models.IntegerField()),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('alumno', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_nota', to='libretas.alumno')),
+                ('asignatura', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_nota', to='libretas.asignatura')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Notas por Bimestre',
+                'verbose_name_plural': 'Resúmenes de Notas por Bimestre',
+                'indexes': [models.Index(fields=['bimestre', 'alumno'], name='resumen_nota_bim_alumno_idx')],
+                'unique_together': {('alumno', 'asignatura', 'bimestre')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:29
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0006_resumennotabimestre'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UgelUpload',
+            fields=[
+                ('token', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('ruta', models.CharField(max_length=500)),
+                ('nombre_original', models.CharField(max_length=255)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('tamano', models.BigIntegerField(default=0)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('ultimo_uso', models.DateTimeField(auto_now_add=True)),
+                ('expira_en', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Upload UGEL',
+                'verbose_name_plural': 'Uploads UGEL',
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:33
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0007_ugelupload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UgelExportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('ruta', models.CharField(max_length=500)),
+                ('nombre_original', models.CharField(max_length=255)),
+                ('grado', models.CharField(blank=True, max_length=50)),
+                ('curso', models.CharField(blank=True, max_length=100)),
+                ('modo', models.CharField(blank=True, max_length=20)),
+                ('todas', models.BooleanField(default=False)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_PROCESO', 'En proceso'), ('COMPLETADO', 'Completado'), ('ERROR', 'Error')], default='PENDIENTE', max_length=20)),
+                ('total', models.IntegerField(default=0)),
+                ('procesados', models.IntegerField(default=0)),
+                ('intentos', models.IntegerField(default=0)),
+                ('archivo', models.CharField(blank=True, max_length=500)),
+                ('error', models.TextField(blank=True)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_en', models.DateTimeField(blank=True, null=True)),
+                ('latido', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_en', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Export UGEL',
+                'verbose_name_plural': 'Exports UGEL',
+                'ordering': ['-creado_en'],
+                'indexes': [models.Index(fields=['estado', 'latido'], name='ugel_job_estado_latido_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-18 04:40
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0008_ugelexportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UgelUploadParcial',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre_original', models.CharField(max_length=255)),
+                ('tamano', models.BigIntegerField()),
+                ('recibidos', models.BigIntegerField(default=0)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('expira_en', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Upload UGEL parcial',
+                'verbose_name_plural': 'Uploads UGEL parciales',
+            },
+        ),
+    ]
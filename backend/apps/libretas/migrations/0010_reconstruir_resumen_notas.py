@@ -0,0 +1,59 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations
+
+_CERO = Decimal("0")
+_Q2 = Decimal("0.01")
+_Q4 = Decimal("0.0001")
+
+
+def _letra(promedio):
+    # Escala de calc_service.nota_a_letra (HALF_UP a 2 decimales), copiada para que
+    # la migración no cambie si el servicio cambia.
+    d = promedio.quantize(_Q2, rounding=ROUND_HALF_UP)
+    if d < Decimal("11.00"):
+        return "C"
+    if d < Decimal("14.00"):
+        return "B"
+    if d < Decimal("18.00"):
+        return "A"
+    return "AD"
+
+
+def reconstruir_resumen(apps, schema_editor):
+    # Las bases existentes ya tienen notas: sin esto el resumen queda vacío
+    # (y las libretas sin alumnos) hasta correr reconstruir_resumen_notas.
+    Nota = apps.get_model("libretas", "Nota")
+    ResumenNotaBimestre = apps.get_model("libretas", "ResumenNotaBimestre")
+    ResumenNotaBimestre.objects.all().delete()
+
+    grupos = {}  # (alumno, asignatura, bimestre) -> (primera_nota, [calificaciones])
+    notas = (Nota.objects.order_by("idnota")
+             .values_list("idnota", "idalumno_id", "idasignatura_trabajada__idasignatura_id", "bimestre",
+                          "calificacion")
+             .iterator(chunk_size=2000))
+    for idnota, alumno_id, asignatura_id, bimestre, calificacion in notas:
+        grupo = grupos.setdefault((alumno_id, asignatura_id, bimestre), (idnota, []))
+        grupo[1].append(calificacion if calificacion is not None else _CERO)
+
+    filas = []
+    for (alumno_id, asignatura_id, bimestre), (primera, calificaciones) in grupos.items():
+        suma = sum(calificaciones, _CERO)
+        exacto = suma / len(calificaciones)
+        filas.append(ResumenNotaBimestre(
+            alumno_id=alumno_id, asignatura_id=asignatura_id, bimestre=bimestre, cantidad=len(calificaciones),
+            suma=suma, promedio=exacto.quantize(_Q4), letra=_letra(exacto),
+            notas=[float(c) for c in calificaciones], primera_nota=primera,
+        ))
+    ResumenNotaBimestre.objects.bulk_create(filas, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0009_ugeluploadparcial'),
+    ]
+
+    operations = [
+        migrations.RunPython(reconstruir_resumen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:08
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0010_reconstruir_resumen_notas'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='LibretaAlumnoRender',
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0011_eliminar_libretaalumnorender'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libretalote',
+            name='intentos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='libretalote',
+            name='latido',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='libretalote',
+            index=models.Index(fields=['estado', 'latido'], name='lote_estado_latido_idx'),
+        ),
+    ]
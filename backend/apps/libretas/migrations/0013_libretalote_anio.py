@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 05:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('libretas', '0012_lote_latido_intentos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libretalote',
+            name='anio',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 
@@ -14,11 +16,37 @@ class Alumno(models.Model):
     class Meta:
         db_table = "alumno"
         managed = True
+        indexes = [
+            models.Index(fields=["idgrado_trabajado"], name="alumno_grado_trab_idx"),
+        ]
 
     def __str__(self):
         return f"{self.apellidos}, {self.nombres}"
 
 
+class GradoTrabajado(models.Model):
+    """
+    Grado abierto en un año para una sección (Grado_trabajado en la BD del
+    colegio). Alumno.idgrado_trabajado apunta a esta tabla: un mismo grado
+    con tres secciones son tres filas.
+    """
+    idgrado_trabajado = models.IntegerField(primary_key=True, db_column='idgrado_trabajado')
+    grado = models.IntegerField(db_column='grado')
+    seccion = models.CharField(max_length=5, default="A", db_column='seccion')
+    idtutor = models.IntegerField(null=True, blank=True, db_column='idtutor')
+    anio = models.IntegerField(null=True, blank=True, db_column='anio')
+
+    class Meta:
+        db_table = "grado_trabajado"
+        managed = True
+        indexes = [
+            models.Index(fields=["grado", "seccion"], name="grado_trab_grado_secc_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.grado}{self.seccion}"
+
+
 class Asignatura(models.Model):
     idasignatura = models.IntegerField(primary_key=True, db_column='idasignatura')
     area = models.CharField(max_length=50, db_column='area')
@@ -55,6 +83,45 @@ class Nota(models.Model):
     class Meta:
         db_table = "nota"
         managed = True
+        indexes = [
+            # Consolidación: filtra por bimestre, agrupa por (alumno, asignatura)
+            # y promedia calificacion; el índice cubre la consulta completa.
+            models.Index(fields=["bimestre", "idalumno", "idasignatura_trabajada", "calificacion"],
+                         name="nota_bim_alum_asig_cal_idx"),
+        ]
+
+
+class ResumenNotaBimestre(models.Model):
+    """
+    Resumen materializado de notas por alumno × asignatura × bimestre.
+    Lo mantienen los signals de Nota (services.resumen_notas.recalcular) y
+    se reconstruye completo con 'manage.py reconstruir_resumen_notas'.
+    Las operaciones masivas (bulk_create, QuerySet.update/delete, SQL directo)
+    no disparan signals: después de ellas hay que reconstruir. La
+    consolidación además verifica cantidad y suma contra nota antes de leer
+    (resumen_notas.verificar) y rehace el grupo si no cuadran.
+    """
+    alumno = models.ForeignKey(Alumno, on_delete=models.CASCADE, related_name='resumenes_nota')
+    asignatura = models.ForeignKey(Asignatura, on_delete=models.CASCADE, related_name='resumenes_nota')
+    bimestre = models.IntegerField()
+    cantidad = models.IntegerField(default=0)
+    suma = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    promedio = models.DecimalField(max_digits=8, decimal_places=4, default=0)  # sin calificación cuenta como 0
+    letra = models.CharField(max_length=2)
+    notas = models.JSONField(default=list)  # calificaciones en orden de idnota (columna NOTAS)
+    primera_nota = models.IntegerField()   # menor idnota: conserva el orden de aparición
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['alumno', 'asignatura', 'bimestre']
+        indexes = [
+            models.Index(fields=["bimestre", "alumno"], name="resumen_nota_bim_alumno_idx"),
+        ]
+        verbose_name = "Resumen de Notas por Bimestre"
+        verbose_name_plural = "Resúmenes de Notas por Bimestre"
+
+    def __str__(self):
+        return f"Resumen {self.alumno_id} asig {self.asignatura_id} B{self.bimestre}: {self.promedio}"
 
 
 class Boleta(models.Model):
@@ -73,3 +140,133 @@ class Boleta(models.Model):
 
     def __str__(self):
         return f"Boleta {self.IdBoleta} - Alumno {self.IdAlumno}"
+
+
+class LibretaLote(models.Model):
+    """
+    Job de generación masiva de libretas (varios grados en un solo ZIP).
+    Se procesa en el pool de workers de services.lote_service; si el
+    proceso web se reinicia, lote_service.reanudar_pendientes lo retoma.
+    """
+    ESTADOS = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En proceso'),
+        ('COMPLETADO', 'Completado'),
+        ('ERROR', 'Error'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    bimestre = models.IntegerField()
+    grados = models.JSONField(default=list)
+    seccion = models.CharField(max_length=5, default="A")
+    anio = models.IntegerField(null=True, blank=True)  # año escolar de los grados; vacío = todos
+    nivel = models.CharField(max_length=20, blank=True)  # vacío = heurística por grado
+    modo = models.CharField(max_length=20, blank=True)   # vacío = settings.LIBRETAS_PDF_MODO
+    motor = models.CharField(max_length=20, blank=True)  # vacío = settings.LIBRETAS_PDF_MOTOR
+    base_url = models.CharField(max_length=300, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE')
+    total = models.IntegerField(default=0)
+    procesados = models.IntegerField(default=0)
+    intentos = models.IntegerField(default=0)
+    archivo = models.CharField(max_length=500, blank=True)  # ruta del ZIP final
+    error = models.TextField(blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    iniciado_en = models.DateTimeField(null=True, blank=True)
+    latido = models.DateTimeField(null=True, blank=True)  # último avance del worker que lo procesa
+    finalizado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Lote de Libretas"
+        verbose_name_plural = "Lotes de Libretas"
+        ordering = ['-creado_en']
+        indexes = [
+            models.Index(fields=["estado", "latido"], name="lote_estado_latido_idx"),
+        ]
+
+    def __str__(self):
+        return f"Lote {self.id} B{self.bimestre} - {self.estado} ({self.procesados}/{self.total})"
+
+
+class UgelUpload(models.Model):
+    """
+    Token de un .xlsx UGEL subido. Vive en BD para que cualquier worker
+    (gunicorn) resuelva el token. Los archivos se guardan por SHA-256 del
+    contenido: dos uploads idénticos comparten el archivo en disco.
+    Ver services.ugel_uploads (registro, resolución y barrido).
+    """
+    token = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    ruta = models.CharField(max_length=500)
+    nombre_original = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    tamano = models.BigIntegerField(default=0)  # bytes
+    creado_en = models.DateTimeField(auto_now_add=True)
+    ultimo_uso = models.DateTimeField(auto_now_add=True)
+    expira_en = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Upload UGEL"
+        verbose_name_plural = "Uploads UGEL"
+
+    def __str__(self):
+        return f"Upload {self.token} {self.nombre_original} ({self.tamano} bytes)"
+
+
+class UgelUploadParcial(models.Model):
+    """
+    Upload UGEL por partes, en curso (reanudable). Los bytes van directo a
+    un .part en UPLOAD_TMP_DIR; 'recibidos' es el offset desde el que el
+    cliente debe seguir. Al finalizar se valida y pasa a UgelUpload.
+    Ver services.ugel_upload_parcial.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    nombre_original = models.CharField(max_length=255)
+    tamano = models.BigIntegerField()             # bytes declarados al iniciar
+    recibidos = models.BigIntegerField(default=0)  # bytes escritos en orden
+    creado_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+    expira_en = models.DateTimeField(db_index=True)  # se renueva con cada parte
+
+    class Meta:
+        verbose_name = "Upload UGEL parcial"
+        verbose_name_plural = "Uploads UGEL parciales"
+
+    def __str__(self):
+        return f"Upload parcial {self.id} {self.nombre_original} ({self.recibidos}/{self.tamano} bytes)"
+
+
+class UgelExportJob(models.Model):
+    """
+    Export UGEL asíncrono (consolidar + escribir el .xlsx fuera del request).
+    Guarda todo lo necesario para volver a correrlo: si el proceso web se
+    reinicia, services.ugel_export_jobs.reanudar_pendientes lo retoma.
+    """
+    ESTADOS = LibretaLote.ESTADOS
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    ruta = models.CharField(max_length=500)  # .xlsx de entrada
+    nombre_original = models.CharField(max_length=255)
+    grado = models.CharField(max_length=50, blank=True)
+    curso = models.CharField(max_length=100, blank=True)
+    modo = models.CharField(max_length=20, blank=True)  # vacío = settings.LIBRETAS_UGEL_EXPORT_MODO
+    todas = models.BooleanField(default=False)          # todas las hojas del workbook
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='PENDIENTE')
+    total = models.IntegerField(default=0)       # filas de alumnos (estimado hasta terminar)
+    procesados = models.IntegerField(default=0)  # filas consolidadas
+    intentos = models.IntegerField(default=0)
+    archivo = models.CharField(max_length=500, blank=True)  # ruta del .xlsx final
+    error = models.TextField(blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    iniciado_en = models.DateTimeField(null=True, blank=True)
+    latido = models.DateTimeField(null=True, blank=True)  # último avance del worker que lo procesa
+    finalizado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Export UGEL"
+        verbose_name_plural = "Exports UGEL"
+        ordering = ['-creado_en']
+        indexes = [
+            models.Index(fields=["estado", "latido"], name="ugel_job_estado_latido_idx"),
+        ]
+
+    def __str__(self):
+        return f"Export UGEL {self.id} {self.nombre_original} - {self.estado} ({self.procesados}/{self.total})"
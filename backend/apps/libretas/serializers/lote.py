@@ -0,0 +1,37 @@
+# backend/apps/libretas/serializers/lote.py
+from __future__ import annotations
+from rest_framework import serializers
+
+
+class LibretaLoteIn(serializers.Serializer):
+    bimestre = serializers.IntegerField(min_value=1, max_value=4)
+    grados = serializers.JSONField()  # lista de grados o "all"
+    seccion = serializers.CharField(required=False, default="A")
+    anio = serializers.IntegerField(required=False, allow_null=True, default=None)
+    nivel = serializers.ChoiceField(choices=["", "inicial", "primaria", "secundaria"], required=False, default="")
+    modo = serializers.ChoiceField(choices=["", "simple", "paralelo", "incremental"], required=False, default="")
+    motor = serializers.ChoiceField(choices=["", "weasyprint", "reportlab"], required=False, default="")
+
+    def validate_grados(self, value):
+        if value == "all":
+            return value
+        if not isinstance(value, list) or not value:
+            raise serializers.ValidationError('Debe ser una lista de grados o "all".')
+        return [str(g) for g in value]
+
+
+class LibretaLoteOut(serializers.Serializer):
+    id = serializers.UUIDField()
+    bimestre = serializers.IntegerField()
+    grados = serializers.JSONField()
+    anio = serializers.IntegerField(allow_null=True)
+    estado = serializers.CharField()
+    total = serializers.IntegerField()
+    procesados = serializers.IntegerField()
+    progreso = serializers.SerializerMethodField()
+    error = serializers.CharField()
+    creado_en = serializers.DateTimeField()
+    finalizado_en = serializers.DateTimeField(allow_null=True)
+
+    def get_progreso(self, obj) -> float:
+        return round(100.0 * obj.procesados / obj.total, 1) if obj.total else 0.0
@@ -0,0 +1,262 @@
+# backend/apps/libretas/services/benchmark_service.py
+"""
+Benchmark de generación de libretas a escala realista.
+
+Siembra un colegio sintético (N grados × M alumnos × K asignaturas × P notas
+por bimestre, con el mismo catálogo de áreas que populate_test_data.py) y
+mide de punta a punta:
+  - bimestral_pdf: GET /api/libretas/bimestral/pdf por grado (cache en
+    disco apagado: cada repetición es un render completo).
+  - render_bimestral_pdf: el DTO de vista previa renderizado con ReportLab.
+  - ugel_export: POST /api/libretas/ugel/export (consolidado + escritura)
+    de un .xlsx con todos los alumnos del colegio.
+
+Todo corre dentro de una transacción que se revierte al final: la BD queda
+como estaba. El resultado es un dict serializable a JSON (ver
+manage.py benchmark_libretas) para comparar entre versiones.
+"""
+from __future__ import annotations
+import platform
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import django
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.test import Client, override_settings
+from django.utils import timezone
+from openpyxl import Workbook
+
+from ..models import Alumno, Asignatura, AsignaturaTrabajada, Nota
+from .consolidacion_service import ConsolidacionService
+from .pdf_service import build_preview_dto, render_bimestral_pdf
+from .resumen_notas import reconstruir as reconstruir_resumen
+
+FORMATO = 1  # versión del JSON de resultados
+
+AREAS = [
+    ("MATEMÁTICA", "ARITMÉTICA"), ("MATEMÁTICA", "ÁLGEBRA"), ("MATEMÁTICA", "GEOMETRÍA"),
+    ("MATEMÁTICA", "RAZ. MATEMÁTICO"), ("COMUNICACIÓN INTEGRAL", "GRAMÁTICA"),
+    ("COMUNICACIÓN INTEGRAL", "ORTOGRAFÍA"), ("COMUNICACIÓN INTEGRAL", "COMP. LECTORA"),
+    ("COMUNICACIÓN INTEGRAL", "RAZ. VERBAL"), ("CIENCIA Y TECNOLOGÍA", "BIOLOGÍA"),
+    ("CIENCIA Y TECNOLOGÍA", "FÍSICA"), ("PERSONAL SOCIAL", "HISTORIA"), ("PERSONAL SOCIAL", "GEOGRAFÍA"),
+    ("EDUCACIÓN FÍSICA", "EDUCACIÓN FÍSICA"), ("EDUCACIÓN POR EL ARTE", "EDUCACIÓN ARTÍSTICA"),
+    ("EDUCACIÓN RELIGIOSA", "EDUCACIÓN RELIGIOSA"), ("INGLÉS", "INGLÉS"), ("COMPUTACIÓN", "COMPUTACIÓN"),
+    ("CONDUCTA", "CONDUCTA"),
+]
+
+
+class _Revertir(Exception):
+    pass
+
+
+def _siguiente_id(modelo, campo: str) -> int:
+    return (modelo.objects.aggregate(m=Max(campo))["m"] or 0) + 1
+
+
+def sembrar_colegio(grados: int, alumnos: int, asignaturas: int, notas: int, bimestre: int = 1,
+                    semilla: int = 0) -> List[str]:
+    """
+    Crea el colegio sintético con bulk_create (sin signals; el resumen de
+    notas se reconstruye al final) y devuelve los
+    ids de grado creados. Los ids arrancan después de los existentes para
+    no chocar con datos reales.
+    """
+    rnd = random.Random(semilla)
+    id_asig = _siguiente_id(Asignatura, "idasignatura")
+    id_at = _siguiente_id(AsignaturaTrabajada, "idasignatura_trabajada")
+    id_alumno = _siguiente_id(Alumno, "idalumno")
+    id_nota = _siguiente_id(Nota, "idnota")
+    id_grado = max(_siguiente_id(Alumno, "idgrado_trabajado"), _siguiente_id(AsignaturaTrabajada, "idgrado_trabajado"))
+
+    catalogo = [
+        Asignatura(idasignatura=id_asig + i, area=AREAS[i % len(AREAS)][0],
+                   nombre=f"{AREAS[i % len(AREAS)][1]} {i // len(AREAS) + 1}"[:50], cant_horas=2)
+        for i in range(asignaturas)
+    ]
+    Asignatura.objects.bulk_create(catalogo)
+
+    ids_grado = []
+    for g in range(grados):
+        grado = id_grado + g
+        ids_grado.append(str(grado))
+        trabajadas = [
+            AsignaturaTrabajada(idasignatura_trabajada=id_at + i, idgrado_trabajado=grado, idprofesor=1,
+                                idasignatura=asig)
+            for i, asig in enumerate(catalogo)
+        ]
+        id_at += len(trabajadas)
+        AsignaturaTrabajada.objects.bulk_create(trabajadas)
+
+        lista = [
+            Alumno(idalumno=id_alumno + a, nombres=f"Alumno {a + 1}", apellidos=f"BENCH G{grado}",
+                   dni=f"B{id_alumno + a}", idgrado_trabajado=grado)
+            for a in range(alumnos)
+        ]
+        id_alumno += len(lista)
+        Alumno.objects.bulk_create(lista)
+
+        filas = []
+        for alumno in lista:
+            for at in trabajadas:
+                for n in range(notas):
+                    filas.append(Nota(idnota=id_nota, calificacion=round(rnd.uniform(8, 20), 2),
+                                      nombre=f"Nota {n + 1}", bimestre=bimestre,
+                                      idasignatura_trabajada=at, idalumno=alumno))
+                    id_nota += 1
+        Nota.objects.bulk_create(filas, batch_size=2000)
+    # bulk_create no dispara los signals que mantienen el resumen de notas.
+    reconstruir_resumen(bimestre)
+    return ids_grado
+
+
+def xlsx_ugel(alumnos: List[Alumno], semilla: int = 0) -> bytes:
+    """
+    Hoja UGEL con la convención de excel_adapter (A: id, B: alumno, C-F: B1..B4, G: curso).
+    """
+    rnd = random.Random(semilla)
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["alumnoId", "alumno", "B1", "B2", "B3", "B4", "curso", "promedio", "letra", "comentario"])
+    for a in alumnos:
+        ws.append([a.idalumno, str(a)] + [round(rnd.uniform(8, 20), 2) for _ in range(4)] + ["BENCH"])
+    stream = BytesIO()
+    wb.save(stream)
+    return stream.getvalue()
+
+
+def cronometrar(fn: Callable[[], Any], repeticiones: int) -> Dict[str, Any]:
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = fn()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "repeticiones": repeticiones,
+        "min_ms": round(min(tiempos), 2),
+        "mediana_ms": round(statistics.median(tiempos), 2),
+        "max_ms": round(max(tiempos), 2),
+        "ultimo": resultado,
+    }
+
+
+def _server_timing(header: str) -> Dict[str, float]:
+    etapas = {}
+    for parte in filter(None, (p.strip() for p in (header or "").split(","))):
+        nombre, *params = parte.split(";")
+        for p in params:
+            if p.startswith("dur="):
+                etapas[nombre] = float(p[4:])
+    return etapas
+
+
+def ejecutar_benchmark(grados: int = 3, alumnos: int = 30, asignaturas: int = 12, notas: int = 4,
+                       repeticiones: int = 3, bimestre: int = 1, motor: str = "", modo: str = "",
+                       semilla: int = 0) -> Dict[str, Any]:
+    parametros = {
+        "grados": grados, "alumnos": alumnos, "asignaturas": asignaturas, "notas": notas,
+        "repeticiones": repeticiones, "bimestre": bimestre, "motor": motor, "modo": modo, "semilla": semilla,
+    }
+    resultados: Dict[str, Any] = {}
+    try:
+        with transaction.atomic():
+            ids_grado = sembrar_colegio(grados, alumnos, asignaturas, notas, bimestre, semilla)
+            with tempfile.TemporaryDirectory() as tmp, \
+                    override_settings(ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ["testserver"]):
+                resultados = _medir_escenarios(ids_grado, repeticiones, bimestre, motor, modo, semilla, tmp)
+            raise _Revertir
+    except _Revertir:
+        pass
+
+    return {
+        "formato": FORMATO,
+        "fecha": timezone.now().isoformat(),
+        "entorno": {"python": platform.python_version(), "django": django.get_version(),
+                    "plataforma": platform.platform()},
+        "parametros": parametros,
+        "resultados": resultados,
+    }
+
+
+def _medir_escenarios(ids_grado: List[str], repeticiones: int, bimestre: int, motor: str, modo: str,
+                      semilla: int, tmp: str) -> Dict[str, Any]:
+    client = Client()
+    resultados: Dict[str, Any] = {}
+    cache_dir = [0]
+
+    # --- bimestral_pdf (cada repetición con un directorio de cache vacío) ---
+    def pedir_pdfs():
+        cache_dir[0] += 1
+        total, etapas = 0, {}
+        with override_settings(LIBRETAS_PDF_CACHE_DIR=f"{tmp}/cache{cache_dir[0]}"):
+            for grado in ids_grado:
+                params = {"grado": grado, "bimestre": bimestre, "curso": "BENCH"}
+                if motor:
+                    params["motor"] = motor
+                if modo:
+                    params["modo"] = modo
+                resp = client.get("/api/libretas/bimestral/pdf", params)
+                if resp.status_code != 200:
+                    raise RuntimeError(f"bimestral_pdf grado {grado}: HTTP {resp.status_code}")
+                total += len(resp.content)
+                for nombre, ms in _server_timing(resp.get("Server-Timing", "")).items():
+                    etapas[nombre] = round(etapas.get(nombre, 0.0) + ms, 2)
+        return {"bytes": total, "etapas_ms": etapas}
+
+    r = cronometrar(pedir_pdfs, repeticiones)
+    resultados["bimestral_pdf"] = {**{k: v for k, v in r.items() if k != "ultimo"}, **r["ultimo"]}
+
+    # --- render_bimestral_pdf (ReportLab, DTO de vista previa por grado) ---
+    consolidados = {g: ConsolidacionService.consolidar_bimestre(g, "A", bimestre, incluir_notas=False)
+                    for g in ids_grado}
+
+    def render_reportlab():
+        total = 0
+        for grado, filas in consolidados.items():
+            dto = build_preview_dto(
+                {"nivel": "primaria", "grado": grado, "seccion": "A", "curso": "BENCH", "bimestre": bimestre},
+                [{"alumnoId": c["alumno_id"], "alumno": c["alumno_nombre"], "nota_num": c["promedio_general"]}
+                 for c in filas],
+            )
+            total += len(render_bimestral_pdf(dto))
+        return {"bytes": total}
+
+    r = cronometrar(render_reportlab, repeticiones)
+    resultados["render_bimestral_pdf"] = {**{k: v for k, v in r.items() if k != "ultimo"}, **r["ultimo"]}
+
+    # --- UGEL: export de todo el colegio ---
+    alumnos = list(Alumno.objects.filter(idgrado_trabajado__in=[int(g) for g in ids_grado]).order_by("idalumno"))
+    xlsx = xlsx_ugel(alumnos, semilla)
+
+    # uploadId como ruta (modo compat de ugel/export): no deja tokens ni archivos en UPLOAD_TMP_DIR.
+    ruta = Path(tmp) / f"{uuid.uuid4()}_ugel_bench.xlsx"
+    ruta.write_bytes(xlsx)
+
+    def exportar_ugel():
+        resp = client.post("/api/libretas/ugel/export", {"uploadId": str(ruta)})
+        if resp.status_code != 200:
+            raise RuntimeError(f"ugel_export: HTTP {resp.status_code}")
+        return {"bytes": len(resp.content), "filas": len(alumnos)}
+
+    r = cronometrar(exportar_ugel, repeticiones)
+    resultados["ugel_export"] = {**{k: v for k, v in r.items() if k != "ultimo"}, **r["ultimo"]}
+    return resultados
+
+
+def comparar(actual: Dict[str, Any], base: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    """
+    Variación porcentual de la mediana por escenario (positivo = más lento).
+    """
+    delta = {}
+    for nombre, r in actual.get("resultados", {}).items():
+        antes = base.get("resultados", {}).get(nombre, {}).get("mediana_ms")
+        delta[nombre] = round((r["mediana_ms"] - antes) / antes * 100, 1) if antes else None
+    return delta
@@ -14,6 +14,12 @@ def _to_dec(v: float | int | Decimal) -> Decimal:
 def _round2(value: Decimal | float | int) -> Decimal:
     return _to_dec(value).quantize(_Q, rounding=ROUND_HALF_UP)
 
+def redondear_2(value: float | int | Decimal) -> float:
+    """
+    Redondeo HALF_UP a 2 decimales (15.125 → 15.13).
+    """
+    return float(_round2(value))
+
 def promedio_bimestral(prom_mensual: float, examen: float) -> float:
     """
     Regla 50–50 con redondeo a 2 decimales.
@@ -1,82 +1,106 @@
-from django.db.models import Avg
-from ..models import Nota, Alumno
+from decimal import Decimal
+
+from django.conf import settings
+
+from ..models import GradoTrabajado, ResumenNotaBimestre
+from . import resumen_notas
+from .calc_service import nota_a_letra, redondear_2
 
 
 class ConsolidacionService:
     @staticmethod
     def get_letter_grade(average: float) -> str:
-        """Convierte el promedio numérico a letra según la escala."""
+        """
+        Convierte el promedio numérico a letra según la escala, con el mismo
+        redondeo HALF_UP a 2 decimales que calc_service.nota_a_letra.
+        """
         try:
-            avg = float(average)
+            return nota_a_letra(average)
         except Exception:
             return "C"
-        if avg >= 18:
-            return "AD"
-        if avg >= 14:
-            return "A"
-        if avg >= 11:
-            return "B"
-        return "C"
 
     @staticmethod
-    def consolidar_bimestre(grado_id, seccion_id, bimestre):
+    def grados_trabajados(grado_id, seccion_id, anio=None):
+        """
+        ids de GradoTrabajado del grado/sección pedidos. Sin sección (o "*")
+        incluye todas las secciones del grado. Si el grado no tiene filas en
+        GradoTrabajado (datos antiguos), 'grado_id' ya es el idgrado_trabajado.
+        Con 'anio' se excluyen los grados trabajados de otros años (los que
+        no tienen año registrado se incluyen).
+        Retorna None si 'grado_id' no es numérico (sin filtro).
+        """
+        try:
+            g = int(grado_id)
+        except (TypeError, ValueError):
+            return None
+        filas = list(GradoTrabajado.objects.filter(grado=g).values_list("idgrado_trabajado", "seccion", "anio"))
+        if not filas:
+            return [g]
+        if anio not in (None, ""):
+            filas = [f for f in filas if f[2] is None or f[2] == int(anio)]
+        filas = [(gt, s) for gt, s, _ in filas]
+        seccion = str(seccion_id or "").strip().upper()
+        if seccion in ("", "*"):
+            return [gt for gt, _ in filas]
+        return [gt for gt, s in filas if s.upper() == seccion]
+
+    @staticmethod
+    def resumen_qs(grado_id, seccion_id, bimestre, anio=None):
+        """
+        Filas de ResumenNotaBimestre del bimestre para el grado/sección (y
+        año, ver grados_trabajados).
+        Con LIBRETAS_RESUMEN_VERIFICAR (default) primero verifica que el
+        resumen cuadre con la tabla nota y lo reconstruye si no
+        (ver resumen_notas.verificar).
+        """
+        qs = ResumenNotaBimestre.objects.filter(bimestre=bimestre)
+        ids = ConsolidacionService.grados_trabajados(grado_id, seccion_id, anio)
+        if getattr(settings, "LIBRETAS_RESUMEN_VERIFICAR", True):
+            resumen_notas.verificar(bimestre, ids)
+        if ids is not None:
+            qs = qs.filter(alumno__idgrado_trabajado__in=ids)
+        return qs
+
+    @staticmethod
+    def consolidar_bimestre(grado_id, seccion_id, bimestre, incluir_notas=True, anio=None):
         """
         Obtiene consolidaciones de notas para un grado, sección y bimestre.
 
         Parámetros:
         - grado_id: ID del grado (ej: 1, 2, 3, etc.)
-        - seccion_id: Identificador de sección (ej: "A", "B", "C") - uso informativo
+        - seccion_id: Identificador de sección (ej: "A", "B", "C"); "" o "*" = todas
         - bimestre: Número del bimestre (1, 2, 3, 4)
+        - incluir_notas: si es False no se lee la lista de notas individuales
+          (solo promedios), p.ej. para rankings o exportes.
+        - anio: año escolar (ver grados_trabajados); None = todos.
 
         Retorna:
         - Lista de dicts con estructura:
           {
+            "alumno_id": int,
             "alumno_nombre": str,
-            "asignaturas": [{"area": str, "nombre": str, "notas": list, "promedio": float, "letra": str}],
+            "asignaturas": [{"area": str, "nombre": str, "notas": list, "cantidad": int,
+                             "promedio": float, "letra": str}],
             "promedio_general": float,
             "letra_general": str,
             "recomendaciones": str
           }
         """
-        # Query base: notas del bimestre con joins para alumno y asignatura_trabajada
-        qs = Nota.objects.select_related("idalumno", "idasignatura_trabajada__idasignatura").filter(bimestre=bimestre)
-
-        # Filtrar por grado si es un entero
-        try:
-            g = int(grado_id)
-            qs = qs.filter(idalumno__idgrado_trabajado=g)
-        except Exception:
-            # no filtrar por grado si no es numérico
-            pass
+        # Lectura única e indexada del resumen materializado (ver services.resumen_notas);
+        # 'primera_nota' conserva el orden de aparición de alumnos y asignaturas.
+        campos = ["alumno_id", "alumno__apellidos", "alumno__nombres", "asignatura_id",
+                  "asignatura__area", "asignatura__nombre", "suma", "cantidad"]
+        if incluir_notas:
+            campos.append("notas")
+        filas = (ConsolidacionService.resumen_qs(grado_id, seccion_id, bimestre, anio)
+                 .order_by("primera_nota").values_list(*campos))
 
-        # Agrupar por alumno
         alumnos = {}
-        for n in qs:
-            alumno = n.idalumno
-            if alumno is None:
-                continue
-            aid = getattr(alumno, 'idalumno', None) or getattr(alumno, 'IdAlumno', None)
-            if aid not in alumnos:
-                alumnos[aid] = {"alumno": alumno, "asigs": {}}
-
-            # resolver asignatura real si existe
-            at = n.idasignatura_trabajada
-            asign_obj = getattr(at, "idasignatura", None) if at is not None else None
-            if asign_obj is not None:
-                asig_id = getattr(asign_obj, 'idasignatura', None)
-                area = getattr(asign_obj, "area", "")
-                nombre = getattr(asign_obj, "nombre", "")
-            else:
-                asig_id = None
-                area = ""
-                nombre = getattr(n, "nombre", "") or ""
-
-            entry = alumnos[aid]["asigs"].setdefault(asig_id, {"area": area, "nombre": nombre, "notas": []})
-            try:
-                val = float(n.calificacion) if n.calificacion is not None else 0.0
-            except Exception:
-                val = 0.0
-            entry["notas"].append(val)
+        for aid, apellidos, nombres, asig_id, area, nombre, suma, cantidad, *notas in filas:
+            data = alumnos.setdefault(aid, {"nombre": f"{apellidos}, {nombres}", "asigs": []})
+            # Promedio exacto (suma / cantidad); se redondea una sola vez, HALF_UP.
+            prom = Decimal(suma or 0) / cantidad if cantidad else Decimal(0)
+            data["asigs"].append((asig_id, area, nombre, prom, cantidad, notas[0] if notas else []))
 
         if not alumnos:
             return []
@@ -84,27 +108,25 @@ class ConsolidacionService:
         # Construimos un consolidado por cada alumno encontrado
         resultados = []
         for aid, data in alumnos.items():
-            alumno_obj = data["alumno"]
-
             asignaturas = []
             proms = []
-            for a_id, info in data["asigs"].items():
-                notas = info["notas"]
-                prom = sum(notas) / len(notas) if notas else 0.0
+            for asig_id, area, nombre, prom, cantidad, notas in data["asigs"]:
                 asignaturas.append({
-                    "area": info["area"],
-                    "nombre": info["nombre"],
+                    "area": area,
+                    "nombre": nombre,
                     "notas": notas,
-                    "promedio": round(prom, 2),
-                    "letra": ConsolidacionService.get_letter_grade(prom),
+                    "cantidad": cantidad,
+                    "promedio": redondear_2(prom),
+                    "letra": nota_a_letra(prom),
                 })
                 proms.append(prom)
 
-            prom_general = round(sum(proms) / len(proms), 2) if proms else 0.0
-            letra_general = ConsolidacionService.get_letter_grade(prom_general)
+            prom_general = redondear_2(sum(proms) / len(proms)) if proms else 0.0
+            letra_general = nota_a_letra(prom_general)
 
             consolidado = {
-                "alumno_nombre": f"{getattr(alumno_obj, 'apellidos', '')}, {getattr(alumno_obj, 'nombres', '')}",
+                "alumno_id": aid,
+                "alumno_nombre": data["nombre"],
                 "asignaturas": asignaturas,
                 "promedio_general": prom_general,
                 "letra_general": letra_general,
@@ -112,4 +134,4 @@ class ConsolidacionService:
             }
             resultados.append(consolidado)
 
-        return resultados
\ No newline at end of file
+        return resultados
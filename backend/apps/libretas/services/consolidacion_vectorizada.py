@@ -0,0 +1,203 @@
+# backend/apps/libretas/services/consolidacion_vectorizada.py
+"""
+Consolidación vectorizada (NumPy) de todo el colegio en una pasada.
+
+Las filas de ResumenNotaBimestre (alumno, asignatura, bimestre, cantidad,
+suma) se cargan como columnas y se calculan, sin bucles por fila:
+  - promedio por alumno × asignatura × bimestre (suma / cantidad);
+  - promedio general por alumno × bimestre (media de sus asignaturas);
+  - letra (misma escala que calc_service.nota_a_letra, con redondeo
+    HALF_UP a 2 decimales).
+
+Alimenta los lotes de libretas (un solo cálculo para todos los grados) y
+los promedios del consolidado UGEL. Si NumPy no está instalado, los
+llamadores siguen usando ConsolidacionService / calc_service.
+
+Lee el mismo resumen materializado que ConsolidacionService, así que antes
+de cargarlo pasa por resumen_notas.verificar (LIBRETAS_RESUMEN_VERIFICAR).
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    _HAS_NUMPY = True
+except Exception:  # pragma: no cover - depende del entorno
+    np = None
+    _HAS_NUMPY = False
+
+from django.conf import settings
+
+from ..models import Alumno, Asignatura, GradoTrabajado, ResumenNotaBimestre
+from . import resumen_notas
+
+# Cortes de calc_service.nota_a_letra: <11 C, <14 B, <18 A, resto AD.
+_CORTES = (11.0, 14.0, 18.0)
+_LETRAS = ("C", "B", "A", "AD")
+
+
+def redondear_2(valores):
+    """
+    HALF_UP a 2 decimales sobre un array (round() de NumPy es HALF_EVEN).
+    El 1e-9 absorbe el error binario de valores como 12.345.
+    """
+    v = np.asarray(valores, dtype=np.float64)
+    return np.sign(v) * np.floor(np.abs(v) * 100 + 0.5 + 1e-9) / 100
+
+
+def letras(promedios):
+    """
+    Versión vectorizada de calc_service.nota_a_letra.
+    """
+    return np.asarray(_LETRAS, dtype=object)[np.searchsorted(_CORTES, redondear_2(promedios), side="right")]
+
+
+def promedio_filas(matriz):
+    """
+    Promedio por fila ignorando vacíos (None/NaN) y redondeado a 2
+    decimales; 0.0 si la fila no tiene valores (como promedio_parciales).
+    """
+    m = np.array(matriz, dtype=np.float64)  # None -> nan
+    if m.ndim != 2 or m.shape[0] == 0:
+        return np.zeros(m.shape[0] if m.ndim else 0)
+    validos = ~np.isnan(m)
+    cantidad = validos.sum(axis=1)
+    suma = np.where(validos, m, 0.0).sum(axis=1)
+    return redondear_2(np.divide(suma, cantidad, out=np.zeros_like(suma), where=cantidad > 0))
+
+
+@dataclass
+class ColumnasResumen:
+    # Una fila por alumno × asignatura × bimestre (ResumenNotaBimestre)
+    alumno: Any
+    asignatura: Any
+    bimestre: Any
+    cantidad: Any
+    suma: Any          # sin calificación cuenta como 0, igual que consolidar_bimestre
+    primera: Any       # menor idnota del grupo (orden de aparición)
+    notas: List[Any]   # calificaciones del grupo en orden de idnota
+    alumnos: Dict[int, Tuple[str, str, Optional[int]]] = field(default_factory=dict)  # id -> (apellidos, nombres, grado)
+    asignaturas: Dict[int, Tuple[str, str]] = field(default_factory=dict)            # id -> (area, nombre)
+
+
+def cargar_columnas(bimestres: Optional[Iterable[int]] = None,
+                    grados_trabajados: Optional[Iterable[int]] = None,
+                    anio: Optional[int] = None) -> ColumnasResumen:
+    """
+    Lee el resumen materializado (opcionalmente filtrado) como tuplas y lo
+    pasa a arrays. Con 'anio' se excluyen los alumnos de grados trabajados
+    de otros años, como ConsolidacionService.grados_trabajados (los que no
+    tienen año registrado se incluyen).
+    """
+    bimestres = list(bimestres) if bimestres is not None else None
+    grados_trabajados = list(grados_trabajados) if grados_trabajados is not None else None
+    if getattr(settings, "LIBRETAS_RESUMEN_VERIFICAR", True):
+        for b in bimestres if bimestres is not None else [None]:
+            resumen_notas.verificar(b, grados_trabajados)
+
+    qs = ResumenNotaBimestre.objects.all()
+    if bimestres is not None:
+        qs = qs.filter(bimestre__in=bimestres)
+    if grados_trabajados is not None:
+        qs = qs.filter(alumno__idgrado_trabajado__in=grados_trabajados)
+    if anio not in (None, ""):
+        otros = (GradoTrabajado.objects.exclude(anio__isnull=True).exclude(anio=int(anio))
+                 .values("idgrado_trabajado"))
+        qs = qs.exclude(alumno__idgrado_trabajado__in=otros)
+    filas = list(qs.order_by("primera_nota").values_list("alumno_id", "asignatura_id", "bimestre", "cantidad",
+                                                         "suma", "primera_nota", "notas"))
+    n = len(filas)
+    alumno = np.fromiter((f[0] for f in filas), dtype=np.int64, count=n)
+    asignatura = np.fromiter((f[1] for f in filas), dtype=np.int64, count=n)
+    bimestre = np.fromiter((f[2] for f in filas), dtype=np.int64, count=n)
+    cantidad = np.fromiter((f[3] for f in filas), dtype=np.int64, count=n)
+    suma = np.fromiter((float(f[4] or 0) for f in filas), dtype=np.float64, count=n)
+    primera = np.fromiter((f[5] for f in filas), dtype=np.int64, count=n)
+    notas = [np.asarray(f[6] or [], dtype=np.float64) for f in filas]
+
+    ids_alumno = np.unique(alumno).tolist()
+    alumnos = {a: (ap, no, g) for a, ap, no, g in Alumno.objects.filter(idalumno__in=ids_alumno)
+               .values_list("idalumno", "apellidos", "nombres", "idgrado_trabajado")}
+    asignaturas = {a: (ar, no) for a, ar, no in Asignatura.objects.filter(idasignatura__in=np.unique(asignatura).tolist())
+                   .values_list("idasignatura", "area", "nombre")}
+    return ColumnasResumen(alumno, asignatura, bimestre, cantidad, suma, primera, notas, alumnos, asignaturas)
+
+
+@dataclass
+class ConsolidacionEscuela:
+    columnas: ColumnasResumen
+    # Por alumno × asignatura × bimestre (filas de 'claves': alumno, asignatura, bimestre)
+    claves: Any
+    cantidad: Any
+    promedio: Any
+    letra: Any
+    primera: Any       # menor idnota del grupo (orden de aparición)
+    notas: List[Any]   # calificaciones del grupo en orden de idnota
+    # Por alumno × bimestre (filas de 'generales': alumno, bimestre)
+    generales: Any
+    grado: Any
+    promedio_general: Any
+    letra_general: Any
+
+    def consolidados_libreta(self, grados_trabajados: Sequence[int], bimestre: int) -> List[Dict[str, Any]]:
+        """
+        Misma estructura que ConsolidacionService.consolidar_bimestre: el
+        contexto de la libreta (y su clave de cache) es el mismo que en
+        bimestral_pdf.
+        """
+        sel_gen = np.flatnonzero(np.isin(self.grado, list(grados_trabajados)) & (self.generales[:, 1] == bimestre))
+        if sel_gen.size == 0:
+            return []
+        sel = np.flatnonzero(np.isin(self.claves[:, 0], self.generales[sel_gen, 0]) & (self.claves[:, 2] == bimestre))
+        sel = sel[np.argsort(self.primera[sel], kind="stable")]
+
+        fila_general = {int(self.generales[i, 0]): i for i in sel_gen}
+        resultados: Dict[int, Dict[str, Any]] = {}
+        for i in sel:
+            aid = int(self.claves[i, 0])
+            c = resultados.get(aid)
+            if c is None:
+                g = fila_general[aid]
+                apellidos, nombres, _ = self.columnas.alumnos.get(aid, ("", "", None))
+                c = resultados[aid] = {
+                    "alumno_id": aid,
+                    "alumno_nombre": f"{apellidos}, {nombres}",
+                    "asignaturas": [],
+                    "promedio_general": float(self.promedio_general[g]),
+                    "letra_general": str(self.letra_general[g]),
+                    "recomendaciones": "",
+                }
+            area, nombre = self.columnas.asignaturas.get(int(self.claves[i, 1]), ("", ""))
+            c["asignaturas"].append({
+                "area": area,
+                "nombre": nombre,
+                "notas": self.notas[i].tolist(),
+                "cantidad": int(self.cantidad[i]),
+                "promedio": float(redondear_2(self.promedio[i])),
+                "letra": str(self.letra[i]),
+            })
+        return list(resultados.values())
+
+
+def consolidar_escuela(col: ColumnasResumen) -> ConsolidacionEscuela:
+    claves = np.stack([col.alumno, col.asignatura, col.bimestre], axis=1) if len(col.alumno) \
+        else np.zeros((0, 3), dtype=np.int64)
+    n = len(claves)
+    cantidad = col.cantidad
+    promedio = np.divide(col.suma, cantidad, out=np.zeros(n), where=cantidad > 0)
+
+    generales, inv_gen = np.unique(claves[:, [0, 2]], axis=0, return_inverse=True)
+    inv_gen = inv_gen.reshape(-1)
+    m = len(generales)
+    n_asig = np.bincount(inv_gen, minlength=m)
+    promedio_general = redondear_2(np.divide(np.bincount(inv_gen, weights=promedio, minlength=m), n_asig,
+                                             out=np.zeros(m), where=n_asig > 0))
+    grado = np.fromiter(((col.alumnos.get(int(a), ("", "", None))[2] or 0) for a in generales[:, 0]),
+                        dtype=np.int64, count=m)
+
+    return ConsolidacionEscuela(
+        columnas=col, claves=claves, cantidad=cantidad, promedio=promedio, letra=letras(promedio),
+        primera=col.primera, notas=col.notas, generales=generales, grado=grado, promedio_general=promedio_general,
+        letra_general=letras(promedio_general),
+    )
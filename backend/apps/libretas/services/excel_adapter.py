@@ -1,8 +1,9 @@
 # backend/apps/libretas/services/excel_adapter.py
 from __future__ import annotations
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Dict, Any
+from typing import Callable, Iterable, Iterator, Dict, Any, List, Optional, Tuple
 from openpyxl import load_workbook
 from openpyxl.workbook.workbook import Workbook
 
@@ -12,22 +13,51 @@ class ExcelBaseInfo:
     filename: str
     sheetnames: tuple[str, ...]
 
+# Columnas que lee iter_alumnos_hoja (A..G).
+_COLUMNAS_LECTURA = 7
+
+@contextmanager
+def abrir_lectura(path) -> Iterator[Workbook]:
+    """
+    Abre el workbook en modo streaming (read_only + data_only): las filas se
+    leen del XML a medida que se iteran, sin armar el modelo de celdas de
+    toda la hoja. El archivo queda abierto hasta salir del bloque.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield wb
+    finally:
+        wb.close()
+
 def leer_base(path: str) -> ExcelBaseInfo:
     """
-    Carga el workbook y devuelve datos base.
+    Devuelve datos base del workbook (solo lee la lista de hojas).
     """
     p = Path(path)
-    wb = load_workbook(p, data_only=True)
-    return ExcelBaseInfo(path=p, filename=p.name, sheetnames=tuple(wb.sheetnames))
+    with abrir_lectura(p) as wb:
+        return ExcelBaseInfo(path=p, filename=p.name, sheetnames=tuple(wb.sheetnames))
+
+def contar_filas(path) -> Dict[str, int]:
+    """
+    Filas de datos por hoja según la dimensión declarada en el XML (no lee
+    las celdas): sirve como total estimado para mostrar avance.
+    """
+    with abrir_lectura(path) as wb:
+        return {nombre: max((wb[nombre].max_row or 1) - 1, 0) for nombre in wb.sheetnames}
 
 def iter_alumnos_hoja(wb: Workbook, sheet_name: str) -> Iterable[Dict[str, Any]]:
     """
     Convención dummy para pruebas/UGEL:
       A: alumnoId, B: alumno, C-F: B1..B4, G: curso (opcional)
       Encabezados en fila 1, datos desde fila 2.
+    Funciona con workbooks en modo normal o read_only (abrir_lectura).
     """
     ws = wb[sheet_name]
-    for r in ws.iter_rows(min_row=2, values_only=True):
+    for r in ws.iter_rows(min_row=2, max_col=_COLUMNAS_LECTURA, values_only=True):
+        # En read_only las filas pueden venir más cortas si la dimensión
+        # declarada en el XML no cubre todas las columnas.
+        if len(r) < _COLUMNAS_LECTURA:
+            r = tuple(r) + (None,) * (_COLUMNAS_LECTURA - len(r))
         if r[0] is None:
             continue
         yield {
@@ -37,29 +67,71 @@ def iter_alumnos_hoja(wb: Workbook, sheet_name: str) -> Iterable[Dict[str, Any]]
             "B2": r[3],
             "B3": r[4],
             "B4": r[5],
-            "curso": r[6] if len(r) > 6 else None,
+            "curso": r[6],
         }
 
-def escribir_rangos_consolidado(wb: Workbook, sheet_name: str, rows: Iterable[Dict[str, Any]]) -> None:
+def normalizar_curso(curso: Any) -> str:
+    return str(curso).strip().lower() if curso is not None else ""
+
+def indice_alumno_curso(rows: Iterable[Dict[str, Any]],
+                        valor: Callable[[Dict[str, Any]], Any] = lambda item: item) -> Dict[Tuple[Any, Any], Any]:
+    """
+    Indexa items del consolidado para emparejarlos con filas de la hoja
+    (ver buscar_alumno_curso). Un alumno puede tener una fila por curso:
+    la clave es (alumnoId, curso normalizado); (alumnoId, None) guarda el
+    último item del alumno. Se omiten los items sin alumnoId o cuyo
+    'valor' es vacío.
+    """
+    indice: Dict[Tuple[Any, Any], Any] = {}
+    for item in rows:
+        alumno_id = item.get("alumnoId")
+        v = valor(item)
+        if alumno_id is None or not v:
+            continue
+        indice[(alumno_id, normalizar_curso(item.get("curso")))] = v
+        indice[(alumno_id, None)] = v
+    return indice
+
+def buscar_alumno_curso(indice: Dict[Tuple[Any, Any], Any], alumno_id: Any, curso: Any) -> Optional[Any]:
+    """
+    Item para la fila (alumnoId, curso de la columna G): el de ese mismo
+    curso o, si no hay, uno sin curso. Una fila sin curso (hoja de un solo
+    curso) toma el item del alumno, traiga o no curso.
+    """
+    c = normalizar_curso(curso)
+    encontrado = indice.get((alumno_id, c))
+    if encontrado is None:
+        encontrado = indice.get((alumno_id, "")) if c else indice.get((alumno_id, None))
+    return encontrado
+
+def escribir_rangos_consolidado(wb: Workbook, sheet_name: str, rows: Iterable[Dict[str, Any]]) -> List[Tuple[int, int, Any]]:
     """
     Escribe solo promedio/letra/comentario sin romper formato:
       H: promedio (num), I: letra (texto), J: comentario (texto)
-      Empareja por alumnoId (col A).
+      Empareja por alumnoId (col A) y curso (col G), ver buscar_alumno_curso.
+    Retorna [(fila, columna, valor_anterior)] de cada celda escrita, para
+    poder restaurar el workbook si se reutiliza (ver ugel_sesion).
     """
     ws = wb[sheet_name]
-    idx_por_id: Dict[Any, int] = {}
-    for row in range(2, ws.max_row + 1):
-        alumno_id = ws.cell(row=row, column=1).value
-        if alumno_id is not None:
-            idx_por_id[alumno_id] = row
+    indice = indice_alumno_curso(rows)
+    previos: List[Tuple[int, int, Any]] = []
 
-    for item in rows:
-        rid = idx_por_id.get(item.get("alumnoId"))
-        if not rid:
+    def escribir(fila: int, columna: int, valor: Any) -> None:
+        celda = ws.cell(row=fila, column=columna)
+        previos.append((fila, columna, celda.value))
+        celda.value = valor
+
+    for rid in range(2, ws.max_row + 1):
+        alumno_id = ws.cell(row=rid, column=1).value
+        if alumno_id is None:
+            continue
+        item = buscar_alumno_curso(indice, alumno_id, ws.cell(row=rid, column=7).value)
+        if item is None:
             continue
         if "promedio" in item:
-            ws.cell(row=rid, column=8, value=float(item["promedio"]))  # H
+            escribir(rid, 8, float(item["promedio"]))   # H
         if "letra" in item:
-            ws.cell(row=rid, column=9, value=str(item["letra"]))       # I
+            escribir(rid, 9, str(item["letra"]))        # I
         if "comentario" in item:
-            ws.cell(row=rid, column=10, value=str(item["comentario"])) # J
+            escribir(rid, 10, str(item["comentario"]))  # J
+    return previos
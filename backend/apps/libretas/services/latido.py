@@ -0,0 +1,40 @@
+# backend/apps/libretas/services/latido.py
+"""
+Latido de los jobs en segundo plano (UgelExportJob, LibretaLote).
+
+El worker que procesa un job actualiza su columna 'latido' cada tercio de
+la ventana de vida; un job EN_PROCESO cuyo latido quedó más viejo que esa
+ventana perdió su worker (reinicio del proceso web) y se puede volver a
+tomar con un UPDATE condicional.
+"""
+from __future__ import annotations
+import threading
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+
+class Latido:
+    """Actualiza 'latido' del job en segundo plano mientras sigue EN_PROCESO."""
+
+    def __init__(self, modelo, pk, latido_seg: float, nombre: str = "latido"):
+        self.modelo = modelo
+        self.pk = pk
+        self.latido_seg = latido_seg
+        self._fin = threading.Event()
+        self._hilo = threading.Thread(target=self._correr, name=f"{nombre}-{pk}", daemon=True)
+
+    def _correr(self) -> None:
+        try:
+            while not self._fin.wait(max(self.latido_seg / 3, 1)):
+                self.modelo.objects.filter(pk=self.pk, estado="EN_PROCESO").update(latido=timezone.now())
+        finally:
+            close_old_connections()
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._fin.set()
+        self._hilo.join()
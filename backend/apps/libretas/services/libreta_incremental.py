@@ -0,0 +1,43 @@
+# backend/apps/libretas/services/libreta_incremental.py
+"""
+Render incremental de libretas por grado.
+
+Cada hoja de alumno se guarda en el cache de PDFs bajo su propia huella
+(hash de su contenido). Al regenerar el grado se calcula la huella de cada
+hoja y solo se vuelven a renderizar las que no están en el cache; el resto
+se reutiliza tal cual al unir el documento final. Como la huella sale del
+contenido, cualquier cambio (una nota, renombrar un alumno, bulk_create o
+QuerySet.update) invalida solo la hoja afectada, sin registro aparte.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+
+from . import libreta_render
+from .pdf_cache import clave_libreta, get_pdf_cache
+from .pdf_metricas import etapa
+
+
+def render_pdf_incremental(contexto: Dict[str, Any], base_url: str, motor: str = "weasyprint",
+                           request=None) -> bytes:
+    partes = libreta_render.dividir_por_alumno(contexto)
+    cache = get_pdf_cache()
+
+    pdfs: List[Optional[bytes]] = [None] * len(partes)
+    huellas = [clave_libreta(parte, motor) for parte in partes]
+    pendientes: List[int] = []
+    for i, huella in enumerate(huellas):
+        cacheado = cache.get(huella)
+        if cacheado is not None:
+            pdfs[i] = cacheado.read_bytes()
+        else:
+            pendientes.append(i)
+
+    renderizados = libreta_render.renderizar_partes([partes[i] for i in pendientes], base_url, motor,
+                                                    request=request)
+    with etapa("workers"):
+        for i, pdf in zip(pendientes, renderizados):
+            cache.put(huellas[i], pdf)
+            pdfs[i] = pdf
+
+    with etapa("union"):
+        return libreta_render.unir_pdfs(pdfs)
@@ -0,0 +1,195 @@
+# backend/apps/libretas/services/libreta_render.py
+"""
+Render de libretas bimestrales. El PDF lo produce un motor de pdf_engines
+(WeasyPrint o ReportLab); aquí se decide cómo se reparte el trabajo.
+
+Modos:
+  - "simple": una sola plantilla bimestral_multi.html para todo el grado.
+  - "paralelo": una hoja por alumno, renderizadas en un pool de procesos
+    y unidas en orden en un único PDF.
+  - "incremental": como "paralelo", pero solo re-renderiza los alumnos cuya
+    hoja cambió desde su último render (ver libreta_incremental).
+"""
+from __future__ import annotations
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils.text import slugify
+
+from .pdf_engines import MOTORES, TEMPLATE_MULTI, _HAS_WEASY, render_preparado  # noqa: F401
+from .pdf_metricas import etapa
+
+try:
+    from pypdf import PdfReader, PdfWriter
+    _HAS_PYPDF = True
+except Exception:
+    _HAS_PYPDF = False
+
+logger = logging.getLogger(__name__)
+
+MODOS = ("simple", "paralelo", "incremental")
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def resolver_nivel(grado: str, nivel_param: str) -> str:
+    """
+    Resuelve el nivel según:
+      1) override por ?nivel= (inicial|primaria|secundaria)
+      2) heurística por 'grado'
+    """
+    if nivel_param in {"inicial", "primaria", "secundaria"}:
+        return nivel_param
+
+    g = (grado or "").strip().lower()
+    # Inicial (puede venir como 3/4/5 años o texto explícito)
+    if any(x in g for x in ["inicial", "3", "4", "5"]) and "sec" not in g:
+        # si es "3", "4", "5" y NO es "sec", interpretamos inicial
+        return "inicial"
+    # Primaria (1..6)
+    if g in {"1", "2", "3", "4", "5", "6"}:
+        return "primaria"
+    # Secundaria (algunas variantes comunes)
+    if g in {"1s", "1sec", "1 secundaria", "2s", "3s", "4s", "5s"} or "secund" in g:
+        return "secundaria"
+    # Por defecto, primaria
+    return "primaria"
+
+
+def titulo_por_nivel(nivel: str) -> str:
+    if nivel == "inicial":
+        return "BOLETA DE NOTAS 2025 – EDUCACIÓN INICIAL"
+    if nivel == "secundaria":
+        return "BOLETA DE NOTAS 2025 – EDUCACIÓN SECUNDARIA"
+    return "BOLETA DE NOTAS 2025 – EDUCACIÓN PRIMARIA"
+
+
+def construir_contexto(grado: str, seccion: str, bimestre: int, nivel: str,
+                       consolidados: List[dict]) -> Dict[str, Any]:
+    """
+    Contexto común de bimestral_multi.html (cada consolidado -> una hoja).
+    """
+    return {
+        "grado": grado,
+        "seccion": seccion,
+        "bimestre": bimestre,
+        "titulo": titulo_por_nivel(nivel),
+        "consolidados": consolidados,
+        "tutora_nombre": "Miss Dina Torres",
+        "nivel": nivel,
+    }
+
+
+def dividir_por_alumno(contexto: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Un contexto por alumno, conservando el orden de 'consolidados'.
+    """
+    return [dict(contexto, consolidados=[c]) for c in contexto.get("consolidados") or []]
+
+
+def resolver_modo(modo_param: str = "") -> str:
+    """
+    Prioridad: ?modo= en el request, luego settings.LIBRETAS_PDF_MODO.
+    """
+    modo = (modo_param or "").strip().lower()
+    if modo in MODOS:
+        return modo
+    modo = str(getattr(settings, "LIBRETAS_PDF_MODO", "simple")).lower()
+    return modo if modo in MODOS else "simple"
+
+
+def unir_pdfs(partes: List[bytes]) -> bytes:
+    """
+    Concatena las páginas de cada PDF en el orden recibido. Cada parte trae
+    su propia copia del escudo (y firma/sello); los objetos idénticos se
+    fusionan para que el documento final los embeba una sola vez.
+    """
+    writer = PdfWriter()
+    for parte in partes:
+        writer.append(PdfReader(BytesIO(parte)))
+    # Dos pasadas: la primera fusiona las máscaras (SMask) de las imágenes y
+    # la segunda las imágenes que, ya con la misma máscara, quedan idénticas.
+    for _ in range(2):
+        writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    stream = BytesIO()
+    writer.write(stream)
+    return stream.getvalue()
+
+
+def _num_workers() -> int:
+    return int(getattr(settings, "LIBRETAS_PDF_WORKERS", 0) or os.cpu_count() or 1)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # El pool se crea una vez por proceso web y se reutiliza entre requests.
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=_num_workers())
+    return _POOL
+
+
+def renderizar_partes(partes: List[Dict[str, Any]], base_url: str, motor: str = "weasyprint",
+                      request=None) -> Iterator[bytes]:
+    """
+    Contexto -> PDF para varias hojas, en el pool de procesos si hay más de un
+    worker. Devuelve un iterador en el mismo orden de 'partes'.
+    """
+    m = MOTORES[motor]
+    preparados = [m.preparar(c, request=request) for c in partes]
+    if _num_workers() <= 1 or len(preparados) <= 1:
+        return (m.render(p, base_url) for p in preparados)
+    n = len(preparados)
+    return _get_pool().map(render_preparado, [motor] * n, preparados, [base_url] * n)
+
+
+def render_pdf_paralelo(contexto: Dict[str, Any], base_url: str, motor: str = "weasyprint",
+                        request=None) -> bytes:
+    """
+    Renderiza una hoja por alumno en paralelo y une las páginas en orden.
+    """
+    pdfs = renderizar_partes(dividir_por_alumno(contexto), base_url, motor, request=request)
+    # 'workers': espera del pool (el layout/write de cada hoja ocurre en otros procesos).
+    with etapa("workers"):
+        pdfs = list(pdfs)
+    with etapa("union"):
+        return unir_pdfs(pdfs)
+
+
+def nombre_pdf_alumno(indice: int, consolidado: Dict[str, Any]) -> str:
+    """
+    Nombre de archivo por alumno: '<nn>_<apellidos-nombres>.pdf' (ASCII, sin tildes).
+    """
+    return f"{indice:02d}_{slugify(consolidado.get('alumno_nombre') or '') or 'alumno'}.pdf"
+
+
+def iter_pdfs_por_alumno(contexto: Dict[str, Any], base_url: str, motor: str = "weasyprint",
+                         request=None) -> Iterator[Tuple[str, bytes]]:
+    """
+    Genera (nombre_archivo, pdf) por alumno, en orden y a medida que se
+    terminan, para poder transmitirlos sin esperar al grado completo.
+    """
+    partes = dividir_por_alumno(contexto)
+    pdfs = renderizar_partes(partes, base_url, motor, request=request)
+    for i, (parte, pdf) in enumerate(zip(partes, pdfs), start=1):
+        yield nombre_pdf_alumno(i, parte["consolidados"][0]), pdf
+
+
+def render_pdf(contexto: Dict[str, Any], base_url: str, modo: str = "simple", motor: str = "weasyprint",
+               request=None) -> bytes:
+    """
+    Punto de entrada del render. 'paralelo' e 'incremental' caen a 'simple'
+    si falta pypdf o si el grado tiene un solo alumno.
+    """
+    if modo in ("paralelo", "incremental") and len(contexto.get("consolidados") or []) > 1:
+        if _HAS_PYPDF:
+            if modo == "incremental":
+                from .libreta_incremental import render_pdf_incremental
+                return render_pdf_incremental(contexto, base_url, motor=motor, request=request)
+            return render_pdf_paralelo(contexto, base_url, motor=motor, request=request)
+        logger.warning("pypdf no está instalado; se usa render simple.")
+    m = MOTORES[motor]
+    return m.render(m.preparar(contexto, request=request), base_url)
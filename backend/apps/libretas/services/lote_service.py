@@ -0,0 +1,326 @@
+# backend/apps/libretas/services/lote_service.py
+"""
+Generación masiva de libretas: un job (LibretaLote) por bimestre y lista de
+grados, procesado en un pool de hilos en segundo plano. El resultado es un
+ZIP con un PDF por grado (o por grado y sección).
+
+Igual que los exports UGEL (ver ugel_export_jobs): el worker toma el lote
+con un UPDATE condicional y actualiza 'latido' mientras trabaja. Los lotes
+PENDIENTE sin encolar y los EN_PROCESO con latido vencido
+(LIBRETAS_LOTE_LATIDO_SEG) se vuelven a encolar con reanudar_pendientes(),
+que cada proceso web corre la primera vez que atiende un endpoint de lotes y
+también 'manage.py reanudar_lotes_libretas'. barrer_terminados() borra los
+lotes terminados hace más de LIBRETAS_LOTE_TTL con su ZIP; lo corre
+'manage.py limpiar_lotes_libretas'.
+"""
+from __future__ import annotations
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import Alumno, GradoTrabajado, LibretaLote
+from . import consolidacion_vectorizada, libreta_render
+from .consolidacion_service import ConsolidacionService
+from .latido import Latido
+from .pdf_cache import clave_libreta, get_pdf_cache
+from .pdf_engines import MOTORES, resolver_motor
+
+logger = logging.getLogger(__name__)
+
+# Un PENDIENTE más viejo que esto ya debería haber sido tomado por un worker.
+_GRACIA_PENDIENTE = timedelta(seconds=60)
+
+# Solo se borran archivos con estos nombres (los que escribe procesar_lote).
+_NOMBRE_ZIP = re.compile(r"^libretas_B\d+_[0-9a-f-]{36}\.zip$")
+_NOMBRE_TMP = re.compile(r"^tmp\w+\.tmp$")
+
+_EJECUTOR: Optional[ThreadPoolExecutor] = None
+_REANUDADO = False
+_LOCK = threading.Lock()
+
+
+def _get_ejecutor() -> ThreadPoolExecutor:
+    global _EJECUTOR
+    if _EJECUTOR is None:
+        workers = int(getattr(settings, "LIBRETAS_LOTE_WORKERS", 2) or 1)
+        _EJECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="libretas-lote")
+    return _EJECUTOR
+
+
+def get_lotes_dir() -> Path:
+    d = Path(getattr(settings, "LIBRETAS_LOTES_DIR", None) or Path(settings.MEDIA_ROOT) / "libretas_lotes")
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def _latido_seg() -> int:
+    return int(getattr(settings, "LIBRETAS_LOTE_LATIDO_SEG", 300))
+
+
+def _max_intentos() -> int:
+    return int(getattr(settings, "LIBRETAS_LOTE_INTENTOS", 3))
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, "LIBRETAS_LOTE_TTL", 24 * 3600)))
+
+
+def grados_disponibles(anio: Optional[int] = None) -> List[Dict[str, str]]:
+    """
+    Todas las aulas (grado, sección) de GradoTrabajado con alumnos
+    registrados (de 'anio' o sin año, si se indica). Sin filas en
+    GradoTrabajado (datos antiguos), los idgrado_trabajado de los alumnos,
+    sin sección.
+    """
+    con_alumnos = (Alumno.objects.exclude(idgrado_trabajado__isnull=True)
+                   .values_list("idgrado_trabajado", flat=True).distinct())
+    if GradoTrabajado.objects.exists():
+        aulas = GradoTrabajado.objects.filter(idgrado_trabajado__in=con_alumnos)
+        if anio is not None:
+            aulas = aulas.filter(Q(anio=anio) | Q(anio__isnull=True))
+        pares = aulas.values_list("grado", "seccion").distinct().order_by("grado", "seccion")
+        return [{"grado": str(g), "seccion": (s or "").strip().upper()} for g, s in pares]
+    return [{"grado": str(g), "seccion": ""} for g in con_alumnos.order_by("idgrado_trabajado")]
+
+
+def grado_seccion(lote: LibretaLote, item) -> Tuple[str, str]:
+    """
+    (grado, sección) de un elemento de lote.grados: los lotes "all" traen
+    cada aula con su sección; una lista explícita usa la sección del lote.
+    """
+    if isinstance(item, dict):
+        return str(item["grado"]), item.get("seccion", "")
+    return str(item), lote.seccion
+
+
+def crear_lote(bimestre: int, grados, seccion: str = "A", nivel: str = "",
+               modo: str = "", motor: str = "", base_url: str = "", anio: Optional[int] = None) -> LibretaLote:
+    """
+    Registra el job y lo encola al confirmar la transacción.
+    'grados' es una lista de grados (todos en 'seccion') o "all" para
+    todas las aulas del colegio, cada una con su sección. Con 'anio' solo
+    entran los grados trabajados de ese año (ver
+    ConsolidacionService.grados_trabajados).
+    """
+    if grados == "all":
+        grados = grados_disponibles(anio)
+    else:
+        grados = [str(g).strip() for g in grados if str(g).strip()]
+    if not grados:
+        raise ValueError("No hay grados para procesar.")
+
+    lote = LibretaLote.objects.create(
+        bimestre=bimestre,
+        grados=grados,
+        seccion=seccion,
+        anio=anio,
+        nivel=nivel,
+        modo=modo,
+        motor=motor,
+        base_url=base_url,
+        total=len(grados),
+    )
+    transaction.on_commit(lambda: encolar_lote(lote.id))
+    return lote
+
+
+def encolar_lote(lote_id) -> None:
+    _get_ejecutor().submit(_ejecutar_en_worker, lote_id)
+
+
+def _ejecutar_en_worker(lote_id) -> None:
+    # Cada hilo abre su propia conexión; se cierra al terminar el job.
+    close_old_connections()
+    try:
+        procesar_lote(lote_id)
+    finally:
+        close_old_connections()
+
+
+def _tomar(lote_id) -> bool:
+    """
+    Marca el lote como EN_PROCESO si está libre (PENDIENTE, o EN_PROCESO con
+    latido vencido). Solo un worker gana el UPDATE.
+    """
+    ahora = timezone.now()
+    vencido = ahora - timedelta(seconds=_latido_seg())
+    return LibretaLote.objects.filter(pk=lote_id).filter(
+        Q(estado="PENDIENTE") | Q(estado="EN_PROCESO", latido__lt=vencido)
+    ).update(estado="EN_PROCESO", iniciado_en=ahora, latido=ahora, procesados=0, error="",
+             intentos=F("intentos") + 1) == 1
+
+
+def _consolidados_de_grado(lote: LibretaLote, grado: str, seccion: str, escuela=None) -> list:
+    ids = ConsolidacionService.grados_trabajados(grado, seccion, lote.anio)
+    if escuela is not None and ids is not None:
+        return escuela.consolidados_libreta(ids, lote.bimestre)
+    return ConsolidacionService.consolidar_bimestre(grado, seccion, lote.bimestre, anio=lote.anio)
+
+
+def _grados_trabajados_del_lote(lote: LibretaLote) -> Optional[List[int]]:
+    """
+    Todos los idgrado_trabajado del lote (para cargar solo sus notas), o
+    None si algún grado no es numérico y no se puede filtrar.
+    """
+    ids = set()
+    for item in lote.grados:
+        parcial = ConsolidacionService.grados_trabajados(*grado_seccion(lote, item), lote.anio)
+        if parcial is None:
+            return None
+        ids.update(parcial)
+    return sorted(ids)
+
+
+def _pdf_de_grado(lote: LibretaLote, item, escuela=None) -> tuple[str, bytes]:
+    grado, seccion = grado_seccion(lote, item)
+    nivel = libreta_render.resolver_nivel(grado, lote.nivel)
+    consolidados = _consolidados_de_grado(lote, grado, seccion, escuela)
+    contexto = libreta_render.construir_contexto(grado, seccion, lote.bimestre, nivel, consolidados)
+
+    motor = resolver_motor(lote.motor)
+    cache = get_pdf_cache()
+    clave = clave_libreta(contexto, motor)
+    cacheado = cache.get(clave)
+    if cacheado is not None:
+        pdf_bytes = cacheado.read_bytes()
+    else:
+        modo = libreta_render.resolver_modo(lote.modo)
+        pdf_bytes = libreta_render.render_pdf(contexto, lote.base_url, modo=modo, motor=motor)
+        cache.put(clave, pdf_bytes)
+    aula = f"{grado}{seccion}" if isinstance(item, dict) else grado
+    return f"boleta_{nivel}_G{aula}_B{lote.bimestre}.pdf", pdf_bytes
+
+
+def procesar_lote(lote_id) -> None:
+    """
+    Renderiza cada grado del lote y arma el ZIP. Actualiza 'procesados'
+    después de cada grado para que el endpoint de estado muestre el avance.
+    Si otro worker ya tomó el lote, no hace nada.
+    """
+    if not _tomar(lote_id):
+        return
+    lote = LibretaLote.objects.get(pk=lote_id)
+
+    destino = get_lotes_dir() / f"libretas_B{lote.bimestre}_{lote.id}.zip"
+    fd, tmp = tempfile.mkstemp(dir=destino.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        with Latido(LibretaLote, lote.id, _latido_seg(), nombre="lote-latido"):
+            if not MOTORES[resolver_motor(lote.motor)].disponible:
+                raise RuntimeError(f"El motor de PDF '{resolver_motor(lote.motor)}' no está disponible en el servidor.")
+            # Varios grados: una sola consolidación vectorizada del bimestre para todo el lote.
+            escuela = None
+            if consolidacion_vectorizada._HAS_NUMPY and len(lote.grados) > 1:
+                escuela = consolidacion_vectorizada.consolidar_escuela(
+                    consolidacion_vectorizada.cargar_columnas(bimestres=[lote.bimestre],
+                                                              grados_trabajados=_grados_trabajados_del_lote(lote),
+                                                              anio=lote.anio)
+                )
+            with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+                for item in lote.grados:
+                    nombre, pdf_bytes = _pdf_de_grado(lote, item, escuela)
+                    zf.writestr(nombre, pdf_bytes)
+                    LibretaLote.objects.filter(pk=lote.pk).update(procesados=F("procesados") + 1,
+                                                                  latido=timezone.now())
+        os.replace(tmp, destino)
+    except Exception as e:
+        logger.exception("Error procesando lote de libretas %s", lote.id)
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        LibretaLote.objects.filter(pk=lote.pk).update(
+            estado="ERROR", error=str(e), finalizado_en=timezone.now()
+        )
+        return
+
+    LibretaLote.objects.filter(pk=lote.pk).update(
+        estado="COMPLETADO", archivo=str(destino), finalizado_en=timezone.now()
+    )
+
+
+def reanudar_pendientes() -> List[str]:
+    """
+    Vuelve a encolar los lotes que quedaron sin worker (p.ej. tras reiniciar
+    el proceso web). Los que ya se interrumpieron LIBRETAS_LOTE_INTENTOS
+    veces pasan a ERROR. Retorna los ids encolados.
+    """
+    ahora = timezone.now()
+    vencido = ahora - timedelta(seconds=_latido_seg())
+    huerfanos = LibretaLote.objects.filter(estado="EN_PROCESO", latido__lt=vencido)
+    huerfanos.filter(intentos__gte=_max_intentos()).update(
+        estado="ERROR", error="El lote se interrumpió demasiadas veces.", finalizado_en=ahora
+    )
+    # Lotes de antes de que existiera el latido: no hay forma de saber si siguen vivos.
+    LibretaLote.objects.filter(estado="EN_PROCESO", latido__isnull=True).update(
+        estado="ERROR", error="El lote quedó sin worker.", finalizado_en=ahora
+    )
+    ids = [str(i) for i in LibretaLote.objects.filter(
+        Q(estado="PENDIENTE", creado_en__lt=ahora - _GRACIA_PENDIENTE) | Q(estado="EN_PROCESO", latido__lt=vencido)
+    ).order_by("creado_en").values_list("id", flat=True)]
+    for lote_id in ids:
+        encolar_lote(lote_id)
+    return ids
+
+
+def asegurar_reanudacion() -> None:
+    """reanudar_pendientes() una sola vez por proceso."""
+    global _REANUDADO
+    if _REANUDADO:
+        return
+    with _LOCK:
+        if _REANUDADO:
+            return
+        _REANUDADO = True
+    try:
+        ids = reanudar_pendientes()
+        if ids:
+            logger.info("Lotes de libretas reanudados: %s", ", ".join(ids))
+    except Exception:
+        logger.exception("No se pudieron reanudar los lotes de libretas")
+
+
+def barrer_terminados() -> Dict[str, int]:
+    """
+    Borra los lotes terminados (COMPLETADO/ERROR) hace más de
+    LIBRETAS_LOTE_TTL con su ZIP, y los archivos del directorio de lotes sin
+    lote (borrados a mano, temporales de un worker que murió) más viejos que
+    ese TTL. Retorna {"lotes": n, "archivos": n}.
+    """
+    limite = timezone.now() - _ttl()
+    vencidos = LibretaLote.objects.filter(estado__in=["COMPLETADO", "ERROR"], finalizado_en__lt=limite)
+    directorio = get_lotes_dir()
+    archivos = 0
+    for archivo in vencidos.exclude(archivo="").values_list("archivo", flat=True):
+        p = Path(archivo)
+        if p.parent == directorio and _NOMBRE_ZIP.match(p.name):
+            try:
+                p.unlink()
+                archivos += 1
+            except FileNotFoundError:
+                pass
+    lotes = vencidos.delete()[0]
+
+    en_uso = set(LibretaLote.objects.exclude(archivo="").values_list("archivo", flat=True))
+    limite_seg = time.time() - _ttl().total_seconds()
+    for p in directorio.iterdir():
+        if not (_NOMBRE_ZIP.match(p.name) or _NOMBRE_TMP.match(p.name)) or str(p) in en_uso:
+            continue
+        try:
+            if p.stat().st_mtime < limite_seg:
+                p.unlink()
+                archivos += 1
+        except FileNotFoundError:  # otro proceso lo borró primero
+            pass
+    return {"lotes": lotes, "archivos": archivos}
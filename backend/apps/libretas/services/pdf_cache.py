@@ -0,0 +1,132 @@
+# backend/apps/libretas/services/pdf_cache.py
+"""
+Cache en disco de PDFs de libretas, direccionado por contenido.
+
+La clave es un SHA-256 de (versión de plantilla, nivel, contexto consolidado):
+si nada cambió desde la última descarga, el PDF se sirve desde disco.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+# Subir cuando cambie bimestral_multi.html o el render, para invalidar el cache.
+TEMPLATE_VERSION = "bimestral_multi-v2"
+
+
+class CacheDisco:
+    """
+    Almacén clave -> archivo. Escrituras atómicas (tmp + os.replace) para que
+    requests concurrentes nunca lean un archivo a medio escribir.
+
+    Con max_bytes > 0 el cache es LRU: get() renueva el mtime de la entrada
+    y put() desaloja las de mtime más viejo hasta quedar bajo el límite.
+    """
+
+    def __init__(self, directorio: Path | str, sufijo: str = "", max_bytes: int = 0):
+        self.directorio = Path(directorio)
+        self.sufijo = sufijo
+        self.max_bytes = max_bytes
+
+    def ruta(self, clave: str) -> Path:
+        # Dos niveles de subdirectorio para no llenar una sola carpeta.
+        return self.directorio / clave[:2] / f"{clave}{self.sufijo}"
+
+    def get(self, clave: str) -> Optional[Path]:
+        p = self.ruta(clave)
+        if not p.is_file():
+            return None
+        if self.max_bytes:
+            try:
+                os.utime(p)
+            except FileNotFoundError:  # desalojada por otro proceso
+                return None
+        return p
+
+    def put(self, clave: str, data: bytes) -> Path:
+        p = self.ruta(clave)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, p)
+        except Exception:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        if self.max_bytes:
+            self.recortar(conservar=p)
+        return p
+
+    def recortar(self, conservar: Optional[Path] = None) -> int:
+        """
+        Borra las entradas menos usadas hasta que el total quede bajo
+        max_bytes. Retorna cuántas borró.
+        """
+        entradas = []
+        for p in self.directorio.glob(f"*/*{self.sufijo}"):
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, p))
+        total = sum(tamano for _, tamano, _ in entradas)
+        borradas = 0
+        for _, tamano, p in sorted(entradas, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            if p == conservar:
+                continue
+            try:
+                p.unlink()
+                borradas += 1
+            except FileNotFoundError:
+                pass
+            total -= tamano
+        return borradas
+
+
+def get_pdf_cache() -> CacheDisco:
+    directorio = getattr(settings, "LIBRETAS_PDF_CACHE_DIR", None) or Path(settings.MEDIA_ROOT) / "libretas_cache"
+    max_bytes = int(getattr(settings, "LIBRETAS_PDF_CACHE_MAX_BYTES", 0))  # 0 = sin límite
+    return CacheDisco(directorio, sufijo=".pdf", max_bytes=max_bytes)
+
+
+def clave_libreta(contexto: Dict[str, Any], motor: str = "weasyprint") -> str:
+    """
+    Hash estable del contexto de render (datos consolidados + nivel + cabecera)
+    y del motor de PDF usado.
+    """
+    payload = {
+        "template": TEMPLATE_VERSION,
+        "motor": motor,
+        "nivel": contexto.get("nivel"),
+        "contexto": contexto,
+    }
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def etag_de(clave: str) -> str:
+    return f'"{clave}"'
+
+
+def coincide_if_none_match(header: str, etag: str) -> bool:
+    """
+    Evalúa If-None-Match (lista separada por comas, admite '*' y prefijo W/).
+    """
+    if not header:
+        return False
+    for candidato in header.split(","):
+        candidato = candidato.strip()
+        if candidato.startswith("W/"):
+            candidato = candidato[2:]
+        if candidato == "*" or candidato == etag:
+            return True
+    return False
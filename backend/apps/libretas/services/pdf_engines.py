@@ -0,0 +1,297 @@
+# backend/apps/libretas/services/pdf_engines.py
+"""
+Motores de PDF para libretas.
+
+Cada motor recibe el contexto de bimestral_multi.html (una hoja por
+consolidado) y devuelve bytes de PDF en dos pasos:
+  - preparar(contexto, request): trabajo liviano en el proceso web
+    (p.ej. render del template); el resultado debe ser serializable.
+  - render(preparado, base_url): el trabajo pesado; puede ejecutarse en
+    el pool de procesos de libreta_render.
+
+Motores disponibles:
+  - "weasyprint": HTML + CSS (salida idéntica a la plantilla). Fuentes,
+    CSS e imágenes de static/libretas se cargan una vez por proceso
+    (ContextoWeasy) y se reutilizan en cada render.
+  - "reportlab": reproduce el layout de bimestral_multi.html con platypus,
+    un orden de magnitud más rápido por página; pensado para lotes grandes.
+"""
+from __future__ import annotations
+import abc
+import mimetypes
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.templatetags.static import static
+
+from .pdf_metricas import etapa
+
+try:
+    from weasyprint import CSS, HTML, default_url_fetcher
+    from weasyprint.text.fonts import FontConfiguration
+    _HAS_WEASY = True
+except Exception:
+    _HAS_WEASY = False
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.platypus import Image, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+TEMPLATE_MULTI = "libretas/bimestral_multi.html"
+STATIC_LIBRETAS_DIR = Path(__file__).resolve().parent.parent / "static" / "libretas"
+STATIC_IMG_DIR = STATIC_LIBRETAS_DIR / "img"
+CSS_MULTI = STATIC_LIBRETAS_DIR / "css" / "bimestral_multi.css"
+
+
+def cargar_assets(directorio: Path = STATIC_LIBRETAS_DIR) -> Dict[str, Tuple[bytes, str]]:
+    """
+    Lee todos los archivos de static/libretas a memoria:
+    {'img/ESCUDO-COLEGIO.png': (bytes, 'image/png'), ...}
+    """
+    assets = {}
+    for p in sorted(directorio.rglob("*")):
+        if p.is_file():
+            mime = mimetypes.guess_type(p.name)[0] or "application/octet-stream"
+            assets[p.relative_to(directorio).as_posix()] = (p.read_bytes(), mime)
+    return assets
+
+
+class ContextoWeasy:
+    """
+    Estado de larga vida del motor WeasyPrint: configuración de fuentes,
+    hojas de estilo ya parseadas y assets de static/libretas en memoria.
+    Se crea una vez por proceso (web o worker del pool) con get_contexto_weasy().
+    """
+
+    def __init__(self, css_paths: Tuple[Path, ...] = (CSS_MULTI,)):
+        self.prefijo_static = static("libretas/")
+        self.assets = cargar_assets()
+        self.font_config = FontConfiguration()
+        self.stylesheets = [
+            CSS(string=p.read_text(encoding="utf-8"), font_config=self.font_config) for p in css_paths
+        ]
+
+    def buscar_asset(self, url: str) -> Optional[Tuple[bytes, str]]:
+        ruta = unquote(urlparse(url).path)
+        if not ruta.startswith(self.prefijo_static):
+            return None
+        return self.assets.get(ruta[len(self.prefijo_static):])
+
+    def url_fetcher(self, url: str, *args, **kwargs) -> Dict[str, Any]:
+        # static/libretas se sirve desde memoria; el resto va por el fetcher estándar.
+        asset = self.buscar_asset(url)
+        if asset is None:
+            return default_url_fetcher(url, *args, **kwargs)
+        data, mime = asset
+        return {"string": data, "mime_type": mime, "redirected_url": url}
+
+    def render(self, html_str: str, base_url: str) -> bytes:
+        with etapa("layout"):
+            documento = HTML(string=html_str, base_url=base_url, url_fetcher=self.url_fetcher).render(
+                stylesheets=self.stylesheets, font_config=self.font_config
+            )
+        with etapa("write"):
+            return documento.write_pdf()
+
+
+_CONTEXTO_WEASY: Optional[ContextoWeasy] = None
+
+
+def get_contexto_weasy() -> ContextoWeasy:
+    global _CONTEXTO_WEASY
+    if _CONTEXTO_WEASY is None:
+        _CONTEXTO_WEASY = ContextoWeasy()
+    return _CONTEXTO_WEASY
+
+
+def _html_a_pdf(html_str: str, base_url: str) -> bytes:
+    return get_contexto_weasy().render(html_str, base_url)
+
+
+class MotorPDF(abc.ABC):
+    nombre = ""
+    disponible = True
+
+    def preparar(self, contexto: Dict[str, Any], request=None) -> Any:
+        return contexto
+
+    @abc.abstractmethod
+    def render(self, preparado: Any, base_url: str) -> bytes:
+        ...
+
+
+class MotorWeasyPrint(MotorPDF):
+    nombre = "weasyprint"
+    disponible = _HAS_WEASY
+
+    def preparar(self, contexto: Dict[str, Any], request=None) -> str:
+        # El CSS va precargado en ContextoWeasy; la plantilla omite el <link>.
+        with etapa("template"):
+            return render_to_string(TEMPLATE_MULTI, dict(contexto, css_precargado=True), request=request)
+
+    def render(self, preparado: str, base_url: str) -> bytes:
+        return _html_a_pdf(preparado, base_url)
+
+
+# --- ReportLab: mismo layout que bimestral_multi.html ---------------------
+_NARANJA = colors.HexColor("#e16d2b")
+_FONDO_AREA = colors.HexColor("#fafafa")
+_FONDO_LETRA = colors.HexColor("#fff9ed")
+_MARGEN_PAGINA = 16 * mm          # @page margin
+_PADDING_HOJA = (14 * mm, 12 * mm)  # .sheet padding (vertical, horizontal)
+_PX = 0.75                         # 1px CSS = 0.75pt
+
+_ESTILOS = {
+    "h2": ParagraphStyle("h2", fontName="Helvetica-Bold", fontSize=18 * _PX, leading=17, alignment=TA_CENTER),
+    "h3": ParagraphStyle("h3", fontName="Helvetica-Bold", fontSize=14 * _PX, leading=13, alignment=TA_CENTER),
+    "titulo": ParagraphStyle("titulo", fontName="Helvetica-Bold", fontSize=18 * _PX, leading=17, alignment=TA_CENTER),
+    "lbl": ParagraphStyle("lbl", fontName="Helvetica-Bold", fontSize=12 * _PX, leading=12),
+    "td": ParagraphStyle("td", fontName="Helvetica", fontSize=12 * _PX, leading=12),
+    "td_center": ParagraphStyle("td_center", fontName="Helvetica", fontSize=12 * _PX, leading=12, alignment=TA_CENTER),
+    "area": ParagraphStyle("area", fontName="Helvetica-Bold", fontSize=12 * _PX, leading=12),
+    "grande": ParagraphStyle("grande", fontName="Helvetica-Bold", fontSize=20 * _PX, leading=18),
+}
+
+
+def _p(texto: Any, estilo: str) -> Paragraph:
+    return Paragraph(escape("" if texto is None else str(texto)), _ESTILOS[estilo])
+
+
+def _dibujar_borde(canv, doc) -> None:
+    # Borde naranja de .sheet (3px) sobre el área imprimible de la página.
+    ancho, alto = A4
+    canv.saveState()
+    canv.setStrokeColor(_NARANJA)
+    canv.setLineWidth(3 * _PX)
+    canv.rect(_MARGEN_PAGINA, _MARGEN_PAGINA, ancho - 2 * _MARGEN_PAGINA, alto - 2 * _MARGEN_PAGINA)
+    canv.restoreState()
+
+
+class MotorReportLab(MotorPDF):
+    nombre = "reportlab"
+
+    def render(self, contexto: Dict[str, Any], base_url: str) -> bytes:
+        buff = BytesIO()
+        doc = SimpleDocTemplate(
+            buff, pagesize=A4,
+            leftMargin=_MARGEN_PAGINA + _PADDING_HOJA[1], rightMargin=_MARGEN_PAGINA + _PADDING_HOJA[1],
+            topMargin=_MARGEN_PAGINA + _PADDING_HOJA[0], bottomMargin=_MARGEN_PAGINA + _PADDING_HOJA[0],
+            title=str(contexto.get("titulo") or ""),
+        )
+        story: List[Any] = []
+        with etapa("template"):
+            consolidados = contexto.get("consolidados") or []
+            for i, consolidado in enumerate(consolidados):
+                if i:
+                    story.append(PageBreak())
+                story.extend(self._hoja(contexto, consolidado, doc.width))
+            if not story:
+                story.append(Spacer(1, 1))
+        # ReportLab maqueta y escribe en la misma pasada; todo cuenta como layout.
+        with etapa("layout"):
+            doc.build(story, onFirstPage=_dibujar_borde, onLaterPages=_dibujar_borde)
+        return buff.getvalue()
+
+    def _hoja(self, contexto: Dict[str, Any], c: Dict[str, Any], ancho: float) -> List[Any]:
+        lado_logo = 72 * _PX
+        logo = Image(str(STATIC_IMG_DIR / "ESCUDO-COLEGIO.png"), width=lado_logo, height=lado_logo, kind="proportional")
+        cabecera = Table(
+            [[logo, [_p("Institución Educativa Privada", "h2"), _p("BOLETA DE NOTAS", "h3")]]],
+            colWidths=[lado_logo + 12 * _PX, ancho - lado_logo - 12 * _PX],
+        )
+        cabecera.setStyle(TableStyle([
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+            ("LEFTPADDING", (0, 0), (-1, -1), 0),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 0),
+        ]))
+
+        caja = 120 * _PX
+        datos = Table(
+            [[[_p("APELLIDOS Y NOMBRES", "lbl"), _p(c.get("alumno_nombre"), "lbl")],
+              [_p("GRADO", "lbl"), _p(contexto.get("grado"), "lbl")],
+              [_p("BIMESTRE", "lbl"), _p(contexto.get("bimestre"), "lbl")]]],
+            colWidths=[ancho - 2 * caja, caja, caja],
+        )
+        datos.setStyle(TableStyle([
+            ("BOX", (0, 0), (0, 0), 0.75, colors.black),
+            ("BOX", (1, 0), (1, 0), 0.75, colors.black),
+            ("BOX", (2, 0), (2, 0), 0.75, colors.black),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ]))
+
+        filas = [[_p(h, "lbl") for h in ("ÁREA", "ASIGNATURA", "NOTAS", "PROMEDIO", "LETRA")]]
+        for a in c.get("asignaturas") or []:
+            notas = ", ".join(str(n) for n in a.get("notas") or [])
+            filas.append([
+                _p(a.get("area"), "area"), _p(a.get("nombre"), "td"), _p(notas, "td_center"),
+                _p(a.get("promedio"), "td_center"), _p(a.get("letra"), "td_center"),
+            ])
+        notas_tabla = Table(filas, colWidths=[ancho * f for f in (0.24, 0.26, 0.22, 0.14, 0.14)], repeatRows=1)
+        notas_tabla.setStyle(TableStyle([
+            ("GRID", (0, 0), (-1, -1), 0.75, colors.black),
+            ("BACKGROUND", (0, 1), (0, -1), _FONDO_AREA),
+            ("BACKGROUND", (4, 1), (4, -1), _FONDO_LETRA),
+            ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ]))
+
+        caja_pie = 200 * _PX
+        pie = Table(
+            [[[_p("RECOMENDACIONES", "td"), _p(c.get("recomendaciones"), "td")],
+              [_p("PROMEDIO FINAL", "td"), _p(c.get("promedio_general"), "grande")],
+              [_p("CUALITATIVO", "td"), _p(c.get("letra_general"), "grande")]]],
+            colWidths=[ancho - 2 * caja_pie, caja_pie, caja_pie],
+        )
+        pie.setStyle(TableStyle([
+            ("BOX", (0, 0), (0, 0), 0.75, colors.black),
+            ("BOX", (1, 0), (1, 0), 0.75, colors.black),
+            ("BOX", (2, 0), (2, 0), 0.75, colors.black),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ]))
+
+        return [
+            cabecera,
+            Spacer(1, 8 * _PX),
+            _p(contexto.get("titulo"), "titulo"),
+            Spacer(1, 10 * _PX),
+            datos,
+            Spacer(1, 10 * _PX),
+            notas_tabla,
+            Spacer(1, 12 * _PX),
+            pie,
+        ]
+
+
+MOTORES: Dict[str, MotorPDF] = {
+    MotorWeasyPrint.nombre: MotorWeasyPrint(),
+    MotorReportLab.nombre: MotorReportLab(),
+}
+
+
+def resolver_motor(motor_param: str = "") -> str:
+    """
+    Prioridad: ?motor= en el request, luego settings.LIBRETAS_PDF_MOTOR.
+    """
+    nombre = (motor_param or "").strip().lower()
+    if nombre in MOTORES:
+        return nombre
+    nombre = str(getattr(settings, "LIBRETAS_PDF_MOTOR", "weasyprint")).lower()
+    return nombre if nombre in MOTORES else "weasyprint"
+
+
+def get_motor(nombre: str = "") -> MotorPDF:
+    return MOTORES[resolver_motor(nombre)]
+
+
+def render_preparado(nombre_motor: str, preparado: Any, base_url: str) -> bytes:
+    """
+    Worker del pool de procesos: nivel de módulo para poder serializarse.
+    """
+    return MOTORES[nombre_motor].render(preparado, base_url)
@@ -0,0 +1,121 @@
+# backend/apps/libretas/services/pdf_metricas.py
+"""
+Tiempos por etapa del pipeline de libretas (prechecks, consolidación,
+template, layout y escritura del PDF), con cantidad de queries por etapa.
+
+Uso:
+    with medir("bimestral_pdf") as m:
+        with etapa("consolidacion"):
+            ...
+    resp["Server-Timing"] = m.server_timing()
+
+Las etapas se pueden anidar: cada una registra su tiempo y queries
+propios (sin los de sus sub-etapas), así los valores del header no se
+solapan. Se registran en la medición activa del contexto actual; fuera
+de un 'medir' (p.ej. en workers del pool de procesos) no hacen nada, así
+que los servicios pueden instrumentarse sin saber quién los llama.
+Al cerrar la medición se emite una línea JSON en el logger
+'apps.libretas.metricas' (el sink: consola, archivo o agregador de logs).
+"""
+from __future__ import annotations
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.db import connection
+
+logger = logging.getLogger("apps.libretas.metricas")
+
+_ACTUAL: ContextVar[Optional["Medicion"]] = ContextVar("libretas_medicion", default=None)
+
+
+class Medicion:
+    def __init__(self, nombre: str):
+        self.nombre = nombre
+        self.inicio = time.perf_counter()
+        self.total_ms = 0.0
+        # etapa -> {"ms": float, "queries": int, "veces": int}; conserva el orden de aparición
+        self.etapas: Dict[str, Dict[str, float]] = {}
+        self.datos: Dict[str, Any] = {}
+        # Por cada etapa abierta: [ms, queries] consumidos por sus sub-etapas.
+        self._pila: List[List[float]] = []
+
+    def agregar(self, etapa: str, ms: float, queries: int) -> None:
+        e = self.etapas.setdefault(etapa, {"ms": 0.0, "queries": 0, "veces": 0})
+        e["ms"] += ms
+        e["queries"] += queries
+        e["veces"] += 1
+
+    def anotar(self, **datos: Any) -> None:
+        """Datos extra para el log (bytes de salida, motor, modo, cache...)."""
+        self.datos.update(datos)
+
+    def cerrar(self) -> None:
+        self.total_ms = (time.perf_counter() - self.inicio) * 1000
+
+    def server_timing(self) -> str:
+        partes = []
+        for nombre, e in self.etapas.items():
+            partes.append(f'{nombre};dur={e["ms"]:.1f};desc="{int(e["queries"])} queries"')
+        total = f"total;dur={self.total_ms:.1f}"
+        if "bytes" in self.datos:
+            total += f';desc="{self.datos["bytes"]} bytes"'
+        partes.append(total)
+        return ", ".join(partes)
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "medicion": self.nombre,
+            "total_ms": round(self.total_ms, 1),
+            "etapas": {
+                n: {"ms": round(e["ms"], 1), "queries": int(e["queries"]), "veces": int(e["veces"])}
+                for n, e in self.etapas.items()
+            },
+            **self.datos,
+        }
+
+
+@contextmanager
+def medir(nombre: str) -> Iterator[Medicion]:
+    m = Medicion(nombre)
+    token = _ACTUAL.set(m)
+    try:
+        yield m
+    finally:
+        _ACTUAL.reset(token)
+        m.cerrar()
+        logger.info(json.dumps(m.como_dict(), ensure_ascii=False, default=str))
+
+
+def medicion_actual() -> Optional[Medicion]:
+    return _ACTUAL.get()
+
+
+@contextmanager
+def etapa(nombre: str) -> Iterator[None]:
+    m = _ACTUAL.get()
+    if m is None:
+        yield
+        return
+
+    queries = [0]
+
+    def contar(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    m._pila.append([0.0, 0])
+    inicio = time.perf_counter()
+    try:
+        with connection.execute_wrapper(contar):
+            yield
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000
+        hijos_ms, hijos_queries = m._pila.pop()
+        m.agregar(nombre, ms - hijos_ms, int(queries[0] - hijos_queries))
+        if m._pila:
+            m._pila[-1][0] += ms
+            m._pila[-1][1] += queries[0]
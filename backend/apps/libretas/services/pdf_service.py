@@ -27,7 +27,7 @@ def build_preview_dto(params: Dict[str, Any], filas):
             "alumno": f["alumno"],
             "curso": str(curso) if curso else "Curso",
             "nota_num": nota,
-            "nota_let": calc_service.num_a_letra(nota),
+            "nota_let": calc_service.nota_a_letra(nota),
         })
 
     return {
@@ -0,0 +1,162 @@
+# backend/apps/libretas/services/resumen_notas.py
+"""
+Mantenimiento de ResumenNotaBimestre (alumno × asignatura × bimestre).
+
+- recalcular(): rehace una sola fila a partir de sus notas; lo llaman los
+  signals de Nota en cada alta/cambio/baja.
+- reconstruir(): rehace la tabla completa (o un bimestre, o unos grados
+  trabajados) con una agregación GROUP BY.
+- recalcular_asignatura_trabajada(): rehace las filas de las notas de una
+  AsignaturaTrabajada cuando cambia su asignatura.
+- verificar(): compara cantidad y suma de notas contra el resumen de un
+  bimestre/grado y, si no cuadran, lo reconstruye. La llama la consolidación
+  antes de leer (LIBRETAS_RESUMEN_VERIFICAR).
+
+Escrituras a 'nota' que NO pasan por los signals y por lo tanto deben
+llamar a recalcular() por clave, o a reconstruir() (o correr
+'manage.py reconstruir_resumen_notas') al terminar:
+  - Nota.objects.bulk_create / bulk_update;
+  - QuerySet.update / QuerySet.delete sobre Nota;
+  - SQL directo o cargas externas sobre la tabla nota.
+verificar() detecta los casos que cambian la cantidad o la suma de notas
+del grupo; un cambio que deja ambas iguales (p.ej. intercambiar dos
+notas) solo se corrige con recalcular/reconstruir.
+"""
+from __future__ import annotations
+from decimal import Decimal
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, Min, Sum, Value
+from django.db.models.functions import Coalesce
+
+from ..models import Nota, ResumenNotaBimestre
+from .calc_service import nota_a_letra
+
+logger = logging.getLogger(__name__)
+
+_CERO = Decimal("0")
+_Q4 = Decimal("0.0001")
+
+
+def _promedio(suma: Decimal, cantidad: int) -> Decimal:
+    return (Decimal(suma) / cantidad).quantize(_Q4) if cantidad else _CERO
+
+
+def recalcular(alumno_id, asignatura_id, bimestre) -> None:
+    """
+    Rehace la fila del resumen para la clave dada (o la borra si ya no
+    quedan notas).
+    """
+    if alumno_id is None or asignatura_id is None:
+        return
+    filas = list(
+        Nota.objects.filter(idalumno_id=alumno_id, bimestre=bimestre,
+                            idasignatura_trabajada__idasignatura_id=asignatura_id)
+        .order_by("idnota").values_list("idnota", "calificacion")
+    )
+    clave = {"alumno_id": alumno_id, "asignatura_id": asignatura_id, "bimestre": bimestre}
+    if not filas:
+        ResumenNotaBimestre.objects.filter(**clave).delete()
+        return
+
+    calificaciones = [c if c is not None else _CERO for _, c in filas]
+    suma = sum(calificaciones, _CERO)
+    promedio = _promedio(suma, len(filas))
+    ResumenNotaBimestre.objects.update_or_create(
+        **clave,
+        defaults={
+            "cantidad": len(filas),
+            "suma": suma,
+            "promedio": promedio,
+            "letra": nota_a_letra(suma / len(filas)),
+            "notas": [float(c) for c in calificaciones],
+            "primera_nota": filas[0][0],
+        },
+    )
+
+
+def _filtrar(notas, resumen, bimestre: Optional[int], grados_trabajados: Optional[Iterable[int]]):
+    if bimestre is not None:
+        notas = notas.filter(bimestre=bimestre)
+        resumen = resumen.filter(bimestre=bimestre)
+    if grados_trabajados is not None:
+        ids = list(grados_trabajados)
+        notas = notas.filter(idalumno__idgrado_trabajado__in=ids)
+        resumen = resumen.filter(alumno__idgrado_trabajado__in=ids)
+    return notas, resumen
+
+
+@transaction.atomic
+def reconstruir(bimestre: Optional[int] = None, lote: int = 2000,
+                grados_trabajados: Optional[Iterable[int]] = None) -> int:
+    """
+    Borra y vuelve a generar el resumen (todo, un bimestre y/o los alumnos
+    de unos grados trabajados). Retorna la cantidad de filas creadas.
+    """
+    notas, existentes = _filtrar(Nota.objects.all(), ResumenNotaBimestre.objects.all(), bimestre,
+                                 grados_trabajados)
+    existentes.delete()
+
+    clave_asig = "idasignatura_trabajada__idasignatura_id"
+    agregados = (
+        notas.values("idalumno_id", clave_asig, "bimestre")
+        .annotate(
+            cantidad=Count("idnota"),
+            suma=Coalesce(Sum("calificacion"), Value(0), output_field=DecimalField(max_digits=9, decimal_places=2)),
+            primera=Min("idnota"),
+        )
+        .values_list("idalumno_id", clave_asig, "bimestre", "cantidad", "suma", "primera")
+    )
+
+    lista_notas: Dict[Tuple[int, int, int], list] = {}
+    for aid, asig_id, bim, cal in notas.order_by("idnota").values_list(
+        "idalumno_id", clave_asig, "bimestre", "calificacion"
+    ).iterator(chunk_size=lote):
+        lista_notas.setdefault((aid, asig_id, bim), []).append(float(cal) if cal is not None else 0.0)
+
+    filas = []
+    for aid, asig_id, bim, cantidad, suma, primera in agregados.iterator(chunk_size=lote):
+        suma = Decimal(suma or 0)
+        promedio = _promedio(suma, cantidad)
+        filas.append(ResumenNotaBimestre(
+            alumno_id=aid, asignatura_id=asig_id, bimestre=bim, cantidad=cantidad, suma=suma,
+            promedio=promedio, letra=nota_a_letra(suma / cantidad if cantidad else _CERO),
+            notas=lista_notas.get((aid, asig_id, bim), []), primera_nota=primera,
+        ))
+    ResumenNotaBimestre.objects.bulk_create(filas, batch_size=lote)
+    return len(filas)
+
+
+def recalcular_asignatura_trabajada(asignatura_trabajada_id, asignatura_anterior_id) -> None:
+    """
+    La AsignaturaTrabajada cambió de asignatura: sus notas pasan de la clave
+    (alumno, asignatura anterior, bimestre) a la nueva. Rehace ambas.
+    """
+    claves = set(Nota.objects.filter(idasignatura_trabajada_id=asignatura_trabajada_id)
+                 .values_list("idalumno_id", "idasignatura_trabajada__idasignatura_id", "bimestre"))
+    for alumno_id, asignatura_id, bimestre in claves:
+        recalcular(alumno_id, asignatura_anterior_id, bimestre)
+        recalcular(alumno_id, asignatura_id, bimestre)
+
+
+def verificar(bimestre: int, grados_trabajados: Optional[Iterable[int]] = None) -> bool:
+    """
+    Compara cantidad y suma de las notas del bimestre (y grados trabajados)
+    con las del resumen: dos agregados, sin traer filas. Si no cuadran
+    (escrituras sin signals, ver arriba) reconstruye ese grupo.
+    Retorna True si el resumen ya estaba al día.
+    """
+    ids = list(grados_trabajados) if grados_trabajados is not None else None
+    notas, resumen = _filtrar(Nota.objects.all(), ResumenNotaBimestre.objects.all(), bimestre, ids)
+    decimal = DecimalField(max_digits=12, decimal_places=2)
+    en_notas = notas.aggregate(cantidad=Count("idnota"),
+                               suma=Coalesce(Sum("calificacion"), Value(0), output_field=decimal))
+    en_resumen = resumen.aggregate(cantidad=Coalesce(Sum("cantidad"), Value(0)),
+                                   suma=Coalesce(Sum("suma"), Value(0), output_field=decimal))
+    if (en_notas["cantidad"], Decimal(en_notas["suma"])) == (en_resumen["cantidad"], Decimal(en_resumen["suma"])):
+        return True
+    logger.warning("ResumenNotaBimestre desactualizado (bimestre %s, grados %s): se reconstruye", bimestre, ids)
+    reconstruir(bimestre=bimestre, grados_trabajados=ids)
+    return False
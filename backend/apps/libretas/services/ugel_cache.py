@@ -0,0 +1,101 @@
+# backend/apps/libretas/services/ugel_cache.py
+"""
+Cache en disco del consolidado UGEL, direccionado por contenido.
+
+La clave es un SHA-256 de (versión, hash del archivo, hoja, curso): si el
+coordinador vuelve a subir el mismo .xlsx, construir_consolidado devuelve
+las filas guardadas sin abrir el libro ni recalcular promedios. Vive en
+LIBRETAS_UGEL_CACHE_DIR con desalojo LRU por LIBRETAS_UGEL_CACHE_MAX_BYTES
+(ver CacheDisco); LIBRETAS_UGEL_CACHE=False lo desactiva.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .pdf_cache import CacheDisco
+
+logger = logging.getLogger(__name__)
+
+# Subir cuando cambie el cálculo de construir_consolidado, para invalidar el cache.
+CONSOLIDADO_VERSION = "ugel-consolidado-v1"
+
+# Los uploads del registro ya se llaman <sha256>.xlsx (ver ugel_uploads.registrar).
+_NOMBRE_REGISTRO = re.compile(r"^([0-9a-f]{64})\.xlsx$")
+_BLOQUE = 1024 * 1024
+
+# Hash por (ruta, mtime, tamaño): un archivo sin cambios no se vuelve a leer.
+_HASHES: Dict[Tuple[str, int, int], str] = {}
+_HASHES_MAX = 256
+_LOCK = threading.Lock()
+
+
+def habilitado() -> bool:
+    return bool(getattr(settings, "LIBRETAS_UGEL_CACHE", True))
+
+
+def get_ugel_cache() -> CacheDisco:
+    directorio = getattr(settings, "LIBRETAS_UGEL_CACHE_DIR", None) or Path(settings.MEDIA_ROOT) / "ugel_cache"
+    max_bytes = int(getattr(settings, "LIBRETAS_UGEL_CACHE_MAX_BYTES", 0))  # 0 = sin límite
+    return CacheDisco(directorio, sufijo=".json", max_bytes=max_bytes)
+
+
+def hash_archivo(path: str | Path) -> str:
+    """SHA-256 del contenido del archivo (leído en bloques)."""
+    p = Path(path)
+    m = _NOMBRE_REGISTRO.match(p.name)
+    if m:
+        return m.group(1)
+    st = os.stat(p)
+    memo = (str(p), st.st_mtime_ns, st.st_size)
+    with _LOCK:
+        if memo in _HASHES:
+            return _HASHES[memo]
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        for bloque in iter(lambda: f.read(_BLOQUE), b""):
+            h.update(bloque)
+    digest = h.hexdigest()
+    with _LOCK:
+        if len(_HASHES) >= _HASHES_MAX:
+            _HASHES.clear()
+        _HASHES[memo] = digest
+    return digest
+
+
+def clave_consolidado(sha256: str, grado: Optional[str], curso: Optional[str]) -> str:
+    """
+    Hash de lo que determina el consolidado. 'curso' va tal cual: además de
+    filtrar, se copia a las filas que no traen curso.
+    """
+    payload = {"version": CONSOLIDADO_VERSION, "archivo": sha256, "hoja": grado or "", "curso": curso}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def leer(clave: str) -> Optional[List[dict]]:
+    p = get_ugel_cache().get(clave)
+    if p is None:
+        return None
+    try:
+        return json.loads(p.read_bytes())
+    except (OSError, ValueError):  # desalojada o a medio borrar: se recalcula
+        return None
+
+
+def guardar(clave: str, consolidado: List[dict]) -> None:
+    try:
+        data = json.dumps(consolidado, ensure_ascii=False).encode("utf-8")
+    except (TypeError, ValueError):
+        return  # celdas que JSON no representa fielmente (fechas, etc.): no se cachea
+    try:
+        get_ugel_cache().put(clave, data)
+    except OSError:  # el cache nunca debe romper la consolidación
+        logger.exception("No se pudo guardar el consolidado UGEL en cache")
@@ -0,0 +1,246 @@
+# backend/apps/libretas/services/ugel_export_jobs.py
+"""
+Exports UGEL asíncronos: un job (UgelExportJob) por archivo, procesado en
+un pool de hilos local. El POST responde con el id al instante; el avance
+se reporta en filas de alumnos consolidadas y el .xlsx final se descarga
+con el nombre original.
+
+Reanudación: el worker que procesa un job actualiza 'latido' mientras
+trabaja. Si el proceso web se reinicia, los jobs PENDIENTE sin encolar y
+los EN_PROCESO con latido vencido (LIBRETAS_UGEL_JOB_LATIDO_SEG) se vuelven
+a encolar con reanudar_pendientes(): lo llama cada proceso web la primera
+vez que atiende un endpoint de jobs y el comando
+'manage.py reanudar_exports_ugel'. La toma del job es un UPDATE
+condicional, así que un job nunca corre dos veces a la vez aunque lo
+encolen varios procesos.
+
+Limpieza: barrer_terminados() borra los jobs COMPLETADO/ERROR que
+terminaron hace más de LIBRETAS_UGEL_EXPORT_TTL y sus .xlsx, más los
+archivos del directorio de exports que ya no tienen job. Lo corre
+'manage.py limpiar_uploads_ugel'.
+"""
+from __future__ import annotations
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import UgelExportJob
+from .excel_adapter import contar_filas
+from .latido import Latido
+from .ugel_service import (
+    construir_consolidado, construir_consolidado_hojas, exportar_excel, exportar_excel_hojas,
+)
+
+logger = logging.getLogger(__name__)
+
+# Un PENDIENTE más viejo que esto ya debería haber sido tomado por un worker.
+_GRACIA_PENDIENTE = timedelta(seconds=60)
+
+# Solo se borran archivos con estos nombres (los que escribe procesar_job).
+_NOMBRE_EXPORT = re.compile(r"^ugel_[0-9a-f-]{36}\.xlsx$")
+_NOMBRE_TMP = re.compile(r"^tmp\w+\.tmp$")
+
+_EJECUTOR: Optional[ThreadPoolExecutor] = None
+_REANUDADO = False
+_LOCK = threading.Lock()
+
+
+def _get_ejecutor() -> ThreadPoolExecutor:
+    global _EJECUTOR
+    if _EJECUTOR is None:
+        workers = int(getattr(settings, "LIBRETAS_UGEL_JOB_WORKERS", 2) or 1)
+        _EJECUTOR = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ugel-export")
+    return _EJECUTOR
+
+
+def get_exports_dir() -> Path:
+    d = Path(getattr(settings, "LIBRETAS_UGEL_EXPORTS_DIR", None) or Path(settings.MEDIA_ROOT) / "ugel_exports")
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def _latido_seg() -> int:
+    return int(getattr(settings, "LIBRETAS_UGEL_JOB_LATIDO_SEG", 300))
+
+
+def _max_intentos() -> int:
+    return int(getattr(settings, "LIBRETAS_UGEL_JOB_INTENTOS", 3))
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, "LIBRETAS_UGEL_EXPORT_TTL", 24 * 3600)))
+
+
+def crear_job(ruta: str, nombre_original: str, grado: str = "", curso: str = "", modo: str = "",
+              todas: bool = False) -> UgelExportJob:
+    """
+    Registra el job y lo encola al confirmar la transacción.
+    """
+    if not os.path.isfile(ruta):
+        raise FileNotFoundError(f"No existe el archivo {ruta}.")
+    job = UgelExportJob.objects.create(
+        ruta=str(ruta), nombre_original=nombre_original, grado=grado or "", curso=curso or "",
+        modo=modo or "", todas=todas,
+    )
+    transaction.on_commit(lambda: encolar_job(job.id))
+    return job
+
+
+def encolar_job(job_id) -> None:
+    _get_ejecutor().submit(_ejecutar_en_worker, job_id)
+
+
+def _ejecutar_en_worker(job_id) -> None:
+    close_old_connections()
+    try:
+        procesar_job(job_id)
+    finally:
+        close_old_connections()
+
+
+def _tomar(job_id) -> bool:
+    """
+    Marca el job como EN_PROCESO si está libre (PENDIENTE, o EN_PROCESO con
+    latido vencido). Solo un worker gana el UPDATE.
+    """
+    ahora = timezone.now()
+    vencido = ahora - timedelta(seconds=_latido_seg())
+    return UgelExportJob.objects.filter(pk=job_id).filter(
+        Q(estado="PENDIENTE") | Q(estado="EN_PROCESO", latido__lt=vencido)
+    ).update(estado="EN_PROCESO", iniciado_en=ahora, latido=ahora, procesados=0, error="",
+             intentos=F("intentos") + 1) == 1
+
+
+def procesar_job(job_id) -> None:
+    """
+    Consolida y escribe el .xlsx. 'total' es un estimado (dimensión de las
+    hojas) hasta que termina; 'procesados' avanza por hoja consolidada o,
+    con una sola hoja, por bloque de filas leídas.
+    """
+    if not _tomar(job_id):
+        return
+    job = UgelExportJob.objects.get(pk=job_id)
+    qs = UgelExportJob.objects.filter(pk=job.pk)
+
+    destino = get_exports_dir() / f"ugel_{job.id}.xlsx"
+    fd, tmp = tempfile.mkstemp(dir=destino.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        with Latido(UgelExportJob, job.id, _latido_seg(), nombre="ugel-latido"):
+            estimado = contar_filas(job.ruta)
+            if job.todas:
+                qs.update(total=sum(estimado.values()))
+
+                def avance(hoja, filas):
+                    qs.update(procesados=F("procesados") + len(filas), latido=timezone.now())
+
+                consolidados = construir_consolidado_hojas(job.ruta, curso=job.curso, al_terminar_hoja=avance)
+                procesados = sum(len(c) for c in consolidados.values())
+                data = exportar_excel_hojas(job.ruta, consolidados, [], modo=job.modo or None)
+            else:
+                hoja = job.grado if job.grado in estimado else next(iter(estimado), None)
+                qs.update(total=estimado.get(hoja, 0))
+
+                def avance(leidas):
+                    qs.update(procesados=leidas, latido=timezone.now())
+
+                consolidado = construir_consolidado(job.ruta, grado=job.grado, curso=job.curso, al_avanzar=avance)
+                procesados = len(consolidado)
+                qs.update(procesados=procesados, latido=timezone.now())
+                data = exportar_excel(job.ruta, consolidado, [], modo=job.modo or None)
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, destino)
+    except Exception as e:
+        logger.exception("Error procesando export UGEL %s", job.id)
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        qs.update(estado="ERROR", error=str(e), finalizado_en=timezone.now())
+        return
+
+    qs.update(estado="COMPLETADO", total=procesados, procesados=procesados, archivo=str(destino),
+              finalizado_en=timezone.now())
+
+
+def reanudar_pendientes() -> List[str]:
+    """
+    Vuelve a encolar los jobs que quedaron sin worker (p.ej. tras reiniciar
+    el proceso web). Los que ya se interrumpieron LIBRETAS_UGEL_JOB_INTENTOS
+    veces pasan a ERROR. Retorna los ids encolados.
+    """
+    ahora = timezone.now()
+    vencido = ahora - timedelta(seconds=_latido_seg())
+    huerfanos = UgelExportJob.objects.filter(estado="EN_PROCESO", latido__lt=vencido)
+    huerfanos.filter(intentos__gte=_max_intentos()).update(
+        estado="ERROR", error="El export se interrumpió demasiadas veces.", finalizado_en=ahora
+    )
+    ids = [str(i) for i in UgelExportJob.objects.filter(
+        Q(estado="PENDIENTE", creado_en__lt=ahora - _GRACIA_PENDIENTE) | Q(estado="EN_PROCESO", latido__lt=vencido)
+    ).order_by("creado_en").values_list("id", flat=True)]
+    for job_id in ids:
+        encolar_job(job_id)
+    return ids
+
+
+def asegurar_reanudacion() -> None:
+    """reanudar_pendientes() una sola vez por proceso."""
+    global _REANUDADO
+    if _REANUDADO:
+        return
+    with _LOCK:
+        if _REANUDADO:
+            return
+        _REANUDADO = True
+    try:
+        ids = reanudar_pendientes()
+        if ids:
+            logger.info("Exports UGEL reanudados: %s", ", ".join(ids))
+    except Exception:
+        logger.exception("No se pudieron reanudar los exports UGEL")
+
+
+def barrer_terminados() -> Dict[str, int]:
+    """
+    Borra los jobs terminados (COMPLETADO/ERROR) hace más de
+    LIBRETAS_UGEL_EXPORT_TTL con su .xlsx, y los archivos del directorio de
+    exports sin job (borrados a mano, temporales de un worker que murió)
+    más viejos que ese TTL. Retorna {"jobs": n, "archivos": n}.
+    """
+    limite = timezone.now() - _ttl()
+    vencidos = UgelExportJob.objects.filter(estado__in=["COMPLETADO", "ERROR"], finalizado_en__lt=limite)
+    directorio = get_exports_dir()
+    archivos = 0
+    for archivo in vencidos.exclude(archivo="").values_list("archivo", flat=True):
+        p = Path(archivo)
+        if p.parent == directorio and _NOMBRE_EXPORT.match(p.name):
+            try:
+                p.unlink()
+                archivos += 1
+            except FileNotFoundError:
+                pass
+    jobs = vencidos.delete()[0]
+
+    en_uso = set(UgelExportJob.objects.exclude(archivo="").values_list("archivo", flat=True))
+    limite_seg = time.time() - _ttl().total_seconds()
+    for p in directorio.iterdir():
+        if not (_NOMBRE_EXPORT.match(p.name) or _NOMBRE_TMP.match(p.name)) or str(p) in en_uso:
+            continue
+        try:
+            if p.stat().st_mtime < limite_seg:
+                p.unlink()
+                archivos += 1
+        except FileNotFoundError:  # otro proceso lo borró primero
+            pass
+    return {"jobs": jobs, "archivos": archivos}
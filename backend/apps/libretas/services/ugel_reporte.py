@@ -0,0 +1,68 @@
+# backend/apps/libretas/services/ugel_reporte.py
+"""
+Archivo UGEL generado desde la BD (sin upload): una fila por alumno ×
+asignatura del grado/sección/año, con la convención de excel_adapter
+(A: alumnoId, B: alumno, C-F: B1..B4, G: curso, H: promedio, I: letra,
+J: comentario).
+
+Los promedios salen de ResumenNotaBimestre (mantenido desde Nota) con la
+misma regla que la libreta (ConsolidacionService.consolidar_bimestre):
+promedio exacto suma / cantidad por bimestre, un solo redondeo HALF_UP
+(calc_service.redondear_2) para cada columna B1..B4 y para el promedio
+final, que se calcula sobre los promedios sin redondear. Leídos con .iterator() (cursor del lado del servidor en
+PostgreSQL) y escritos con un Workbook write_only de openpyxl: ni la
+consulta ni el workbook quedan completos en memoria.
+"""
+from __future__ import annotations
+from decimal import Decimal
+from itertools import groupby
+from typing import IO, Any, Iterator, List, Optional
+
+from openpyxl import Workbook
+
+from ..models import ResumenNotaBimestre
+from .calc_service import nota_a_letra, redondear_2
+from .consolidacion_service import ConsolidacionService
+
+ENCABEZADO = ["alumnoId", "alumno", "B1", "B2", "B3", "B4", "curso", "promedio", "letra", "comentario"]
+
+
+def iter_filas_ugel(grado: str, seccion: str, anio: Optional[int] = None, lote: int = 2000) -> Iterator[List[Any]]:
+    """
+    Filas del archivo UGEL en orden de alumno (apellidos, nombres) y asignatura.
+    """
+    qs = ResumenNotaBimestre.objects.filter(bimestre__in=(1, 2, 3, 4))
+    ids = ConsolidacionService.grados_trabajados(grado, seccion, anio)
+    if ids is not None:
+        qs = qs.filter(alumno__idgrado_trabajado__in=ids)
+    filas = (
+        qs.order_by("alumno__apellidos", "alumno__nombres", "alumno_id", "asignatura_id", "bimestre")
+        .values_list("alumno_id", "alumno__apellidos", "alumno__nombres", "asignatura_id", "asignatura__nombre",
+                     "bimestre", "suma", "cantidad")
+        .iterator(chunk_size=lote)
+    )
+    for (aid, apellidos, nombres, _, curso), grupo in groupby(filas, key=lambda f: f[:5]):
+        bims: List[Optional[float]] = [None, None, None, None]
+        exactos: List[Decimal] = []
+        for *_, bimestre, suma, cantidad in grupo:
+            exacto = Decimal(suma or 0) / cantidad if cantidad else Decimal(0)
+            bims[bimestre - 1] = redondear_2(exacto)
+            exactos.append(exacto)
+        prom = redondear_2(sum(exactos) / len(exactos)) if exactos else 0.0
+        yield [aid, f"{apellidos}, {nombres}", *bims, curso, prom, nota_a_letra(prom), ""]
+
+
+def escribir_excel_ugel(destino: IO[bytes] | str, grado: str, seccion: str, anio: Optional[int] = None) -> int:
+    """
+    Escribe el .xlsx en 'destino' (ruta o archivo binario) en modo
+    write_only. Retorna la cantidad de filas de alumnos.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(f"Grado {grado}")
+    ws.append(ENCABEZADO)
+    n = 0
+    for fila in iter_filas_ugel(grado, seccion, anio):
+        ws.append(fila)
+        n += 1
+    wb.save(destino)
+    return n
@@ -1,11 +1,26 @@
 # backend/apps/libretas/services/ugel_service.py
 from __future__ import annotations
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from io import BytesIO
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
 from openpyxl import load_workbook
 
-from .excel_adapter import leer_base as _leer_base_info, iter_alumnos_hoja, escribir_rangos_consolidado
+from .excel_adapter import abrir_lectura, leer_base as _leer_base_info, iter_alumnos_hoja, escribir_rangos_consolidado
 from .calc_service import promedio_parciales, nota_a_letra
+from .consolidacion_vectorizada import _HAS_NUMPY, letras, promedio_filas
+from . import ugel_cache
+from .ugel_sesion import SesionDiferida, SesionLibro
+from .xlsx_parche import ParcheNoAplicable, exportar_parchando_hojas
+
+logger = logging.getLogger(__name__)
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+# Cada cuántas filas leídas se avisa el avance (ver construir_consolidado).
+_AVANCE_FILAS = 500
 
 def leer_base(upload_id: str) -> tuple[str, str, list[str]]:
     """
@@ -16,22 +31,71 @@ def leer_base(upload_id: str) -> tuple[str, str, list[str]]:
     info = _leer_base_info(upload_id)
     return (str(info.path), info.filename, list(info.sheetnames))
 
-def construir_consolidado(upload_id: str, grado: str, curso: str | None = None) -> List[dict]:
+def _filtrar_curso(filas: Iterable[dict], curso: str | None) -> List[dict]:
+    out: List[dict] = []
+    for row in filas:
+        if curso and row.get("curso"):
+            if str(row["curso"]).strip().lower() != str(curso).strip().lower():
+                continue
+        out.append(row)
+    return out
+
+def _con_avance(filas: Iterable[dict], al_avanzar: Callable[[int], None]) -> Iterable[dict]:
+    leidas = 0
+    for leidas, row in enumerate(filas, start=1):
+        yield row
+        if leidas % _AVANCE_FILAS == 0:
+            al_avanzar(leidas)
+    if leidas % _AVANCE_FILAS:
+        al_avanzar(leidas)
+
+def construir_consolidado(upload_id: str, grado: str, curso: str | None = None,
+                          sesion: SesionLibro | SesionDiferida | None = None,
+                          al_avanzar: Callable[[int], None] | None = None) -> List[dict]:
     """
     Lee el archivo y arma el consolidado filtrando por hoja 'grado'
     (si no existe, usa la primera). Filtra por 'curso' si está en hoja.
     Retorna: [{alumnoId, alumno, curso, B1..B4, promedio, letra}]
+    Con 'sesion' usa las filas ya parseadas; sin ella, la hoja se lee en
+    streaming (una sola apertura, solo valores). Una SesionDiferida no carga
+    el workbook si el resultado sale del cache.
+    El resultado se cachea por hash del archivo (ver ugel_cache): un upload
+    idéntico no vuelve a parsear ni a promediar.
+    'al_avanzar(filas_leidas)' se llama cada _AVANCE_FILAS filas leídas en
+    streaming y al terminar la hoja (para reportar avance).
     """
-    path, _, _ = leer_base(upload_id)
-    wb = load_workbook(path, data_only=True)
-    sheet = grado if grado and grado in wb.sheetnames else wb.sheetnames[0]
-    out: List[dict] = []
+    clave = None
+    if ugel_cache.habilitado():
+        archivo = ugel_cache.hash_archivo(sesion.path if sesion is not None else upload_id)
+        clave = ugel_cache.clave_consolidado(archivo, grado, curso)
+        guardado = ugel_cache.leer(clave)
+        if guardado is not None:
+            return guardado
 
-    for row in iter_alumnos_hoja(wb, sheet):
-        if curso and row.get("curso"):
-            if str(row["curso"]).strip().lower() != str(curso).strip().lower():
-                continue
-        prom = promedio_parciales(row.get("B1"), row.get("B2"), row.get("B3"), row.get("B4"))
+    if sesion is not None:
+        filas = _filtrar_curso(sesion.filas(sesion.hoja_para(grado)), curso)
+    else:
+        with abrir_lectura(upload_id) as wb:
+            sheet = grado if grado and grado in wb.sheetnames else wb.sheetnames[0]
+            filas = iter_alumnos_hoja(wb, sheet)
+            if al_avanzar:
+                filas = _con_avance(filas, al_avanzar)
+            filas = _filtrar_curso(filas, curso)
+
+    bims = ("B1", "B2", "B3", "B4")
+    if _HAS_NUMPY and filas:
+        # Promedio y letra de toda la hoja en una pasada vectorizada.
+        proms = promedio_filas([[_num(r.get(b)) for b in bims] for r in filas])
+        letras_hoja = letras(proms)
+        calculados = [(float(p), str(l)) for p, l in zip(proms, letras_hoja)]
+    else:
+        calculados = []
+        for r in filas:
+            prom = promedio_parciales(*(r.get(b) for b in bims))
+            calculados.append((round(prom, 2), nota_a_letra(prom)))
+
+    out: List[dict] = []
+    for row, (prom, letra) in zip(filas, calculados):
         out.append({
             "alumnoId": row["alumnoId"],
             "alumno": row["alumno"],
@@ -40,34 +104,125 @@ def construir_consolidado(upload_id: str, grado: str, curso: str | None = None)
             "B2": row.get("B2"),
             "B3": row.get("B3"),
             "B4": row.get("B4"),
-            "promedio": round(prom, 2),
-            "letra": nota_a_letra(prom),
+            "promedio": prom,
+            "letra": letra,
         })
+    if clave is not None:
+        ugel_cache.guardar(clave, out)
     return out
 
-def exportar_excel(upload_id: str, consolidado: list[dict], comentarios: list[dict]) -> bytes:
+
+def _num_workers() -> int:
+    return int(getattr(settings, "LIBRETAS_UGEL_WORKERS", 0) or os.cpu_count() or 1)
+
+def _get_pool() -> ProcessPoolExecutor:
+    # Un pool por proceso web, reutilizado entre requests (como libreta_render).
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=_num_workers())
+    return _POOL
+
+def _consolidar_hoja(path: str, hoja: str, curso: str | None) -> List[dict]:
+    # Corre en el pool: cada worker abre el archivo y lee su hoja en streaming.
+    return construir_consolidado(path, grado=hoja, curso=curso)
+
+def construir_consolidado_hojas(upload_id: str, curso: str | None = None,
+                                hojas: Iterable[str] | None = None,
+                                al_terminar_hoja: Callable[[str, List[dict]], None] | None = None,
+                                ) -> Dict[str, List[dict]]:
     """
-    Escribe promedio/letra/comentarios sobre el MISMO archivo,
-    manteniendo nombre/hojas/formatos. Retorna bytes del .xlsx.
-    Para S2, escribe en la primera hoja (dummy). En real: mapear por grado/curso.
+    Consolida todas las hojas del workbook (una por grado) o solo 'hojas'.
+    Retorna {hoja: consolidado} en el orden del workbook. Con más de una
+    hoja y más de un worker (LIBRETAS_UGEL_WORKERS), cada hoja se consolida
+    en un proceso del pool. 'al_terminar_hoja(hoja, consolidado)' se llama
+    a medida que termina cada hoja (para reportar avance).
     """
-    path, _, _ = leer_base(upload_id)
-    wb = load_workbook(path)
-    if not wb.sheetnames:
-        raise ValueError("El archivo no tiene hojas.")
-    hoja = wb.sheetnames[0]
+    nombres = list(_leer_base_info(upload_id).sheetnames)
+    if hojas is not None:
+        faltantes = [h for h in hojas if h not in nombres]
+        if faltantes:
+            raise KeyError(f"Hojas inexistentes: {', '.join(faltantes)}")
+        nombres = [h for h in nombres if h in set(hojas)]
+    resultados: Dict[str, List[dict]] = {}
+    if len(nombres) <= 1 or _num_workers() <= 1:
+        for h in nombres:
+            resultados[h] = construir_consolidado(upload_id, grado=h, curso=curso)
+            if al_terminar_hoja:
+                al_terminar_hoja(h, resultados[h])
+    else:
+        futuros = {_get_pool().submit(_consolidar_hoja, str(upload_id), h, curso): h for h in nombres}
+        for f in as_completed(futuros):
+            resultados[futuros[f]] = f.result()
+            if al_terminar_hoja:
+                al_terminar_hoja(futuros[f], resultados[futuros[f]])
+    return {h: resultados[h] for h in nombres}
 
-    comentarios_map = {c["alumnoId"]: c.get("texto", "") for c in (comentarios or [])}
+def _num(v):
+    # Celdas vacías o no numéricas se ignoran en el promedio (como None).
+    try:
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _filas_export(consolidado: list[dict], comentarios_map: dict) -> list[dict]:
     rows = []
     for c in consolidado:
         rows.append({
             "alumnoId": c["alumnoId"],
+            "curso": c.get("curso"),
             "promedio": c.get("promedio"),
             "letra": c.get("letra"),
             "comentario": comentarios_map.get(c["alumnoId"], ""),
         })
+    return rows
+
+def exportar_excel(upload_id: str, consolidado: list[dict], comentarios: list[dict],
+                   sesion: SesionLibro | SesionDiferida | None = None, modo: str | None = None) -> bytes:
+    """
+    Escribe promedio/letra/comentarios sobre el MISMO archivo,
+    manteniendo nombre/hojas/formatos. Retorna bytes del .xlsx.
+    Para S2, escribe en la primera hoja (dummy). En real: mapear por grado/curso.
+    Con 'sesion' escribe sobre el workbook ya cargado en vez de reabrirlo.
+    modo (o settings.LIBRETAS_UGEL_EXPORT_MODO): "openpyxl" (default) o
+    "ooxml", que parcha solo el XML de la hoja (ver xlsx_parche) y vuelve a
+    openpyxl si la hoja no se puede parchar.
+    """
+    comentarios_map = {c["alumnoId"]: c.get("texto", "") for c in (comentarios or [])}
+    return _exportar(upload_id, {None: _filas_export(consolidado, comentarios_map)}, sesion, modo)
+
+def exportar_excel_hojas(upload_id: str, consolidados: Dict[str, list[dict]], comentarios: list[dict],
+                         sesion: SesionLibro | SesionDiferida | None = None, modo: str | None = None) -> bytes:
+    """
+    Como exportar_excel, pero escribe el consolidado de cada hoja
+    ({hoja: consolidado}, ver construir_consolidado_hojas) en su hoja, en
+    un solo archivo.
+    """
+    comentarios_map = {c["alumnoId"]: c.get("texto", "") for c in (comentarios or [])}
+    return _exportar(upload_id, {h: _filas_export(c, comentarios_map) for h, c in consolidados.items()},
+                     sesion, modo)
+
+def _exportar(upload_id: str, filas_por_hoja: Dict[str | None, list[dict]],
+              sesion: SesionLibro | SesionDiferida | None, modo: str | None) -> bytes:
+    # Clave None = primera hoja.
+    modo = (modo or getattr(settings, "LIBRETAS_UGEL_EXPORT_MODO", "openpyxl") or "openpyxl").lower()
+    if modo == "ooxml":
+        try:
+            return exportar_parchando_hojas(sesion.path if sesion is not None else upload_id, filas_por_hoja)
+        except ParcheNoAplicable as e:
+            logger.info("Export UGEL con openpyxl: %s", e)
+
+    if sesion is not None:
+        wb = sesion.wb
+    else:
+        wb = load_workbook(upload_id)
+    if not wb.sheetnames:
+        raise ValueError("El archivo no tiene hojas.")
+    filas = {(h if h is not None else wb.sheetnames[0]): rows for h, rows in filas_por_hoja.items()}
 
-    escribir_rangos_consolidado(wb, hoja, rows)
+    if sesion is not None:
+        return sesion.exportar_hojas(filas)
+    for hoja, rows in filas.items():
+        escribir_rangos_consolidado(wb, hoja, rows)
     stream = BytesIO()
     wb.save(stream)
     return stream.getvalue()
@@ -0,0 +1,191 @@
+# backend/apps/libretas/services/ugel_sesion.py
+"""
+Sesión de workbook UGEL por token de upload.
+
+El flujo upload → consolidar → exportar abría el mismo .xlsx tres veces
+(hojas, lectura de filas y escritura). La sesión lo parsea una sola vez
+(modo normal, el que hace falta para escribir) y guarda:
+  - la lista de hojas;
+  - las filas de alumnos de cada hoja, parseadas al primer uso;
+  - el Workbook, sobre el que exportar() escribe H/I/J, serializa y
+    restaura los valores anteriores (la sesión queda igual que el archivo).
+
+Las sesiones viven en un LRU en memoria del proceso, acotado por cantidad
+(LIBRETAS_UGEL_SESIONES_MAX) y antigüedad (LIBRETAS_UGEL_SESION_TTL, en
+segundos). Si el archivo cambia en disco (mtime/tamaño), la sesión se
+descarta y se vuelve a cargar.
+
+Las vistas piden la sesión con sesion_diferida(): el workbook se carga recién
+cuando algo lo usa, así un consolidado servido desde ugel_cache (que sólo
+necesita la ruta) no paga el load_workbook.
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from openpyxl import load_workbook
+from openpyxl.workbook.workbook import Workbook
+
+from .excel_adapter import abrir_lectura, escribir_rangos_consolidado, iter_alumnos_hoja
+
+_BIMESTRES = ("B1", "B2", "B3", "B4")
+
+
+def _huella(path: Path) -> Tuple[float, int]:
+    st = os.stat(path)
+    return (st.st_mtime, st.st_size)
+
+
+def _tiene_formulas(filas: List[Dict[str, Any]]) -> bool:
+    return any(isinstance(f.get(b), str) and f[b].startswith("=") for f in filas for b in _BIMESTRES)
+
+
+@dataclass
+class SesionLibro:
+    clave: str
+    path: Path
+    huella: Tuple[float, int]
+    wb: Workbook
+    creada: float = field(default_factory=time.monotonic)
+    _filas: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+    # El Workbook no es thread-safe: lecturas y export de una misma sesión se serializan.
+    lock: threading.RLock = field(default_factory=threading.RLock)
+
+    @property
+    def filename(self) -> str:
+        return self.path.name
+
+    @property
+    def sheetnames(self) -> List[str]:
+        return list(self.wb.sheetnames)
+
+    def hoja_para(self, grado: Optional[str]) -> str:
+        """Hoja 'grado' si existe; si no, la primera (como construir_consolidado)."""
+        if not self.wb.sheetnames:
+            raise ValueError("El archivo no tiene hojas.")
+        return grado if grado and grado in self.wb.sheetnames else self.wb.sheetnames[0]
+
+    def filas(self, hoja: str) -> List[Dict[str, Any]]:
+        """
+        Filas de alumnos de la hoja (convención de iter_alumnos_hoja). El
+        Workbook se cargó sin data_only para no perder fórmulas al exportar;
+        si la hoja trae fórmulas en B1..B4, sus valores calculados se leen
+        una vez en streaming.
+        """
+        with self.lock:
+            if hoja not in self._filas:
+                filas = list(iter_alumnos_hoja(self.wb, hoja))
+                if _tiene_formulas(filas):
+                    with abrir_lectura(self.path) as wb_valores:
+                        filas = list(iter_alumnos_hoja(wb_valores, hoja))
+                self._filas[hoja] = filas
+            return self._filas[hoja]
+
+    def exportar(self, hoja: str, rows: Iterable[Dict[str, Any]]) -> bytes:
+        return self.exportar_hojas({hoja: rows})
+
+    def exportar_hojas(self, filas_por_hoja: Dict[str, Iterable[Dict[str, Any]]]) -> bytes:
+        """
+        Escribe promedio/letra/comentario en cada hoja y devuelve el .xlsx.
+        Las celdas escritas vuelven a su valor anterior antes de liberar la
+        sesión, para que un export no contamine al siguiente.
+        """
+        with self.lock:
+            previos = []
+            try:
+                for hoja, rows in filas_por_hoja.items():
+                    previos.append((self.wb[hoja], escribir_rangos_consolidado(self.wb, hoja, rows)))
+                stream = BytesIO()
+                self.wb.save(stream)
+                return stream.getvalue()
+            finally:
+                for ws, celdas in reversed(previos):
+                    for fila, columna, valor in reversed(celdas):
+                        ws.cell(row=fila, column=columna).value = valor
+
+
+_SESIONES: "OrderedDict[str, SesionLibro]" = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _max_sesiones() -> int:
+    return max(0, int(getattr(settings, "LIBRETAS_UGEL_SESIONES_MAX", 8)))
+
+
+def _ttl() -> float:
+    return float(getattr(settings, "LIBRETAS_UGEL_SESION_TTL", 600))
+
+
+def _vigente(sesion: SesionLibro, huella: Tuple[float, int]) -> bool:
+    return sesion.huella == huella and time.monotonic() - sesion.creada <= _ttl()
+
+
+def obtener_sesion(clave: str, path: str | Path) -> SesionLibro:
+    """
+    Sesión del upload 'clave' (token, o la ruta en el modo de compatibilidad).
+    Carga el workbook si no hay sesión vigente para ese archivo.
+    """
+    p = Path(path)
+    huella = _huella(p)
+    with _LOCK:
+        sesion = _SESIONES.get(clave)
+        if sesion is not None and sesion.path == p and _vigente(sesion, huella):
+            _SESIONES.move_to_end(clave)
+            return sesion
+        _SESIONES.pop(clave, None)
+
+    # La carga se hace fuera del lock global: otro upload no espera a este.
+    sesion = SesionLibro(clave=clave, path=p, huella=huella, wb=load_workbook(p))
+    if _max_sesiones() == 0:
+        return sesion
+    with _LOCK:
+        _SESIONES[clave] = sesion
+        _SESIONES.move_to_end(clave)
+        ahora = time.monotonic()
+        for k in [k for k, s in _SESIONES.items() if ahora - s.creada > _ttl()]:
+            del _SESIONES[k]
+        while len(_SESIONES) > _max_sesiones():
+            _SESIONES.popitem(last=False)
+    return sesion
+
+
+class SesionDiferida:
+    """
+    Sesión que se obtiene con obtener_sesion() al primer uso. 'path' está
+    disponible sin cargar nada; cualquier otro atributo carga el workbook.
+    """
+
+    def __init__(self, clave: str, path: str | Path):
+        self.clave = clave
+        self.path = Path(path)
+        self._sesion: Optional[SesionLibro] = None
+
+    @property
+    def cargada(self) -> bool:
+        return self._sesion is not None
+
+    def __getattr__(self, nombre: str) -> Any:
+        if self._sesion is None:
+            self._sesion = obtener_sesion(self.clave, self.path)
+        return getattr(self._sesion, nombre)
+
+
+def sesion_diferida(clave: str, path: str | Path) -> SesionDiferida:
+    return SesionDiferida(clave, path)
+
+
+def descartar_sesion(clave: str) -> None:
+    with _LOCK:
+        _SESIONES.pop(clave, None)
+
+
+def limpiar_sesiones() -> None:
+    with _LOCK:
+        _SESIONES.clear()
@@ -0,0 +1,217 @@
+# backend/apps/libretas/services/ugel_upload_parcial.py
+"""
+Upload UGEL por partes, reanudable (para conexiones que se cortan).
+
+Protocolo:
+  1. iniciar(nombre, tamaño) -> UgelUploadParcial con recibidos=0.
+  2. agregar(id, offset, stream) recibe la parte en un archivo temporal
+     propio, sin pasar por memoria completa, y la copia al .part de
+     UPLOAD_TMP_DIR solo si gana el avance de 'recibidos'. 'offset' debe
+     ser igual a 'recibidos'; si no, ErrorSubida OFFSET_MISMATCH con el
+     offset correcto para que el cliente retome desde ahí.
+  3. finalizar(id, sha256) verifica el checksum y la estructura del .xlsx
+     (zip, [Content_Types].xml, workbook con al menos una hoja, tamaño
+     descomprimido) leyendo solo el índice del zip y el XML del workbook,
+     sin openpyxl, y registra el archivo como un upload normal
+     (ugel_uploads.registrar_archivo).
+
+Límites: LIBRETAS_UGEL_UPLOAD_MAX_BYTES (tamaño declarado),
+LIBRETAS_UGEL_UPLOAD_PARTE_MAX_BYTES (por request) y
+LIBRETAS_UGEL_UPLOAD_MAX_DESCOMPRIMIDO (suma de partes del zip).
+"""
+from __future__ import annotations
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import timedelta
+from typing import BinaryIO, List, Tuple
+from xml.etree import ElementTree as ET
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import UgelUpload, UgelUploadParcial
+from . import ugel_uploads
+from .xlsx_parche import ParcheNoAplicable, rutas_hojas
+
+_BLOQUE = 64 * 1024
+
+
+class ErrorSubida(Exception):
+    """Error del protocolo; la vista lo responde como {"code", "detail", ...extra}."""
+
+    def __init__(self, code: str, detail: str, status: int = 400, **extra):
+        super().__init__(detail)
+        self.code = code
+        self.detail = detail
+        self.status = status
+        self.extra = extra
+
+
+def _max_bytes() -> int:
+    return int(getattr(settings, "LIBRETAS_UGEL_UPLOAD_MAX_BYTES", 100 * 1024 ** 2))
+
+
+def max_parte() -> int:
+    return int(getattr(settings, "LIBRETAS_UGEL_UPLOAD_PARTE_MAX_BYTES", 8 * 1024 ** 2))
+
+
+def _max_descomprimido() -> int:
+    return int(getattr(settings, "LIBRETAS_UGEL_UPLOAD_MAX_DESCOMPRIMIDO", 1024 ** 3))
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, "LIBRETAS_UGEL_UPLOAD_PARCIAL_TTL", 24 * 3600)))
+
+
+def iniciar(nombre_original: str, tamano: int) -> UgelUploadParcial:
+    if not nombre_original or not nombre_original.lower().endswith(".xlsx"):
+        raise ErrorSubida("INVALID_FILE_TYPE", "Solo archivos .xlsx permitidos")
+    if tamano <= 0:
+        raise ErrorSubida("INVALID_SIZE", "El tamaño debe ser mayor que 0")
+    if tamano > _max_bytes():
+        raise ErrorSubida("FILE_TOO_LARGE", f"El archivo supera {_max_bytes()} bytes", status=413)
+    parcial = UgelUploadParcial.objects.create(
+        nombre_original=nombre_original, tamano=tamano, expira_en=timezone.now() + _ttl(),
+    )
+    ugel_uploads.ruta_parcial(parcial.id).touch()
+    return parcial
+
+
+def obtener(parcial_id) -> UgelUploadParcial:
+    parcial = UgelUploadParcial.objects.filter(pk=parcial_id, expira_en__gt=timezone.now()).first()
+    if parcial is None or not ugel_uploads.ruta_parcial(parcial_id).is_file():
+        raise ErrorSubida("UPLOAD_NOT_FOUND", "Upload no encontrado o expirado", status=404)
+    return parcial
+
+
+def agregar(parcial_id, offset: int, stream: BinaryIO) -> UgelUploadParcial:
+    """
+    Escribe la parte que empieza en 'offset'. Las partes van en orden: un
+    reintento de la misma parte (el cliente no recibió la respuesta) llega
+    con un offset viejo y recibe OFFSET_MISMATCH con el actual.
+
+    Dos PUT concurrentes con el mismo offset reciben cada uno en su propio
+    temporal; solo el que avanza 'recibidos' (UPDATE condicional, que
+    retiene la fila hasta el commit) toca el .part.
+    """
+    parcial = obtener(parcial_id)
+    if offset != parcial.recibidos:
+        raise ErrorSubida("OFFSET_MISMATCH", f"Se esperaba offset {parcial.recibidos}", status=409,
+                          offset=parcial.recibidos)
+    limite = min(max_parte(), parcial.tamano - offset)
+    ruta = ugel_uploads.ruta_parcial(parcial_id)
+    # Nombre que barrer() reconoce: si el proceso muere, el temporal se borra tras la gracia.
+    fd, tmp = tempfile.mkstemp(dir=ruta.parent, prefix="ugel_parte_", suffix=".part")
+    try:
+        escritos = 0
+        with os.fdopen(fd, "wb") as f:
+            for bloque in iter(lambda: stream.read(_BLOQUE), b""):
+                escritos += len(bloque)
+                if escritos > limite:
+                    raise ErrorSubida("CHUNK_TOO_LARGE",
+                                      f"La parte excede {limite} bytes (máximo por parte o tamaño declarado)",
+                                      status=413, offset=offset)
+                f.write(bloque)
+        if escritos == 0:
+            raise ErrorSubida("EMPTY_CHUNK", "La parte no trae datos", offset=offset)
+
+        with transaction.atomic():
+            # Solo avanza si nadie más avanzó mientras tanto.
+            avanzado = UgelUploadParcial.objects.filter(pk=parcial.pk, recibidos=offset).update(
+                recibidos=offset + escritos, expira_en=timezone.now() + _ttl(),
+            )
+            if avanzado:
+                with open(tmp, "rb") as src, open(ruta, "r+b") as dst:
+                    dst.seek(offset)
+                    dst.truncate()  # restos de una copia anterior que falló
+                    shutil.copyfileobj(src, dst, _BLOQUE)
+    finally:
+        os.unlink(tmp)
+
+    if not avanzado:
+        actual = UgelUploadParcial.objects.filter(pk=parcial.pk).values_list("recibidos", flat=True).first()
+        if actual is None:  # descartado o finalizado mientras llegaba la parte
+            raise ErrorSubida("UPLOAD_NOT_FOUND", "Upload no encontrado o expirado", status=404)
+        raise ErrorSubida("OFFSET_MISMATCH", f"Se esperaba offset {actual}", status=409, offset=actual)
+    parcial.refresh_from_db()
+    return parcial
+
+
+def _sha256(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def validar_xlsx(path) -> List[str]:
+    """
+    Valida la estructura del .xlsx sin cargarlo en openpyxl: zip legible,
+    partes mínimas, al menos una hoja con su XML presente y tamaño
+    descomprimido acotado (evita bombas zip). Retorna los nombres de hoja.
+    """
+    if not zipfile.is_zipfile(path):
+        raise ErrorSubida("INVALID_XLSX", "El archivo no es un .xlsx (zip) válido")
+    try:
+        with zipfile.ZipFile(path) as zf:
+            infos = zf.infolist()
+            nombres = {i.filename for i in infos}
+            faltantes = [n for n in ("[Content_Types].xml", "xl/workbook.xml", "xl/_rels/workbook.xml.rels")
+                         if n not in nombres]
+            if faltantes:
+                raise ErrorSubida("INVALID_XLSX", f"Faltan partes del .xlsx: {', '.join(faltantes)}")
+            if sum(i.file_size for i in infos) > _max_descomprimido():
+                raise ErrorSubida("FILE_TOO_LARGE",
+                                  f"El contenido descomprimido supera {_max_descomprimido()} bytes", status=413)
+            hojas = rutas_hojas(zf)
+    except ValueError:  # rutas_hojas sin hojas en el workbook
+        raise ErrorSubida("NO_SHEETS", "El archivo no tiene hojas")
+    except (zipfile.BadZipFile, ET.ParseError, KeyError, ParcheNoAplicable) as e:
+        raise ErrorSubida("INVALID_XLSX", f"El .xlsx está dañado: {e}")
+    sin_xml = [h for h, ruta in hojas.items() if ruta not in nombres]
+    if sin_xml:
+        raise ErrorSubida("INVALID_XLSX", f"Hojas sin contenido: {', '.join(sin_xml)}")
+    return list(hojas)
+
+
+def finalizar(parcial_id, sha256: str) -> Tuple[UgelUpload, List[str]]:
+    """
+    Cierra el upload: checksum, validación y registro. Si el archivo no
+    pasa, el upload parcial se descarta (hay que volver a subirlo).
+    Retorna (UgelUpload, hojas).
+    """
+    sha256 = (sha256 or "").strip().lower()
+    if not sha256:
+        raise ErrorSubida("CHECKSUM_REQUIRED", "Falta sha256 del archivo completo")
+    parcial = obtener(parcial_id)
+    if parcial.recibidos != parcial.tamano:
+        raise ErrorSubida("UPLOAD_INCOMPLETE", f"Faltan {parcial.tamano - parcial.recibidos} bytes",
+                          status=409, offset=parcial.recibidos)
+    # Tomar el upload: un finalize concurrente del mismo id ya no lo encuentra.
+    if not UgelUploadParcial.objects.filter(pk=parcial.pk, recibidos=parcial.tamano).delete()[0]:
+        raise ErrorSubida("UPLOAD_NOT_FOUND", "Upload no encontrado o expirado", status=404)
+
+    ruta = ugel_uploads.ruta_parcial(parcial.pk)
+    try:
+        real = _sha256(ruta)
+        if real != sha256:
+            raise ErrorSubida("CHECKSUM_MISMATCH", f"sha256 no coincide (recibido {real})")
+        hojas = validar_xlsx(ruta)
+    except Exception:
+        if os.path.exists(ruta):
+            os.unlink(ruta)
+        raise
+    upload = ugel_uploads.registrar_archivo(ruta, real, parcial.tamano, parcial.nombre_original)
+    return upload, hojas
+
+
+def descartar(parcial_id) -> None:
+    UgelUploadParcial.objects.filter(pk=parcial_id).delete()
+    ruta = ugel_uploads.ruta_parcial(parcial_id)
+    if os.path.exists(ruta):
+        os.unlink(ruta)
@@ -0,0 +1,176 @@
+# backend/apps/libretas/services/ugel_uploads.py
+"""
+Registro de uploads UGEL compartido entre procesos (tabla UgelUpload).
+
+- registrar(): guarda el archivo en UPLOAD_TMP_DIR como <sha256>.xlsx
+  (un upload idéntico reutiliza el archivo existente) y crea el token con
+  vencimiento LIBRETAS_UGEL_UPLOAD_TTL.
+- registrar_archivo(): lo mismo para un archivo ya escrito en
+  UPLOAD_TMP_DIR (el upload por partes, ver ugel_upload_parcial).
+- resolver(): token -> UgelUpload vigente (None si no existe, venció o el
+  archivo ya no está), actualizando ultimo_uso.
+- barrer(): borra tokens y uploads por partes vencidos, desaloja los menos
+  usados si el total en disco supera LIBRETAS_UGEL_UPLOADS_MAX_BYTES y
+  elimina los archivos que ya no referencia ningún token, export pendiente
+  ni upload por partes. Lo corre
+  registrar() y el comando 'manage.py limpiar_uploads_ugel' (cron).
+"""
+from __future__ import annotations
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import UgelExportJob, UgelUpload, UgelUploadParcial
+
+logger = logging.getLogger(__name__)
+
+# Solo se borran archivos con estos nombres: UPLOAD_TMP_DIR puede ser el /tmp del sistema.
+_NOMBRE_ARCHIVO = re.compile(r"^[0-9a-f]{64}\.xlsx$")
+_NOMBRE_PARCIAL = re.compile(r"^ugel_\w+\.part$")
+# Un archivo recién escrito puede no tener todavía su fila (otro worker está en registrar()).
+_GRACIA_SEG = 300
+
+
+def directorio() -> Path:
+    d = Path(getattr(settings, "UPLOAD_TMP_DIR", tempfile.gettempdir()))
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+def ruta_parcial(parcial_id) -> Path:
+    """Archivo .part de un upload por partes (UgelUploadParcial)."""
+    return directorio() / f"ugel_parcial_{uuid.UUID(str(parcial_id)).hex}.part"
+
+
+def _ttl() -> timedelta:
+    return timedelta(seconds=int(getattr(settings, "LIBRETAS_UGEL_UPLOAD_TTL", 24 * 3600)))
+
+
+def _max_bytes() -> int:
+    return int(getattr(settings, "LIBRETAS_UGEL_UPLOADS_MAX_BYTES", 0))  # 0 = sin límite
+
+
+def registrar(django_file, nombre_original: Optional[str] = None) -> UgelUpload:
+    """
+    Guarda el archivo (hash en streaming mientras se escribe) y crea su token.
+    """
+    d = directorio()
+    h = hashlib.sha256()
+    tamano = 0
+    fd, tmp = tempfile.mkstemp(dir=d, prefix="ugel_", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in django_file.chunks():
+                h.update(chunk)
+                tamano += len(chunk)
+                f.write(chunk)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return registrar_archivo(tmp, h.hexdigest(), tamano, nombre_original or django_file.name)
+
+
+def registrar_archivo(tmp: str | Path, sha256: str, tamano: int, nombre_original: str) -> UgelUpload:
+    """
+    Mueve un archivo ya escrito en directorio() (con su hash calculado) a
+    <sha256>.xlsx y crea el token. Lo usan registrar() y el upload por partes.
+    """
+    destino = directorio() / f"{sha256}.xlsx"
+    try:
+        if destino.is_file():
+            os.unlink(tmp)  # contenido idéntico ya guardado
+            os.utime(destino)  # renueva la gracia frente a un barrido concurrente
+        else:
+            os.replace(tmp, destino)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+    ahora = timezone.now()
+    upload = UgelUpload.objects.create(
+        ruta=str(destino), nombre_original=nombre_original, sha256=sha256,
+        tamano=tamano, ultimo_uso=ahora, expira_en=ahora + _ttl(),
+    )
+    try:
+        barrer(conservar=upload.token)
+    except Exception:  # el barrido nunca debe romper un upload
+        logger.exception("No se pudo barrer uploads UGEL")
+    return upload
+
+
+def resolver(token: str) -> Optional[UgelUpload]:
+    try:
+        uuid.UUID(str(token))
+    except ValueError:
+        return None
+    ahora = timezone.now()
+    upload = UgelUpload.objects.filter(token=token, expira_en__gt=ahora).first()
+    if upload is None or not os.path.isfile(upload.ruta):
+        return None
+    UgelUpload.objects.filter(token=upload.token).update(ultimo_uso=ahora)
+    return upload
+
+
+def barrer(conservar=None) -> Dict[str, int]:
+    """
+    Limpieza de tokens vencidos, cuota de disco y archivos huérfanos.
+    'conservar' es un token que no se desaloja (el upload recién creado).
+    """
+    ahora = timezone.now()
+    tokens = UgelUpload.objects.filter(expira_en__lte=ahora).delete()[0]
+    tokens += UgelUploadParcial.objects.filter(expira_en__lte=ahora).delete()[0]
+
+    desalojados = set()
+    limite = _max_bytes()
+    if limite:
+        # Cada archivo cuenta una vez aunque lo compartan varios tokens.
+        por_archivo = {}
+        for sha, tamano, uso in UgelUpload.objects.order_by("ultimo_uso").values_list("sha256", "tamano", "ultimo_uso"):
+            por_archivo[sha] = (tamano, uso)
+        total = sum(t for t, _ in por_archivo.values())
+        protegido = (UgelUpload.objects.filter(token=conservar).values_list("sha256", flat=True).first()
+                     if conservar else None)
+        for sha, (tamano, _) in sorted(por_archivo.items(), key=lambda kv: kv[1][1]):
+            if total <= limite:
+                break
+            if sha == protegido:
+                continue
+            tokens += UgelUpload.objects.filter(sha256=sha).delete()[0]
+            desalojados.add(f"{sha}.xlsx")
+            total -= tamano
+
+    en_uso = set(UgelUpload.objects.values_list("ruta", flat=True))
+    # Un export asíncrono pendiente sigue necesitando su archivo aunque el token haya vencido.
+    en_uso |= set(UgelExportJob.objects.filter(estado__in=["PENDIENTE", "EN_PROCESO"])
+                  .values_list("ruta", flat=True))
+    # Y un upload por partes vigente, aunque lleve rato sin recibir bytes.
+    en_uso |= {str(ruta_parcial(i)) for i in UgelUploadParcial.objects.values_list("id", flat=True)}
+    archivos = 0
+    limite_gracia = time.time() - _GRACIA_SEG
+    for p in directorio().iterdir():
+        if not (_NOMBRE_ARCHIVO.match(p.name) or _NOMBRE_PARCIAL.match(p.name)) or str(p) in en_uso:
+            continue
+        try:
+            if p.name in desalojados or p.stat().st_mtime < limite_gracia:
+                p.unlink()
+                archivos += 1
+        except FileNotFoundError:  # otro worker lo borró primero
+            pass
+    return {"tokens": tokens, "archivos": archivos}
+
+
+def bytes_en_disco() -> int:
+    """Total de bytes de los archivos vigentes (sin contar duplicados)."""
+    return sum(dict(UgelUpload.objects.values_list("sha256", "tamano")).values())
@@ -0,0 +1,297 @@
+# backend/apps/libretas/services/xlsx_parche.py
+"""
+Export UGEL parchando el XML de la hoja directamente (sin openpyxl).
+
+Copia el .xlsx entrada por entrada: todas las partes pasan sin cambios
+(mismo contenido, nombre, fecha y compresión) salvo el XML de las hojas
+destino, que se reescriben en streaming fila por fila para poner
+promedio/letra/comentario en H/I/J de las filas cuyo alumnoId (col A) y
+curso (col G) están en el consolidado, con el mismo emparejamiento que
+escribir_rangos_consolidado (excel_adapter.buscar_alumno_curso). Así se conserva todo lo que openpyxl no entiende
+(validaciones, formatos condicionales raros, macros, imágenes...).
+
+Los textos se escriben como inlineStr para no tocar sharedStrings.xml.
+Si la hoja no se puede parchar con seguridad (celdas sin referencia,
+fórmulas en H/I/J que habría que sacar de calcChain...), se lanza
+ParcheNoAplicable y el llamador usa el export con openpyxl.
+"""
+from __future__ import annotations
+import posixpath
+import re
+import shutil
+import zipfile
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+
+from .excel_adapter import buscar_alumno_curso, indice_alumno_curso
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Columnas destino (como escribir_rangos_consolidado): H promedio, I letra, J comentario.
+_COL_PROMEDIO, _COL_LETRA, _COL_COMENTARIO = 8, 9, 10
+_COL_CURSO = 7
+
+# (alumnoId, curso) -> {columna: valor}; ver excel_adapter.indice_alumno_curso.
+Valores = Dict[Tuple[Any, Any], Dict[int, Any]]
+
+_CHUNK = 1 << 20
+
+_RE_FILA = re.compile(rb"<row\b[^>]*?/>|<row\b[^>]*>.*?</row>", re.S)
+_RE_CELDA = re.compile(rb"<c\b[^>]*?/>|<c\b[^>]*>.*?</c>", re.S)
+_RE_REF = re.compile(rb'\br="([A-Z]+)(\d+)"')
+_RE_ATTR_S = re.compile(rb'\ss="(\d+)"')
+_RE_ATTR_T = re.compile(rb'\st="(\w+)"')
+_RE_V = re.compile(rb"<v>(.*?)</v>", re.S)
+_RE_T = re.compile(rb"<t\b[^>]*>(.*?)</t>", re.S)
+_RE_SPANS = re.compile(rb'\bspans="(\d+):(\d+)"')
+_RE_DIMENSION = re.compile(rb'<dimension\s+ref="([A-Z]+\d+):([A-Z]+)(\d+)"')
+
+
+class ParcheNoAplicable(Exception):
+    pass
+
+
+def _col_a_indice(letras: bytes) -> int:
+    n = 0
+    for ch in letras.decode("ascii"):
+        n = n * 26 + (ord(ch) - 64)
+    return n
+
+
+def _indice_a_col(n: int) -> str:
+    s = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+def _desescapar(texto: bytes) -> str:
+    t = texto.decode("utf-8")
+    return (t.replace("&lt;", "<").replace("&gt;", ">").replace("&quot;", '"')
+            .replace("&apos;", "'").replace("&amp;", "&"))
+
+
+def rutas_hojas(zf: zipfile.ZipFile) -> Dict[str, str]:
+    """
+    Nombre de hoja -> ruta de su XML dentro del zip, en el orden del
+    workbook. Lee solo workbook.xml y sus relaciones (también sirve para
+    validar un upload sin cargarlo). ValueError si no hay hojas;
+    ParcheNoAplicable si falta la relación de alguna.
+    """
+    wb = ET.fromstring(zf.read("xl/workbook.xml"))
+    rels = ET.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    destinos = {rel.get("Id"): rel.get("Target", "") for rel in rels.iter(f"{_NS_PKG_REL}Relationship")}
+    rutas: Dict[str, str] = {}
+    for hoja in wb.iterfind(f"{_NS_MAIN}sheets/{_NS_MAIN}sheet"):
+        rid = hoja.get(f"{_NS_REL}id")
+        target = destinos.get(rid)
+        if target is None:
+            raise ParcheNoAplicable(f"No se encontró la relación {rid} de la hoja {hoja.get('name')}.")
+        rutas[hoja.get("name")] = (target.lstrip("/") if target.startswith("/")
+                                   else posixpath.normpath(posixpath.join("xl", target)))
+    if not rutas:
+        raise ValueError("El archivo no tiene hojas.")
+    return rutas
+
+
+def _primera_hoja(zf: zipfile.ZipFile) -> str:
+    """Ruta dentro del zip del XML de la primera hoja (wb.sheetnames[0])."""
+    return next(iter(rutas_hojas(zf).values()))
+
+
+def _shared_strings(zf: zipfile.ZipFile) -> List[str]:
+    try:
+        data = zf.read("xl/sharedStrings.xml")
+    except KeyError:
+        return []
+    out = []
+    for si in ET.fromstring(data).iter(f"{_NS_MAIN}si"):
+        # Texto plano o runs (<r><t>); se ignoran las guías fonéticas (<rPh>).
+        partes = [t.text or "" for t in si.findall(f"{_NS_MAIN}t")]
+        partes += [t.text or "" for r in si.findall(f"{_NS_MAIN}r") for t in r.findall(f"{_NS_MAIN}t")]
+        out.append("".join(partes))
+    return out
+
+
+def _valor_celda(celda: bytes, compartidos: List[str]) -> Any:
+    """Valor de la celda como lo devuelve openpyxl (int/float, str, bool)."""
+    m_t = _RE_ATTR_T.search(celda.split(b">", 1)[0])
+    tipo = m_t.group(1) if m_t else b"n"
+    if tipo == b"inlineStr":
+        return "".join(_desescapar(t) for t in _RE_T.findall(celda))
+    m_v = _RE_V.search(celda)
+    if m_v is None:
+        return None
+    v = m_v.group(1)
+    if tipo == b"s":
+        return compartidos[int(v)]
+    if tipo in (b"str", b"e"):
+        return _desescapar(v)
+    if tipo == b"b":
+        return v == b"1"
+    texto = v.decode("ascii").strip()
+    try:
+        return float(texto) if any(c in texto for c in ".eE") else int(texto)
+    except ValueError:
+        return texto
+
+
+def _celda_xml(ref: bytes, estilo: Optional[bytes], valor: Any) -> bytes:
+    s = b' s="' + estilo + b'"' if estilo else b""
+    if isinstance(valor, float):
+        return b'<c r="' + ref + b'"' + s + b"><v>" + repr(valor).encode("ascii") + b"</v></c>"
+    texto = escape(str(valor))
+    if not texto:
+        # openpyxl no guarda valor para "": la celda queda vacía (con su estilo).
+        return b'<c r="' + ref + b'"' + s + b"/>"
+    preservar = ' xml:space="preserve"' if texto != texto.strip() else ""
+    return (b'<c r="' + ref + b'"' + s + b' t="inlineStr"><is><t' + preservar.encode("ascii") + b">"
+            + texto.encode("utf-8") + b"</t></is></c>")
+
+
+def _parchar_fila(fila: bytes, valores_por_id: Valores, compartidos: List[str]) -> bytes:
+    if fila.endswith(b"/>") and b"</row>" not in fila:
+        return fila
+    apertura_fin = fila.index(b">") + 1
+    apertura, cuerpo = fila[:apertura_fin], fila[apertura_fin:-len(b"</row>")]
+
+    celdas: List[Tuple[int, bytes, bytes]] = []  # (columna, fila_ref, xml)
+    for m in _RE_CELDA.finditer(cuerpo):
+        xml = m.group(0)
+        ref = _RE_REF.search(xml.split(b">", 1)[0])
+        if ref is None:
+            raise ParcheNoAplicable("Celdas sin referencia 'r'.")
+        celdas.append((_col_a_indice(ref.group(1)), ref.group(2), xml))
+    if not celdas or celdas[0][0] != 1:
+        return fila
+    curso = next((_valor_celda(xml, compartidos) for c, _, xml in celdas if c == _COL_CURSO), None)
+    valores = buscar_alumno_curso(valores_por_id, _valor_celda(celdas[0][2], compartidos), curso)
+    if not valores:
+        return fila
+
+    num_fila = celdas[0][1]
+    por_col = {c: (xml, i) for i, (c, _, xml) in enumerate(celdas)}
+    nuevas = {c: xml for c, _, xml in celdas}
+    for col, valor in valores.items():
+        previa = por_col.get(col)
+        estilo = None
+        if previa is not None:
+            cab = previa[0].split(b">", 1)[0]
+            if b"<f" in previa[0]:
+                raise ParcheNoAplicable(f"La celda {_indice_a_col(col)}{num_fila.decode()} tiene fórmula.")
+            m_s = _RE_ATTR_S.search(cab)
+            estilo = m_s.group(1) if m_s else None
+        ref = _indice_a_col(col).encode("ascii") + num_fila
+        nuevas[col] = _celda_xml(ref, estilo, valor)
+
+    m_sp = _RE_SPANS.search(apertura)
+    if m_sp and int(m_sp.group(2)) < max(nuevas):
+        apertura = apertura[:m_sp.start()] + b'spans="' + m_sp.group(1) + b":" + str(max(nuevas)).encode() \
+            + b'"' + apertura[m_sp.end():]
+    return apertura + b"".join(nuevas[c] for c in sorted(nuevas)) + b"</row>"
+
+
+def _ampliar_dimension(xml: bytes) -> bytes:
+    m = _RE_DIMENSION.search(xml)
+    if m and _col_a_indice(m.group(2)) < _COL_COMENTARIO:
+        nuevo = b'<dimension ref="' + m.group(1) + b":" + _indice_a_col(_COL_COMENTARIO).encode() + m.group(3) + b'"'
+        return xml[:m.start()] + nuevo + xml[m.end():]
+    return xml
+
+
+def _copia_info(info: zipfile.ZipInfo) -> zipfile.ZipInfo:
+    """ZipInfo nuevo con nombre, fecha, compresión y atributos de la entrada original."""
+    nuevo = zipfile.ZipInfo(info.filename, info.date_time)
+    nuevo.compress_type = info.compress_type
+    nuevo.create_system = info.create_system
+    nuevo.external_attr = info.external_attr
+    nuevo.comment = info.comment
+    nuevo.file_size = info.file_size  # solo para decidir zip64; se recalcula al escribir
+    return nuevo
+
+
+def _parchar_hoja(origen, valores_por_id: Valores, compartidos: List[str]) -> Iterator[bytes]:
+    """
+    Lee el XML de la hoja por bloques y emite el XML parchado. Solo se
+    retiene en memoria la fila incompleta al final de cada bloque.
+    """
+    buffer = b""
+    primero = True
+    while True:
+        bloque = origen.read(_CHUNK)
+        buffer += bloque
+        if primero and (b"<sheetData" in buffer or not bloque):
+            buffer = _ampliar_dimension(buffer)
+            primero = False
+        if primero:
+            continue
+        salida, ultimo = [], 0
+        for m in _RE_FILA.finditer(buffer):
+            salida.append(buffer[ultimo:m.start()])
+            salida.append(_parchar_fila(m.group(0), valores_por_id, compartidos))
+            ultimo = m.end()
+        if not bloque:
+            salida.append(buffer[ultimo:])
+            yield b"".join(salida)
+            return
+        # Lo que sigue a la última fila completa puede ser una fila cortada.
+        inicio_pendiente = buffer.find(b"<row", ultimo)
+        corte = inicio_pendiente if inicio_pendiente != -1 else max(ultimo, len(buffer) - 16)
+        salida.append(buffer[ultimo:corte])
+        buffer = buffer[corte:]
+        yield b"".join(salida)
+
+
+def _valores_item(item: Dict[str, Any]) -> Dict[int, Any]:
+    valores: Dict[int, Any] = {}
+    if "promedio" in item:
+        valores[_COL_PROMEDIO] = float(item["promedio"])
+    if "letra" in item:
+        valores[_COL_LETRA] = str(item["letra"])
+    if "comentario" in item:
+        valores[_COL_COMENTARIO] = str(item["comentario"])
+    return valores
+
+
+def _valores_por_id(rows: Iterable[Dict[str, Any]]) -> Valores:
+    return indice_alumno_curso(rows, _valores_item)
+
+
+def exportar_parchando(path: str | Path, rows: Iterable[Dict[str, Any]]) -> bytes:
+    """
+    Igual que escribir_rangos_consolidado + save sobre la primera hoja, pero
+    copiando el zip y reescribiendo solo el XML de esa hoja.
+    """
+    return exportar_parchando_hojas(path, {None: rows})
+
+
+def exportar_parchando_hojas(path: str | Path, filas_por_hoja: Dict[Optional[str], Iterable[Dict[str, Any]]]) -> bytes:
+    """
+    Varias hojas en una sola copia del zip: {nombre_hoja: rows}; la clave
+    None es la primera hoja.
+    """
+    stream = BytesIO()
+    with zipfile.ZipFile(path) as origen:
+        rutas = rutas_hojas(origen)
+        parches: Dict[str, Valores] = {}
+        for hoja, rows in filas_por_hoja.items():
+            if hoja is not None and hoja not in rutas:
+                raise KeyError(f"Worksheet {hoja} does not exist.")
+            ruta = rutas[hoja] if hoja is not None else next(iter(rutas.values()))
+            parches.setdefault(ruta, {}).update(_valores_por_id(rows))
+        compartidos = _shared_strings(origen)
+        with zipfile.ZipFile(stream, "w") as destino:
+            for info in origen.infolist():
+                with origen.open(info) as src, destino.open(_copia_info(info), "w") as dst:
+                    if info.filename in parches:
+                        for parte in _parchar_hoja(src, parches[info.filename], compartidos):
+                            dst.write(parte)
+                    else:
+                        shutil.copyfileobj(src, dst, _CHUNK)
+    return stream.getvalue()
@@ -0,0 +1,46 @@
+# backend/apps/libretas/services/zip_stream.py
+"""
+ZIP en streaming: escribe cada archivo en un zipfile sin seek y entrega los
+bytes apenas se producen, para usarlo con StreamingHttpResponse.
+"""
+from __future__ import annotations
+import zipfile
+from typing import Iterable, Iterator, Tuple
+
+
+class _Salida:
+    """
+    Destino no-seekable para zipfile: acumula lo escrito hasta que se drena.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drenar(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(archivos: Iterable[Tuple[str, bytes]]) -> Iterator[bytes]:
+    """
+    Recibe (nombre, contenido) y produce los bytes del ZIP archivo por archivo.
+    Los PDF ya vienen comprimidos, por eso se guardan sin deflate (ZIP_STORED).
+    """
+    salida = _Salida()
+    with zipfile.ZipFile(salida, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for nombre, contenido in archivos:
+            zf.writestr(nombre, contenido)
+            chunk = salida.drenar()
+            if chunk:
+                yield chunk
+    chunk = salida.drenar()
+    if chunk:
+        yield chunk
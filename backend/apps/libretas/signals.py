@@ -0,0 +1,61 @@
+# backend/apps/libretas/signals.py
+"""
+Receivers de Nota: recalculan la fila de ResumenNotaBimestre de la nota (y
+la de su clave anterior si cambió de alumno, asignatura o bimestre).
+Receivers de AsignaturaTrabajada: si cambia de asignatura, sus notas cambian
+de clave en el resumen; se rehacen ambas.
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import AsignaturaTrabajada, Nota
+from .services import resumen_notas
+
+
+def _asignatura_de(asignatura_trabajada_id):
+    return (AsignaturaTrabajada.objects.filter(pk=asignatura_trabajada_id)
+            .values_list("idasignatura_id", flat=True).first())
+
+
+@receiver(pre_save, sender=Nota)
+def _nota_pre_save(sender, instance, raw=False, **kwargs):
+    # Si la nota cambia de alumno, asignatura o bimestre, la clave anterior también se actualiza.
+    instance._clave_previa = None
+    if raw or instance.pk is None:
+        return
+    instance._clave_previa = (Nota.objects.filter(pk=instance.pk)
+                              .values_list("idalumno_id", "idasignatura_trabajada__idasignatura_id", "bimestre")
+                              .first())
+
+
+@receiver(post_save, sender=Nota)
+def _nota_post_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    clave = (instance.idalumno_id, _asignatura_de(instance.idasignatura_trabajada_id), instance.bimestre)
+    resumen_notas.recalcular(*clave)
+    previa = getattr(instance, "_clave_previa", None)
+    if previa and previa != clave:
+        resumen_notas.recalcular(*previa)
+
+
+@receiver(post_delete, sender=Nota)
+def _nota_post_delete(sender, instance, **kwargs):
+    resumen_notas.recalcular(instance.idalumno_id, _asignatura_de(instance.idasignatura_trabajada_id),
+                             instance.bimestre)
+
+
+@receiver(pre_save, sender=AsignaturaTrabajada)
+def _asignatura_trabajada_pre_save(sender, instance, raw=False, **kwargs):
+    instance._asignatura_previa = None
+    if raw or instance.pk is None:
+        return
+    instance._asignatura_previa = _asignatura_de(instance.pk)
+
+
+@receiver(post_save, sender=AsignaturaTrabajada)
+def _asignatura_trabajada_post_save(sender, instance, raw=False, **kwargs):
+    previa = getattr(instance, "_asignatura_previa", None)
+    if raw or previa is None or previa == instance.idasignatura_id:
+        return
+    resumen_notas.recalcular_asignatura_trabajada(instance.pk, previa)
@@ -0,0 +1,36 @@
+# backend/apps/libretas/tests/test_benchmark.py
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from apps.libretas.models import Alumno, Nota
+
+
+class BenchmarkLibretasTests(TestCase):
+    def test_json_con_los_tres_escenarios_y_sin_datos_residuales(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp) / "base.json"
+            call_command("benchmark_libretas", grados=2, alumnos=3, asignaturas=2, notas=2, repeticiones=1,
+                         motor="reportlab", salida=str(base), stdout=StringIO())
+            data = json.loads(base.read_text(encoding="utf-8"))
+
+            self.assertEqual(data["parametros"]["alumnos"], 3)
+            self.assertEqual(set(data["resultados"]), {"bimestral_pdf", "render_bimestral_pdf", "ugel_export"})
+            pdf = data["resultados"]["bimestral_pdf"]
+            self.assertGreater(pdf["bytes"], 0)
+            self.assertIn("consolidacion", pdf["etapas_ms"])
+            self.assertEqual(data["resultados"]["ugel_export"]["filas"], 6)
+
+            actual = Path(tmp) / "actual.json"
+            call_command("benchmark_libretas", grados=1, alumnos=2, asignaturas=1, notas=1, repeticiones=1,
+                         motor="reportlab", salida=str(actual), comparar=str(base),
+                         stdout=StringIO())
+            variacion = json.loads(actual.read_text(encoding="utf-8"))["variacion_pct"]
+            self.assertEqual(set(variacion), {"bimestral_pdf", "render_bimestral_pdf", "ugel_export"})
+
+        self.assertFalse(Alumno.objects.exists())
+        self.assertFalse(Nota.objects.exists())
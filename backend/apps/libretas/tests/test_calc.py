@@ -1,6 +1,6 @@
 # backend/apps/libretas/tests/test_calc.py
 from django.test import SimpleTestCase
-from apps.libretas.services.calc_service import nota_a_letra, _round2
+from apps.libretas.services.calc_service import nota_a_letra, redondear_2, _round2
 
 class CalcTests(SimpleTestCase):
     def test_num_a_letra_basico(self):
@@ -11,4 +11,5 @@ class CalcTests(SimpleTestCase):
 
     def test_redondeo(self):
         self.assertEqual(float(_round2(12.345)), 12.35)
+        self.assertEqual(redondear_2(15.125), 15.13)
 
@@ -0,0 +1,282 @@
+# backend/apps/libretas/tests/test_consolidacion.py
+import importlib
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from apps.libretas.models import (
+    Alumno, Asignatura, AsignaturaTrabajada, GradoTrabajado, LibretaLote, Nota, ResumenNotaBimestre,
+)
+from apps.libretas.services import consolidacion_vectorizada as cv, libreta_render, lote_service, pdf_cache
+from apps.libretas.services.calc_service import nota_a_letra, promedio_parciales
+from apps.libretas.services.consolidacion_service import ConsolidacionService
+
+
+class ConsolidarBimestreTests(TestCase):
+    def setUp(self):
+        arit = Asignatura.objects.create(idasignatura=1, area="MATEMÁTICA", nombre="ARITMÉTICA")
+        gram = Asignatura.objects.create(idasignatura=2, area="COMUNICACIÓN", nombre="GRAMÁTICA")
+        at_arit = AsignaturaTrabajada.objects.create(idasignatura_trabajada=1, idgrado_trabajado=4, idasignatura=arit)
+        at_gram = AsignaturaTrabajada.objects.create(idasignatura_trabajada=2, idgrado_trabajado=4, idasignatura=gram)
+        quispe = Alumno.objects.create(idalumno=2, nombres="Bruno", apellidos="QUISPE", dni="2", idgrado_trabajado=4)
+        perez = Alumno.objects.create(idalumno=1, nombres="Ana", apellidos="PÉREZ", dni="1", idgrado_trabajado=4)
+        otro = Alumno.objects.create(idalumno=3, nombres="Eva", apellidos="ROJAS", dni="3", idgrado_trabajado=5)
+        filas = [
+            (quispe, at_gram, "12.50"), (quispe, at_arit, "18"), (quispe, at_gram, None),
+            (perez, at_arit, "15"), (perez, at_arit, "16"), (otro, at_arit, "20"),
+        ]
+        for i, (alumno, at, cal) in enumerate(filas, start=1):
+            Nota.objects.create(idnota=i, calificacion=Decimal(cal) if cal else None, bimestre=1,
+                                idasignatura_trabajada=at, idalumno=alumno)
+        Nota.objects.create(idnota=99, calificacion=5, bimestre=2, idasignatura_trabajada=at_arit, idalumno=perez)
+
+    @override_settings(LIBRETAS_RESUMEN_VERIFICAR=False)
+    def test_promedios_en_bd_y_orden_de_aparicion(self):
+        with self.assertNumQueries(2):
+            res = ConsolidacionService.consolidar_bimestre("4", "A", 1)
+
+        self.assertEqual([c["alumno_nombre"] for c in res], ["QUISPE, Bruno", "PÉREZ, Ana"])
+        quispe = res[0]
+        self.assertEqual([a["nombre"] for a in quispe["asignaturas"]], ["GRAMÁTICA", "ARITMÉTICA"])
+        gram = quispe["asignaturas"][0]
+        self.assertEqual(gram["notas"], [12.5, 0.0])  # sin calificación cuenta como 0
+        self.assertEqual((gram["cantidad"], gram["promedio"], gram["letra"]), (2, 6.25, "C"))
+        self.assertEqual(quispe["promedio_general"], 12.13)  # 12.125 con HALF_UP, como nota_a_letra
+        self.assertEqual(res[1]["asignaturas"][0]["promedio"], 15.5)
+
+    @override_settings(LIBRETAS_RESUMEN_VERIFICAR=False)
+    def test_sin_notas_individuales(self):
+        with self.assertNumQueries(2):
+            res = ConsolidacionService.consolidar_bimestre("4", "A", 1, incluir_notas=False)
+        self.assertEqual(res[1]["asignaturas"][0]["notas"], [])
+        self.assertEqual(res[1]["promedio_general"], 15.5)
+
+
+class ConsolidarPorSeccionTests(TestCase):
+    def setUp(self):
+        asig = Asignatura.objects.create(idasignatura=1, area="MATEMÁTICA", nombre="ARITMÉTICA")
+        nota_id = 1
+        for gt, seccion in ((41, "A"), (42, "B")):
+            GradoTrabajado.objects.create(idgrado_trabajado=gt, grado=4, seccion=seccion)
+            at = AsignaturaTrabajada.objects.create(idasignatura_trabajada=gt, idgrado_trabajado=gt, idasignatura=asig)
+            for i in range(2):
+                alumno = Alumno.objects.create(idalumno=gt * 10 + i, nombres=f"N{i}", apellidos=f"{seccion}{i}",
+                                               dni=f"{gt}{i}", idgrado_trabajado=gt)
+                Nota.objects.create(idnota=nota_id, calificacion=15, bimestre=1, idasignatura_trabajada=at,
+                                    idalumno=alumno)
+                nota_id += 1
+
+    def test_filtra_por_seccion(self):
+        nombres = lambda s: [c["alumno_nombre"] for c in ConsolidacionService.consolidar_bimestre("4", s, 1)]
+        self.assertEqual(nombres("A"), ["A0, N0", "A1, N1"])
+        self.assertEqual(nombres("b"), ["B0, N0", "B1, N1"])
+        self.assertEqual(len(nombres("*")), 4)
+        self.assertEqual(nombres("C"), [])
+
+    def test_verificar_suma_dos_agregados(self):
+        # resumen al día: sólo los dos agregados de verificar(), sin reconstruir
+        with self.assertNumQueries(4):
+            ConsolidacionService.consolidar_bimestre("4", "A", 1, incluir_notas=False)
+
+    @override_settings(LIBRETAS_RESUMEN_VERIFICAR=False)
+    def test_plan_lectura_indexada_del_resumen(self):
+        tabla = ResumenNotaBimestre._meta.db_table
+        with CaptureQueriesContext(connection) as ctx:
+            ConsolidacionService.consolidar_bimestre("4", "A", 1)
+        consultas = [q["sql"] for q in ctx.captured_queries if f'FROM "{tabla}"' in q["sql"]]
+        self.assertEqual(len(consultas), 1)
+        self.assertFalse(any('FROM "nota"' in q["sql"] for q in ctx.captured_queries))
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + consultas[0])
+            plan = [fila[-1] for fila in cursor.fetchall()]
+        pasos = [p for p in plan if f" {tabla} " in f"{p} "]
+        self.assertTrue(pasos, plan)
+        for paso in pasos:
+            self.assertFalse(paso.startswith("SCAN"), plan)
+            self.assertIn("INDEX", paso, plan)
+
+
+class ResumenNotaBimestreTests(TestCase):
+    def setUp(self):
+        self.arit = Asignatura.objects.create(idasignatura=1, area="MATEMÁTICA", nombre="ARITMÉTICA")
+        self.gram = Asignatura.objects.create(idasignatura=2, area="COMUNICACIÓN", nombre="GRAMÁTICA")
+        self.at_arit = AsignaturaTrabajada.objects.create(idasignatura_trabajada=1, idgrado_trabajado=4,
+                                                          idasignatura=self.arit)
+        self.at_gram = AsignaturaTrabajada.objects.create(idasignatura_trabajada=2, idgrado_trabajado=4,
+                                                          idasignatura=self.gram)
+        self.alumno = Alumno.objects.create(idalumno=1, nombres="Ana", apellidos="PÉREZ", dni="1",
+                                            idgrado_trabajado=4)
+
+    def _resumen(self, asignatura, bimestre=1):
+        return ResumenNotaBimestre.objects.get(alumno=self.alumno, asignatura=asignatura, bimestre=bimestre)
+
+    def test_signals_mantienen_el_resumen(self):
+        n1 = Nota.objects.create(idnota=1, calificacion=14, bimestre=1, idasignatura_trabajada=self.at_arit,
+                                 idalumno=self.alumno)
+        Nota.objects.create(idnota=2, calificacion=17, bimestre=1, idasignatura_trabajada=self.at_arit,
+                            idalumno=self.alumno)
+        r = self._resumen(self.arit)
+        self.assertEqual((r.cantidad, r.suma, r.promedio, r.letra, r.notas), (2, 31, Decimal("15.5"), "A", [14.0, 17.0]))
+
+        n1.calificacion = 20
+        n1.save()
+        self.assertEqual(self._resumen(self.arit).promedio, Decimal("18.5"))
+
+        # Cambio de asignatura: se recalculan la clave nueva y la anterior.
+        n1.idasignatura_trabajada = self.at_gram
+        n1.save()
+        self.assertEqual(self._resumen(self.arit).notas, [17.0])
+        self.assertEqual(self._resumen(self.gram).notas, [20.0])
+
+        n1.delete()
+        self.assertFalse(ResumenNotaBimestre.objects.filter(asignatura=self.gram).exists())
+
+    def test_reconstruir_tras_bulk_create(self):
+        Nota.objects.bulk_create([
+            Nota(idnota=i, calificacion=c, bimestre=b, idasignatura_trabajada=self.at_arit, idalumno=self.alumno)
+            for i, (c, b) in enumerate([(10, 1), (None, 1), (16, 2)], start=1)
+        ])
+        self.assertFalse(ResumenNotaBimestre.objects.exists())
+
+        call_command("reconstruir_resumen_notas", stdout=StringIO())
+        r = self._resumen(self.arit)
+        self.assertEqual((r.cantidad, r.promedio, r.letra, r.notas, r.primera_nota), (2, Decimal("5"), "C", [10.0, 0.0], 1))
+        self.assertEqual(self._resumen(self.arit, bimestre=2).promedio, Decimal("16"))
+
+        call_command("reconstruir_resumen_notas", bimestre=2, stdout=StringIO())
+        self.assertEqual(ResumenNotaBimestre.objects.count(), 2)
+
+    def test_consolidar_detecta_escrituras_sin_signals(self):
+        Nota.objects.bulk_create([Nota(idnota=1, calificacion=12, bimestre=1, idasignatura_trabajada=self.at_arit,
+                                       idalumno=self.alumno)])
+        with override_settings(LIBRETAS_RESUMEN_VERIFICAR=False):
+            self.assertEqual(ConsolidacionService.consolidar_bimestre("4", "A", 1), [])
+        self.assertEqual(ConsolidacionService.consolidar_bimestre("4", "A", 1)[0]["promedio_general"], 12.0)
+
+        Nota.objects.filter(idnota=1).update(calificacion=17)
+        self.assertEqual(ConsolidacionService.consolidar_bimestre("4", "A", 1)[0]["promedio_general"], 17.0)
+        self.assertEqual(self._resumen(self.arit).letra, "A")
+
+    def test_migracion_llena_el_resumen(self):
+        Nota.objects.bulk_create([Nota(idnota=1, calificacion=12, bimestre=1, idasignatura_trabajada=self.at_arit,
+                                       idalumno=self.alumno)])
+        migracion = importlib.import_module("apps.libretas.migrations.0010_reconstruir_resumen_notas")
+        migracion.reconstruir_resumen(django_apps, None)
+        r = self._resumen(self.arit)
+        self.assertEqual((r.cantidad, r.suma, r.promedio, r.letra, r.notas), (1, 12, Decimal("12"), "B", [12.0]))
+
+    def test_cambio_de_asignatura_de_la_asignatura_trabajada(self):
+        Nota.objects.create(idnota=1, calificacion=12, bimestre=1, idasignatura_trabajada=self.at_arit,
+                            idalumno=self.alumno)
+        self.at_arit.idasignatura = self.gram
+        self.at_arit.save()
+        self.assertFalse(ResumenNotaBimestre.objects.filter(asignatura=self.arit).exists())
+        self.assertEqual(self._resumen(self.gram).notas, [12.0])
+
+
+class ConsolidacionVectorizadaTests(TestCase):
+    def setUp(self):
+        asigs = [Asignatura.objects.create(idasignatura=i, area="ÁREA", nombre=f"ASIG {i}") for i in (1, 2)]
+        califs = {  # alumno -> [(asignatura, calificación)]
+            (4, 1): [(0, "15"), (0, "16"), (1, "12")],
+            (4, 2): [(1, "18"), (0, None), (0, "20")],
+            (4, 3): [(0, "12"), (1, "15.5")],   # mismo promedio general que (4, 1): empate
+            (5, 4): [(0, "11")],
+        }
+        nota_id = 1
+        for (grado, aid), filas in califs.items():
+            alumno = Alumno.objects.create(idalumno=aid, nombres="N", apellidos=f"A{aid}", dni=str(aid),
+                                           idgrado_trabajado=grado)
+            for idx, cal in filas:
+                at, _ = AsignaturaTrabajada.objects.get_or_create(
+                    idasignatura_trabajada=grado * 10 + idx, defaults={"idgrado_trabajado": grado,
+                                                                       "idasignatura": asigs[idx]})
+                for bim in (1, 2):
+                    Nota.objects.create(idnota=nota_id, calificacion=Decimal(cal) if cal else None, bimestre=bim,
+                                        idasignatura_trabajada=at, idalumno=alumno)
+                    nota_id += 1
+
+    def test_equivale_a_consolidar_bimestre(self):
+        escuela = cv.consolidar_escuela(cv.cargar_columnas())
+        self.assertEqual(escuela.consolidados_libreta([4], 1), ConsolidacionService.consolidar_bimestre("4", "A", 1))
+        self.assertEqual(escuela.consolidados_libreta([5], 2), ConsolidacionService.consolidar_bimestre("5", "A", 2))
+
+    def test_anio_excluye_grados_trabajados_de_otros_anios(self):
+        GradoTrabajado.objects.create(idgrado_trabajado=4, grado=1, seccion="A", anio=2024)
+        GradoTrabajado.objects.create(idgrado_trabajado=5, grado=1, seccion="A", anio=2025)
+
+        def alumnos(anio):
+            return sorted(set(cv.cargar_columnas(bimestres=[1], anio=anio).alumno.tolist()))
+
+        self.assertEqual(alumnos(None), [1, 2, 3, 4])
+        self.assertEqual(alumnos(2025), [4])
+        self.assertEqual(alumnos(2024), [1, 2, 3])
+        self.assertEqual([c["alumno_id"] for c in ConsolidacionService.consolidar_bimestre("1", "A", 1, anio=2025)],
+                         [4])
+
+    def test_cargar_columnas_verifica_el_resumen(self):
+        # Escritura sin signals: el motor vectorizado no lee un resumen viejo.
+        Nota.objects.filter(idalumno_id=4, bimestre=1).update(calificacion=Decimal("19"))
+        escuela = cv.consolidar_escuela(cv.cargar_columnas(bimestres=[1], grados_trabajados=[5]))
+        self.assertEqual(escuela.consolidados_libreta([5], 1)[0]["promedio_general"], 19.0)
+        with override_settings(LIBRETAS_RESUMEN_VERIFICAR=False):
+            Nota.objects.filter(idalumno_id=4, bimestre=1).update(calificacion=Decimal("11"))
+            escuela = cv.consolidar_escuela(cv.cargar_columnas(bimestres=[1], grados_trabajados=[5]))
+        self.assertEqual(escuela.consolidados_libreta([5], 1)[0]["promedio_general"], 19.0)
+
+    def test_mismo_redondeo_en_los_limites(self):
+        # Promedios exactos en x.xx5: HALF_UP a 2 decimales y letra sobre el valor redondeado.
+        asig = Asignatura.objects.get(idasignatura=1)
+        otra = Asignatura.objects.get(idasignatura=2)
+        at = AsignaturaTrabajada.objects.create(idasignatura_trabajada=61, idgrado_trabajado=6, idasignatura=asig)
+        at2 = AsignaturaTrabajada.objects.create(idasignatura_trabajada=62, idgrado_trabajado=6, idasignatura=otra)
+        alumno = Alumno.objects.create(idalumno=9, nombres="N", apellidos="A9", dni="9", idgrado_trabajado=6)
+        for idnota, (cal, at_) in enumerate([("13.99", at), ("14.00", at), ("10.99", at2), ("11.00", at2)], 100):
+            Nota.objects.create(idnota=idnota, calificacion=Decimal(cal), bimestre=1,
+                                idasignatura_trabajada=at_, idalumno=alumno)
+
+        ref = ConsolidacionService.consolidar_bimestre("6", "A", 1)
+        self.assertEqual(cv.consolidar_escuela(cv.cargar_columnas()).consolidados_libreta([6], 1), ref)
+        self.assertEqual([(a["promedio"], a["letra"]) for a in ref[0]["asignaturas"]],
+                         [(14.0, "A"), (11.0, "B")])
+        self.assertEqual((ref[0]["promedio_general"], ref[0]["letra_general"]), (12.5, "B"))
+        self.assertEqual(ResumenNotaBimestre.objects.get(alumno=alumno, asignatura=asig, bimestre=1).letra, "A")
+
+    def test_lote_de_varios_grados_consolida_una_vez(self):
+        lote = LibretaLote.objects.create(bimestre=1, grados=["4", "5"], total=2, motor="reportlab")
+        with tempfile.TemporaryDirectory() as tmp, \
+                override_settings(LIBRETAS_LOTES_DIR=tmp, LIBRETAS_PDF_CACHE_DIR=tmp + "/cache"), \
+                mock.patch.object(ConsolidacionService, "consolidar_bimestre") as por_grado, \
+                mock.patch.object(cv, "cargar_columnas", wraps=cv.cargar_columnas) as cargar:
+            lote_service.procesar_lote(lote.pk)
+            lote.refresh_from_db()
+            por_grado.assert_not_called()
+        self.assertEqual(lote.estado, "COMPLETADO", lote.error)
+        cargar.assert_called_once_with(bimestres=[1], grados_trabajados=[4, 5], anio=None)
+
+        # El PDF cacheado por el lote es el mismo que pediría bimestral_pdf para ese grado.
+        with tempfile.TemporaryDirectory() as tmp, \
+                override_settings(LIBRETAS_LOTES_DIR=tmp, LIBRETAS_PDF_CACHE_DIR=tmp + "/cache"):
+            LibretaLote.objects.filter(pk=lote.pk).update(estado="PENDIENTE")  # un lote terminado no se vuelve a tomar
+            lote_service.procesar_lote(lote.pk)
+            contexto = libreta_render.construir_contexto("4", "A", 1, libreta_render.resolver_nivel("4", ""),
+                                                         ConsolidacionService.consolidar_bimestre("4", "A", 1))
+            clave = pdf_cache.clave_libreta(contexto, "reportlab")
+            self.assertIsNotNone(pdf_cache.get_pdf_cache().get(clave))
+
+
+class FuncionesVectorizadasTests(SimpleTestCase):
+    def test_letras_como_nota_a_letra(self):
+        valores = [0, 10.99, 10.995, 11, 13.994, 13.995, 14, 17.99, 18, 20, 12.345]
+        self.assertEqual(list(cv.letras(valores)), [nota_a_letra(v) for v in valores])
+
+    def test_promedio_filas_como_promedio_parciales(self):
+        filas = [[15, 14, 16, 15], [12.345, None, None, None], [None, None, None, None], [11, 12, None, 13]]
+        self.assertEqual(list(cv.promedio_filas(filas)), [promedio_parciales(*f) for f in filas])
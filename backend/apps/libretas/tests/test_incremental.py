@@ -0,0 +1,81 @@
+# backend/apps/libretas/tests/test_incremental.py
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from pypdf import PdfReader
+
+from apps.libretas.models import Alumno, Asignatura, AsignaturaTrabajada, Nota
+from apps.libretas.services import libreta_render, pdf_engines
+from apps.libretas.services.consolidacion_service import ConsolidacionService
+from apps.libretas.tests.test_pdf import _pdf_una_pagina
+
+
+class RenderIncrementalTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.override = override_settings(LIBRETAS_PDF_CACHE_DIR=self.tmp.name, LIBRETAS_PDF_WORKERS=1)
+        self.override.enable()
+
+        asig = Asignatura.objects.create(idasignatura=1, area="MATEMÁTICA", nombre="ARITMÉTICA")
+        at = AsignaturaTrabajada.objects.create(idasignatura_trabajada=1, idgrado_trabajado=4, idasignatura=asig)
+        for i in range(1, 4):
+            alumno = Alumno.objects.create(idalumno=i, nombres="N", apellidos=f"ALUMNO{i}", dni=str(i),
+                                           idgrado_trabajado=4)
+            Nota.objects.create(idnota=i, calificacion=15, bimestre=1, idasignatura_trabajada=at, idalumno=alumno)
+
+        self.renderizados = []
+
+        def fake_html_a_pdf(html_str, base_url):
+            nombre = next(f"ALUMNO{i}" for i in range(1, 4) if f"ALUMNO{i}" in html_str)
+            self.renderizados.append(nombre)
+            return _pdf_una_pagina(nombre)
+
+        patcher = mock.patch.object(pdf_engines, "_html_a_pdf", side_effect=fake_html_a_pdf)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.override.disable()
+        self.tmp.cleanup()
+
+    def _render(self):
+        self.renderizados.clear()
+        consolidados = ConsolidacionService.consolidar_bimestre("4", "A", 1)
+        contexto = libreta_render.construir_contexto("4", "A", 1, "primaria", consolidados)
+        pdf = libreta_render.render_pdf(contexto, "http://testserver/", modo="incremental")
+        return [p.extract_text().strip() for p in PdfReader(BytesIO(pdf)).pages]
+
+    def test_solo_rerenderiza_alumnos_con_notas_modificadas(self):
+        self.assertEqual(self._render(), self._paginas_esperadas())
+        self.assertEqual(sorted(self.renderizados), ["ALUMNO1", "ALUMNO2", "ALUMNO3"])
+
+        # Sin cambios: nada se vuelve a renderizar
+        self.assertEqual(self._render(), self._paginas_esperadas())
+        self.assertEqual(self.renderizados, [])
+
+        # Corrección de una nota: solo ese alumno
+        nota = Nota.objects.get(idnota=2)
+        nota.calificacion = 19
+        nota.save()
+
+        self.assertEqual(self._render(), self._paginas_esperadas())
+        self.assertEqual(self.renderizados, ["ALUMNO2"])
+
+    def test_cambios_sin_signals_tambien_rerenderizan(self):
+        self._render()
+        # QuerySet.update no dispara signals: la huella del contenido cambia igual.
+        Alumno.objects.filter(idalumno=2).update(nombres="OTRO")
+        self.assertEqual(self._render(), self._paginas_esperadas())
+        self.assertEqual(self.renderizados, ["ALUMNO2"])
+
+    def test_borrar_la_unica_nota_quita_la_hoja_sin_rerenderizar(self):
+        self._render()
+        Nota.objects.get(idnota=3).delete()
+        self.assertEqual(self._render(), ["ALUMNO1", "ALUMNO2"])
+        self.assertEqual(self.renderizados, [])
+
+    @staticmethod
+    def _paginas_esperadas():
+        return ["ALUMNO1", "ALUMNO2", "ALUMNO3"]
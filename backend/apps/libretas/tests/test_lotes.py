@@ -0,0 +1,175 @@
+# backend/apps/libretas/tests/test_lotes.py
+import io
+import tempfile
+import zipfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from apps.libretas.models import Alumno, Asignatura, AsignaturaTrabajada, GradoTrabajado, Nota, LibretaLote
+from apps.libretas.services import libreta_render, lote_service, pdf_engines
+
+User = get_user_model()
+
+
+class LibretaLoteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="directora", password="pass")
+        self.client.login(username="directora", password="pass")
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.override = override_settings(LIBRETAS_LOTES_DIR=self.tmp.name + "/lotes",
+                                          LIBRETAS_PDF_CACHE_DIR=self.tmp.name + "/cache")
+        self.override.enable()
+
+        asig = Asignatura.objects.create(idasignatura=1, area="MATEMÁTICA", nombre="ARITMÉTICA")
+        nota_id = 1
+        for grado in (2, 4):
+            at = AsignaturaTrabajada.objects.create(idasignatura_trabajada=grado, idgrado_trabajado=grado,
+                                                    idasignatura=asig)
+            for i in range(2):
+                alumno = Alumno.objects.create(idalumno=grado * 10 + i, nombres=f"N{i}", apellidos=f"A{i}",
+                                               dni=f"{grado}{i}", idgrado_trabajado=grado)
+                Nota.objects.create(idnota=nota_id, calificacion=15, bimestre=1,
+                                    idasignatura_trabajada=at, idalumno=alumno)
+                nota_id += 1
+
+    def tearDown(self):
+        self.override.disable()
+        self.tmp.cleanup()
+
+    def _crear(self, grados):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            resp = self.client.post("/api/libretas/bimestral/lotes",
+                                    {"bimestre": 1, "grados": grados}, content_type="application/json")
+        return resp, callbacks
+
+    def test_all_resuelve_grados_y_encola(self):
+        resp, callbacks = self._crear("all")
+        self.assertEqual(resp.status_code, 202)
+        data = resp.json()
+        self.assertEqual(data["estado"], "PENDIENTE")
+        self.assertEqual(data["total"], 2)
+        self.assertEqual(LibretaLote.objects.get(pk=data["id"]).grados,
+                         [{"grado": "2", "seccion": ""}, {"grado": "4", "seccion": ""}])
+        self.assertEqual(len(callbacks), 1)
+
+    def test_all_con_dos_secciones_de_un_grado(self):
+        # idgrado_trabajado 2 -> 1°A, 4 -> 1°B, 6 -> 2°A (sin alumnos: no entra).
+        GradoTrabajado.objects.create(idgrado_trabajado=2, grado=1, seccion="A")
+        GradoTrabajado.objects.create(idgrado_trabajado=4, grado=1, seccion="B")
+        GradoTrabajado.objects.create(idgrado_trabajado=6, grado=2, seccion="A")
+        resp, _ = self._crear("all")
+        self.assertEqual(resp.json()["total"], 2)
+        lote_id = resp.json()["id"]
+        self.assertEqual(LibretaLote.objects.get(pk=lote_id).grados,
+                         [{"grado": "1", "seccion": "A"}, {"grado": "1", "seccion": "B"}])
+
+        with mock.patch.object(pdf_engines.MOTORES["weasyprint"], "disponible", True), \
+                mock.patch.object(libreta_render, "render_pdf", return_value=b"%PDF") as m:
+            lote_service.procesar_lote(lote_id)
+        alumnos = [sorted(c["alumno_id"] for c in call.args[0]["consolidados"]) for call in m.call_args_list]
+        self.assertEqual(alumnos, [[20, 21], [40, 41]])
+        self.assertEqual([call.args[0]["seccion"] for call in m.call_args_list], ["A", "B"])
+        lote = LibretaLote.objects.get(pk=lote_id)
+        self.assertEqual(zipfile.ZipFile(lote.archivo).namelist(),
+                         ["boleta_primaria_G1A_B1.pdf", "boleta_primaria_G1B_B1.pdf"])
+
+    def test_procesa_y_descarga_zip(self):
+        resp, _ = self._crear(["4"])
+        lote_id = resp.json()["id"]
+
+        zip_resp = self.client.get(f"/api/libretas/bimestral/lotes/{lote_id}/zip")
+        self.assertEqual(zip_resp.status_code, 409)
+
+        with mock.patch.object(pdf_engines.MOTORES["weasyprint"], "disponible", True), \
+                mock.patch.object(libreta_render, "render_pdf", return_value=b"%PDF-grado") as m:
+            lote_service.procesar_lote(lote_id)
+        self.assertEqual(m.call_count, 1)
+
+        estado = self.client.get(f"/api/libretas/bimestral/lotes/{lote_id}").json()
+        self.assertEqual(estado["estado"], "COMPLETADO")
+        self.assertEqual(estado["procesados"], 1)
+        self.assertEqual(estado["progreso"], 100.0)
+        self.assertIn("descarga", estado)
+
+        zip_resp = self.client.get(f"/api/libretas/bimestral/lotes/{lote_id}/zip")
+        self.assertEqual(zip_resp.status_code, 200)
+        zf = zipfile.ZipFile(io.BytesIO(b"".join(zip_resp.streaming_content)))
+        self.assertEqual(zf.namelist(), ["boleta_inicial_G4_B1.pdf"])
+        self.assertEqual(zf.read("boleta_inicial_G4_B1.pdf"), b"%PDF-grado")
+
+    def test_error_queda_registrado(self):
+        resp, _ = self._crear(["4"])
+        lote_id = resp.json()["id"]
+        with mock.patch.object(pdf_engines.MOTORES["weasyprint"], "disponible", True), \
+                mock.patch.object(libreta_render, "render_pdf", side_effect=RuntimeError("boom")):
+            lote_service.procesar_lote(lote_id)
+        lote = LibretaLote.objects.get(pk=lote_id)
+        self.assertEqual(lote.estado, "ERROR")
+        self.assertIn("boom", lote.error)
+
+    def test_reanuda_lotes_huerfanos_y_no_duplica_los_vivos(self):
+        from datetime import timedelta
+        from django.utils import timezone
+
+        hace_rato = timezone.now() - timedelta(hours=1)
+        comunes = dict(bimestre=1, grados=["4"], seccion="A", total=1)
+        huerfano = LibretaLote.objects.create(estado="EN_PROCESO", latido=hace_rato, intentos=1, **comunes)
+        vivo = LibretaLote.objects.create(estado="EN_PROCESO", latido=timezone.now(), intentos=1, **comunes)
+        perdido = LibretaLote.objects.create(**comunes)
+        LibretaLote.objects.filter(pk=perdido.pk).update(creado_en=hace_rato)
+        agotado = LibretaLote.objects.create(estado="EN_PROCESO", latido=hace_rato, intentos=3, **comunes)
+        sin_latido = LibretaLote.objects.create(estado="EN_PROCESO", **comunes)
+
+        with mock.patch.object(lote_service, "encolar_lote") as encolar:
+            ids = lote_service.reanudar_pendientes()
+        self.assertEqual(sorted(ids), sorted([str(huerfano.id), str(perdido.id)]))
+        self.assertEqual(encolar.call_count, 2)
+        self.assertEqual(LibretaLote.objects.get(pk=agotado.pk).estado, "ERROR")
+        self.assertEqual(LibretaLote.objects.get(pk=sin_latido.pk).estado, "ERROR")
+
+        with mock.patch.object(pdf_engines.MOTORES["weasyprint"], "disponible", True), \
+                mock.patch.object(libreta_render, "render_pdf", return_value=b"%PDF") as m:
+            lote_service.procesar_lote(vivo.id)  # otro worker lo tiene: no se toma
+            self.assertEqual(m.call_count, 0)
+            lote_service.procesar_lote(huerfano.id)
+        lote = LibretaLote.objects.get(pk=huerfano.pk)
+        self.assertEqual((lote.estado, lote.intentos), ("COMPLETADO", 2))
+        self.assertEqual(LibretaLote.objects.get(pk=vivo.pk).estado, "EN_PROCESO")
+
+    def test_limpieza_borra_lotes_terminados_y_su_zip(self):
+        import os
+        import time
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+
+        viejo = self._crear(["4"])[0].json()["id"]
+        nuevo = self._crear(["4"])[0].json()["id"]
+        with mock.patch.object(pdf_engines.MOTORES["weasyprint"], "disponible", True), \
+                mock.patch.object(libreta_render, "render_pdf", return_value=b"%PDF"):
+            lote_service.procesar_lote(viejo)
+            lote_service.procesar_lote(nuevo)
+        LibretaLote.objects.filter(pk=viejo).update(finalizado_en=timezone.now() - timedelta(days=2))
+        zip_viejo = LibretaLote.objects.get(pk=viejo).archivo
+        zip_nuevo = LibretaLote.objects.get(pk=nuevo).archivo
+        huerfano = lote_service.get_lotes_dir() / "tmpabc123.tmp"
+        huerfano.write_bytes(b"x")
+        hace_dias = time.time() - 3 * 24 * 3600
+        os.utime(huerfano, (hace_dias, hace_dias))
+
+        out = StringIO()
+        call_command("limpiar_lotes_libretas", stdout=out)
+        self.assertIn("1 lotes y 2 archivos eliminados", out.getvalue())
+        self.assertFalse(LibretaLote.objects.filter(pk=viejo).exists())
+        self.assertFalse(os.path.exists(zip_viejo))
+        self.assertFalse(huerfano.exists())
+        self.assertTrue(os.path.exists(zip_nuevo))
+        self.assertEqual(self.client.get(f"/api/libretas/bimestral/lotes/{viejo}/zip").status_code, 404)
+
+    def test_grados_invalidos(self):
+        resp, _ = self._crear([])
+        self.assertEqual(resp.status_code, 400)
@@ -1,9 +1,19 @@
-from django.test import TestCase
-from django.contrib.auth import get_user_model
+import tempfile
+import zipfile
+from io import BytesIO
+from unittest import mock
+
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.libretas.models import Alumno, Asignatura, AsignaturaTrabajada, Nota
+from apps.libretas.services import libreta_render, pdf_cache, pdf_engines, pdf_metricas
+from apps.libretas.services.zip_stream import iter_zip
 
 User = get_user_model()
 
+
 class PdfSmokeTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username="tester", password="pass")
@@ -31,3 +41,255 @@ class PdfSmokeTests(TestCase):
         resp = self.client.get(url, {"grado": "1", "bimestre": 9})
         self.assertEqual(resp.status_code, 400)
         self.assertEqual(resp.json().get("code"), "BIMESTRE_INVALIDO")
+
+
+def _pdf_una_pagina(texto: str) -> bytes:
+    from reportlab.pdfgen import canvas
+    buff = BytesIO()
+    c = canvas.Canvas(buff)
+    c.drawString(72, 720, texto)
+    c.showPage()
+    c.save()
+    return buff.getvalue()
+
+
+class RenderParaleloTests(SimpleTestCase):
+    def setUp(self):
+        consolidados = [
+            {"alumno_nombre": f"ALUMNO {i}", "asignaturas": [], "promedio_general": 15.0,
+             "letra_general": "A", "recomendaciones": ""}
+            for i in range(1, 4)
+        ]
+        self.contexto = libreta_render.construir_contexto("4", "A", 1, "primaria", consolidados)
+
+    def test_dividir_por_alumno_conserva_orden(self):
+        partes = libreta_render.dividir_por_alumno(self.contexto)
+        self.assertEqual([p["consolidados"][0]["alumno_nombre"] for p in partes],
+                         ["ALUMNO 1", "ALUMNO 2", "ALUMNO 3"])
+        self.assertTrue(all(p["titulo"] == self.contexto["titulo"] for p in partes))
+
+    @override_settings(LIBRETAS_PDF_WORKERS=1)
+    def test_paralelo_une_paginas_en_orden(self):
+        from pypdf import PdfReader
+
+        def fake_html_a_pdf(html_str, base_url):
+            nombre = next(n for n in ("ALUMNO 1", "ALUMNO 2", "ALUMNO 3") if n in html_str)
+            return _pdf_una_pagina(nombre)
+
+        with mock.patch.object(pdf_engines, "_html_a_pdf", side_effect=fake_html_a_pdf) as m:
+            pdf = libreta_render.render_pdf(self.contexto, "http://testserver/", modo="paralelo")
+
+        self.assertEqual(m.call_count, 3)
+        paginas = PdfReader(BytesIO(pdf)).pages
+        self.assertEqual([p.extract_text().strip() for p in paginas], ["ALUMNO 1", "ALUMNO 2", "ALUMNO 3"])
+
+    def test_resolver_modo(self):
+        self.assertEqual(libreta_render.resolver_modo("paralelo"), "paralelo")
+        with override_settings(LIBRETAS_PDF_MODO="paralelo"):
+            self.assertEqual(libreta_render.resolver_modo(""), "paralelo")
+        self.assertEqual(libreta_render.resolver_modo("otro"), "simple")
+
+
+class PdfCacheTests(TestCase):
+    url = "/api/libretas/bimestral/pdf"
+    params = {"grado": "1", "bimestre": 2, "nivel": "primaria"}
+
+    def setUp(self):
+        settings.USE_FAKE_DATA = True
+        self.tmp = tempfile.TemporaryDirectory()
+        self.override = override_settings(LIBRETAS_PDF_CACHE_DIR=self.tmp.name)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        self.tmp.cleanup()
+
+    def test_etag_y_304(self):
+        resp = self.client.get(self.url, self.params)
+        self.assertEqual(resp.status_code, 200)
+        etag = resp["ETag"]
+        self.assertTrue(etag)
+
+        resp2 = self.client.get(self.url, self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp2.status_code, 304)
+        self.assertEqual(resp2["ETag"], etag)
+
+    def test_segundo_request_se_sirve_desde_disco(self):
+        from apps.libretas.views import pdf as pdf_views
+        with mock.patch.object(pdf_engines.MOTORES["weasyprint"], "disponible", True), \
+                mock.patch.object(pdf_views, "render_pdf", return_value=b"%PDF-render") as m:
+            r1 = self.client.get(self.url, self.params)
+            r2 = self.client.get(self.url, self.params)
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(r1.content, b"%PDF-render")
+        self.assertEqual(b"".join(r2.streaming_content), b"%PDF-render")
+
+    def test_limite_de_bytes_desaloja_la_menos_usada(self):
+        import os
+        import time
+        with override_settings(LIBRETAS_PDF_CACHE_MAX_BYTES=25):
+            cache = pdf_cache.get_pdf_cache()
+            self.assertEqual(cache.max_bytes, 25)
+            cache.put("aa1", b"x" * 10)
+            viejo = time.time() - 100
+            os.utime(cache.ruta("aa1"), (viejo, viejo))
+            cache.put("bb2", b"x" * 10)
+            cache.put("cc3", b"x" * 10)
+        self.assertIsNone(cache.get("aa1"))
+        self.assertIsNotNone(cache.get("cc3"))
+
+    def test_clave_cambia_con_datos_y_nivel(self):
+        base = libreta_render.construir_contexto("4", "A", 1, "primaria", [])
+        otro = libreta_render.construir_contexto("4", "A", 1, "primaria", [{"alumno_nombre": "X"}])
+        sec = libreta_render.construir_contexto("4", "A", 1, "secundaria", [])
+        claves = {pdf_cache.clave_libreta(c) for c in (base, otro, sec)}
+        self.assertEqual(len(claves), 3)
+        self.assertEqual(pdf_cache.clave_libreta(base), pdf_cache.clave_libreta(dict(base)))
+        self.assertNotEqual(pdf_cache.clave_libreta(base), pdf_cache.clave_libreta(base, "reportlab"))
+
+
+class BoletasZipTests(TestCase):
+    def setUp(self):
+        settings.USE_FAKE_DATA = True
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(LIBRETAS_PDF_CACHE_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        asig = Asignatura.objects.create(idasignatura=1, area="MATEMÁTICA", nombre="ARITMÉTICA")
+        at = AsignaturaTrabajada.objects.create(idasignatura_trabajada=1, idgrado_trabajado=4, idasignatura=asig)
+        for i, apellidos in enumerate(["PÉREZ HUAMÁN", "QUISPE LAZO"], start=1):
+            alumno = Alumno.objects.create(idalumno=i, nombres="Ana", apellidos=apellidos, dni=str(i),
+                                           idgrado_trabajado=4)
+            Nota.objects.create(idnota=i, calificacion=15, bimestre=1, idasignatura_trabajada=at, idalumno=alumno)
+
+    def test_zip_un_pdf_por_alumno(self):
+        resp = self.client.get("/api/libretas/bimestral/zip", {"grado": "4", "bimestre": 1, "nivel": "primaria"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp["Content-Type"], "application/zip")
+        self.assertIn("boletas_primaria_G4_B1.zip", resp["Content-Disposition"])
+
+        zf = zipfile.ZipFile(BytesIO(b"".join(resp.streaming_content)))
+        self.assertEqual(zf.namelist(), ["01_perez-huaman-ana.pdf", "02_quispe-lazo-ana.pdf"])
+        self.assertTrue(zf.read("01_perez-huaman-ana.pdf").startswith(b"%PDF"))
+
+    def test_motor_reportlab_una_pagina_por_alumno(self):
+        from pypdf import PdfReader
+        resp = self.client.get("/api/libretas/bimestral/pdf",
+                               {"grado": "4", "bimestre": 1, "nivel": "primaria", "motor": "reportlab"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "application/pdf")
+        paginas = PdfReader(BytesIO(resp.content)).pages
+        self.assertEqual(len(paginas), 2)
+        self.assertIn("PÉREZ HUAMÁN", paginas[0].extract_text())
+        self.assertIn("ARITMÉTICA", paginas[1].extract_text())
+
+    def test_server_timing_por_etapa(self):
+        import json
+        with self.assertLogs("apps.libretas.metricas", level="INFO") as logs:
+            resp = self.client.get("/api/libretas/bimestral/pdf",
+                                   {"grado": "4", "bimestre": 1, "nivel": "primaria", "motor": "reportlab"})
+        timing = resp["Server-Timing"]
+        for nombre in ("prechecks", "consolidacion", "template", "layout", "total"):
+            self.assertIn(f"{nombre};dur=", timing)
+        self.assertIn(f'desc="{len(resp.content)} bytes"', timing)
+
+        registro = json.loads(logs.records[0].getMessage())
+        self.assertEqual(registro["cache"], "miss")
+        self.assertEqual(registro["alumnos"], 2)
+        self.assertGreater(registro["etapas"]["consolidacion"]["queries"], 0)
+        self.assertEqual(registro["etapas"]["layout"]["queries"], 0)
+
+    def test_zip_bimestre_invalido(self):
+        resp = self.client.get("/api/libretas/bimestral/zip", {"grado": "4", "bimestre": 9})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_iter_zip_entrega_bytes_antes_de_terminar(self):
+        generados = []
+
+        def archivos():
+            for nombre in ("a.pdf", "b.pdf"):
+                generados.append(nombre)
+                yield nombre, b"%PDF-" + nombre.encode()
+
+        stream = iter_zip(archivos())
+        primero = next(stream)
+        self.assertTrue(primero.startswith(b"PK"))
+        self.assertEqual(generados, ["a.pdf"])  # el segundo aún no se generó
+        data = primero + b"".join(stream)
+        self.assertEqual(zipfile.ZipFile(BytesIO(data)).read("b.pdf"), b"%PDF-b.pdf")
+
+
+class ContextoWeasyTests(SimpleTestCase):
+    def test_plantilla_omite_css_precargado(self):
+        contexto = libreta_render.construir_contexto("4", "A", 1, "primaria", [])
+        html = pdf_engines.MOTORES["weasyprint"].preparar(contexto)
+        self.assertNotIn("bimestral_multi.css", html)
+        from django.template.loader import render_to_string
+        self.assertIn("bimestral_multi.css", render_to_string(pdf_engines.TEMPLATE_MULTI, contexto))
+
+    def test_url_fetcher_sirve_static_desde_memoria(self):
+        with mock.patch.object(pdf_engines, "FontConfiguration", create=True), \
+                mock.patch.object(pdf_engines, "CSS", create=True) as css, \
+                mock.patch.object(pdf_engines, "default_url_fetcher", create=True) as fetcher:
+            ctx = pdf_engines.ContextoWeasy()
+            logo = ctx.url_fetcher("http://testserver/static/libretas/img/ESCUDO-COLEGIO.png")
+            ctx.url_fetcher("http://testserver/media/otro.png")
+        self.assertEqual(css.call_count, 1)
+        self.assertEqual(logo["mime_type"], "image/png")
+        self.assertEqual(logo["string"], (pdf_engines.STATIC_IMG_DIR / "ESCUDO-COLEGIO.png").read_bytes())
+        self.assertIn("img/FIRMA.png", ctx.assets)
+        fetcher.assert_called_once_with("http://testserver/media/otro.png")
+
+
+class TamanoPdfTests(SimpleTestCase):
+    """
+    Regresión de tamaño: en un grado de 40 alumnos el escudo debe embeberse
+    una sola vez y referenciarse desde cada página.
+    """
+    def setUp(self):
+        consolidados = [
+            {"alumno_nombre": f"ALUMNO {i}", "promedio_general": 15.5, "letra_general": "A",
+             "recomendaciones": "", "asignaturas": [
+                 {"area": "MATEMÁTICA", "nombre": "ARITMÉTICA", "notas": [15, 16], "promedio": 15.5, "letra": "A"},
+             ]}
+            for i in range(1, 41)
+        ]
+        self.contexto = libreta_render.construir_contexto("4", "A", 1, "primaria", consolidados)
+        una = libreta_render.construir_contexto("4", "A", 1, "primaria", consolidados[:1])
+        self.tam_una_hoja = len(libreta_render.render_pdf(una, "http://testserver/", motor="reportlab"))
+
+    def _verificar(self, pdf: bytes):
+        from pypdf import PdfReader
+        paginas = PdfReader(BytesIO(pdf)).pages
+        self.assertEqual(len(paginas), 40)
+        imagenes = {x.idnum for p in paginas for x in p["/Resources"]["/XObject"].values()}
+        self.assertEqual(len(imagenes), 1)
+        # Cada hoja extra solo agrega texto y tablas (~2 KB), nunca otra copia del escudo.
+        self.assertLess(len(pdf), self.tam_una_hoja + 39 * 4096)
+
+    def test_simple(self):
+        self._verificar(libreta_render.render_pdf(self.contexto, "http://testserver/", motor="reportlab"))
+
+    @override_settings(LIBRETAS_PDF_WORKERS=1)
+    def test_paralelo_unido(self):
+        self._verificar(libreta_render.render_pdf(self.contexto, "http://testserver/", modo="paralelo",
+                                                  motor="reportlab"))
+
+
+class PdfMetricasTests(SimpleTestCase):
+    def test_etapas_anidadas_no_se_solapan(self):
+        with mock.patch.object(pdf_metricas.time, "perf_counter", side_effect=[0.0, 1.0, 2.0, 5.0, 6.0, 10.0]):
+            with pdf_metricas.medir("prueba") as m:         # 0
+                with pdf_metricas.etapa("render"):         # 1 .. 6
+                    with pdf_metricas.etapa("layout"):     # 2 .. 5
+                        pass
+        self.assertEqual(m.etapas["layout"]["ms"], 3000)
+        self.assertEqual(m.etapas["render"]["ms"], 2000)
+        self.assertEqual(m.total_ms, 10000)
+
+    def test_sin_medicion_no_hace_nada(self):
+        with pdf_metricas.etapa("layout"):
+            pass
+        self.assertIsNone(pdf_metricas.medicion_actual())
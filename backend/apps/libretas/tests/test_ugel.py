@@ -4,6 +4,20 @@ import os
 from django.test import TestCase, Client
 from django.conf import settings
 from openpyxl import Workbook
+from django.test import override_settings
+
+_CACHE_DIR = tempfile.TemporaryDirectory()
+_CACHE = override_settings(LIBRETAS_UGEL_CACHE_DIR=_CACHE_DIR.name)
+
+
+def setUpModule():
+    # El cache de consolidados no debe escribir en MEDIA_ROOT ni persistir entre corridas.
+    _CACHE.enable()
+
+
+def tearDownModule():
+    _CACHE.disable()
+    _CACHE_DIR.cleanup()
 
 
 class UgelEndpointsTests(TestCase):
@@ -180,3 +194,854 @@ class UgelEndpointsTests(TestCase):
         letra_bruno = ws_result["I3"].value
         self.assertIsNotNone(prom_bruno)
         self.assertEqual(letra_bruno, "AD")
+
+
+class LecturaStreamingTests(TestCase):
+    def _xlsx(self, filas, titulo="1"):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = titulo
+        ws.append(["alumnoId", "alumno", "B1", "B2", "B3", "B4", "curso"])
+        for f in filas:
+            ws.append(f)
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
+        tmp.close()
+        wb.save(tmp.name)
+        self.addCleanup(os.unlink, tmp.name)
+        return tmp.name
+
+    def test_abrir_lectura_usa_read_only_y_cierra(self):
+        from openpyxl.workbook.workbook import Workbook as WB
+        from apps.libretas.services.excel_adapter import abrir_lectura
+
+        path = self._xlsx([[1, "Ana", 15, 16]])
+        with abrir_lectura(path) as wb:
+            self.assertIsInstance(wb, WB)
+            self.assertTrue(wb.read_only)
+            self.assertTrue(wb._archive.fp)
+        self.assertIsNone(wb._archive.fp)
+
+    def test_consolidado_con_filas_cortas_y_filtro_curso(self):
+        from apps.libretas.services.ugel_service import construir_consolidado
+
+        path = self._xlsx([
+            [1, "Ana", 15, 16],                       # sin B3, B4 ni curso
+            [2, "Bruno", 18, 19, 17, None, "Mat"],
+            [None, "fila vacía"],
+            [3, "Carla", 10, 10, 10, 10, "Com"],
+        ])
+        out = construir_consolidado(path, grado="1", curso="mat")
+        self.assertEqual([r["alumnoId"] for r in out], [1, 2])
+        self.assertEqual((out[0]["promedio"], out[0]["letra"], out[0]["curso"]), (15.5, "A", "mat"))
+        self.assertEqual((out[1]["promedio"], out[1]["letra"]), (18.0, "AD"))
+
+
+class SesionLibroTests(TestCase):
+    def setUp(self):
+        from apps.libretas.services import ugel_sesion
+        self.ugel_sesion = ugel_sesion
+        ugel_sesion.limpiar_sesiones()
+        self.addCleanup(ugel_sesion.limpiar_sesiones)
+
+    def _xlsx(self, filas):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "1"
+        ws.append(["alumnoId", "alumno", "B1", "B2", "B3", "B4", "curso", "promedio", "letra", "comentario"])
+        for f in filas:
+            ws.append(f)
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
+        tmp.close()
+        wb.save(tmp.name)
+        self.addCleanup(os.unlink, tmp.name)
+        return tmp.name
+
+    def test_download_carga_el_workbook_una_sola_vez(self):
+        from unittest import mock
+        from openpyxl import load_workbook
+        from datetime import timedelta
+        from django.utils import timezone
+        from apps.libretas.models import UgelUpload
+
+        path = self._xlsx([[1, "Ana", 15, 16, None, None, "Mat"]])
+        token = UgelUpload.objects.create(ruta=path, nombre_original="RegNotas.xlsx", sha256="0" * 64,
+                                          expira_en=timezone.now() + timedelta(hours=1)).token
+
+        with mock.patch("apps.libretas.services.ugel_sesion.load_workbook", wraps=load_workbook) as carga, \
+                mock.patch("apps.libretas.services.excel_adapter.load_workbook", wraps=load_workbook) as lectura:
+            for _ in range(2):
+                resp = Client().get(f"/api/libretas/ugel/download?token={token}")
+                self.assertEqual(resp.status_code, 200)
+        self.assertEqual(carga.call_count, 1)
+        self.assertEqual(lectura.call_count, 0)
+
+        from io import BytesIO
+        from openpyxl import load_workbook as cargar
+        ws = cargar(BytesIO(resp.content))["1"]
+        self.assertEqual((ws["H2"].value, ws["I2"].value), (15.5, "A"))
+
+    def test_exportar_no_deja_valores_en_la_sesion(self):
+        from io import BytesIO
+        from openpyxl import load_workbook
+        from apps.libretas.services.ugel_service import construir_consolidado, exportar_excel
+
+        path = self._xlsx([[1, "Ana", 15, 16, None, None, "Mat"], [2, "Bruno", 18, 19, 17, None, "Com"]])
+        sesion = self.ugel_sesion.obtener_sesion("k", path)
+
+        mat = construir_consolidado(path, "1", "Mat", sesion=sesion)
+        exportar_excel(path, mat, [], sesion=sesion)
+        com = construir_consolidado(path, "1", "Com", sesion=sesion)
+        ws = load_workbook(BytesIO(exportar_excel(path, com, [], sesion=sesion)))["1"]
+
+        self.assertIsNone(ws["H2"].value)
+        self.assertEqual((ws["H3"].value, ws["I3"].value), (18.0, "AD"))
+        self.assertIsNone(sesion.wb["1"]["H3"].value)
+
+    def test_lru_ttl_y_cambio_de_archivo(self):
+        from django.test import override_settings
+
+        a = self._xlsx([[1, "Ana", 15, 15]])
+        b = self._xlsx([[2, "Bruno", 12, 12]])
+        with override_settings(LIBRETAS_UGEL_SESIONES_MAX=1):
+            sa = self.ugel_sesion.obtener_sesion("a", a)
+            self.assertIs(self.ugel_sesion.obtener_sesion("a", a), sa)
+            self.ugel_sesion.obtener_sesion("b", b)
+            self.assertIsNot(self.ugel_sesion.obtener_sesion("a", a), sa)  # desalojada por LRU
+
+        sa = self.ugel_sesion.obtener_sesion("a", a)
+        with override_settings(LIBRETAS_UGEL_SESION_TTL=-1):
+            self.assertIsNot(self.ugel_sesion.obtener_sesion("a", a), sa)  # vencida
+
+        sa = self.ugel_sesion.obtener_sesion("a", a)
+        wb = Workbook()
+        wb.active.append(["alumnoId"])
+        wb.active.append([9, "Otro", 20, 20])
+        wb.save(a)
+        os.utime(a, (0, 0))
+        nueva = self.ugel_sesion.obtener_sesion("a", a)
+        self.assertIsNot(nueva, sa)
+        self.assertEqual([f["alumnoId"] for f in nueva.filas(nueva.hoja_para("1"))], [9])
+
+
+class ExportOoxmlTests(TestCase):
+    def _xlsx(self, formula_en_h=False):
+        from openpyxl.styles import Font
+
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "1"
+        ws.append(["alumnoId", "alumno", "B1", "B2", "B3", "B4", "curso", "promedio", "letra", "comentario"])
+        ws.append([1, "Ana & Co", 15, 16, None, None, "Mat"])
+        ws.append([2, "Bruno", 18, 19, 17, None, "Mat"])
+        ws.append(["X3", "Carla", 10, 10, 10, 10, "Mat"])  # alumnoId como texto (sharedStrings)
+        ws["H2"].font = Font(bold=True)
+        if formula_en_h:
+            ws["H3"] = "=AVERAGE(C3:F3)"
+        wb.create_sheet("Otra")["A1"] = "sin cambios"
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
+        tmp.close()
+        wb.save(tmp.name)
+        self.addCleanup(os.unlink, tmp.name)
+        return tmp.name
+
+    def _consolidado(self):
+        return [
+            {"alumnoId": 1, "promedio": 15.5, "letra": "A"},
+            {"alumnoId": 2, "promedio": 18.0, "letra": "AD"},
+            {"alumnoId": "X3", "promedio": 10.0, "letra": "C"},
+        ]
+
+    def test_ooxml_escribe_lo_mismo_que_openpyxl_y_copia_el_resto(self):
+        import zipfile
+        from io import BytesIO
+        from unittest import mock
+        from openpyxl import load_workbook
+        from apps.libretas.services import xlsx_parche
+        from apps.libretas.services.ugel_service import exportar_excel
+
+        path = self._xlsx()
+        comentarios = [{"alumnoId": 2, "texto": " <muy bien> "}]
+        esperado = load_workbook(BytesIO(exportar_excel(path, self._consolidado(), comentarios, modo="openpyxl")))["1"]
+        with mock.patch.object(xlsx_parche, "_CHUNK", 64):  # fuerza filas cortadas entre bloques
+            data = exportar_excel(path, self._consolidado(), comentarios, modo="ooxml")
+        ws = load_workbook(BytesIO(data))["1"]
+
+        for fila in range(1, 5):
+            for col in "ABCDEFGHIJ":
+                self.assertEqual(ws[f"{col}{fila}"].value, esperado[f"{col}{fila}"].value, f"{col}{fila}")
+        self.assertTrue(ws["H2"].font.b)
+        self.assertEqual(ws["J3"].value, " <muy bien> ")
+
+        with zipfile.ZipFile(path) as antes, zipfile.ZipFile(BytesIO(data)) as despues:
+            self.assertEqual(antes.namelist(), despues.namelist())
+            hoja = xlsx_parche._primera_hoja(antes)
+            for nombre in antes.namelist():
+                if nombre != hoja:
+                    self.assertEqual(antes.read(nombre), despues.read(nombre), nombre)
+
+    def test_alumno_con_varios_cursos_empareja_por_curso(self):
+        from io import BytesIO
+        from openpyxl import load_workbook
+        from apps.libretas.services.ugel_service import construir_consolidado, exportar_excel
+
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "1"
+        ws.append(["alumnoId", "alumno", "B1", "B2", "B3", "B4", "curso", "promedio", "letra", "comentario"])
+        ws.append([1, "Ana", 12, 12, None, None, "Mat"])
+        ws.append([1, "Ana", 19, 19, None, None, "Com"])
+        ws.append([2, "Bruno", 15, 15, None, None, None])  # hoja sin curso para este alumno
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
+        tmp.close()
+        wb.save(tmp.name)
+        self.addCleanup(os.unlink, tmp.name)
+
+        consolidado = construir_consolidado(tmp.name, grado="1")
+        for modo in ("openpyxl", "ooxml"):
+            hoja = load_workbook(BytesIO(exportar_excel(tmp.name, consolidado, [], modo=modo)))["1"]
+            self.assertEqual([(hoja[f"H{f}"].value, hoja[f"I{f}"].value) for f in (2, 3, 4)],
+                             [(12.0, "B"), (19.0, "AD"), (15.0, "A")], modo)
+
+    def test_ooxml_con_formula_en_destino_usa_openpyxl(self):
+        from io import BytesIO
+        from openpyxl import load_workbook
+        from apps.libretas.services import xlsx_parche
+        from apps.libretas.services.ugel_service import exportar_excel
+
+        path = self._xlsx(formula_en_h=True)
+        with self.assertRaises(xlsx_parche.ParcheNoAplicable):
+            xlsx_parche.exportar_parchando(path, [{"alumnoId": 2, "promedio": 18.0}])
+
+        ws = load_workbook(BytesIO(exportar_excel(path, self._consolidado(), [], modo="ooxml")))["1"]
+        self.assertEqual((ws["H3"].value, ws["I3"].value), (18.0, "AD"))
+
+
+class RegistroUploadsTests(TestCase):
+    def setUp(self):
+        from django.test import override_settings
+
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        ajustes = override_settings(UPLOAD_TMP_DIR=self.dir.name, LIBRETAS_UGEL_UPLOADS_MAX_BYTES=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def _archivo(self, contenido, nombre="RegNotas.xlsx"):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return SimpleUploadedFile(nombre, contenido)
+
+    def test_upload_identicos_comparten_archivo(self):
+        from apps.libretas.services import ugel_uploads
+
+        a = ugel_uploads.registrar(self._archivo(b"xlsx-1", "a.xlsx"))
+        b = ugel_uploads.registrar(self._archivo(b"xlsx-1", "b.xlsx"))
+        c = ugel_uploads.registrar(self._archivo(b"xlsx-22", "c.xlsx"))
+
+        self.assertNotEqual(a.token, b.token)
+        self.assertEqual(a.ruta, b.ruta)
+        self.assertNotEqual(a.ruta, c.ruta)
+        self.assertEqual(sorted(os.listdir(self.dir.name)), sorted({os.path.basename(a.ruta), os.path.basename(c.ruta)}))
+        self.assertEqual(ugel_uploads.bytes_en_disco(), 6 + 7)
+        self.assertEqual(ugel_uploads.resolver(str(b.token)).nombre_original, "b.xlsx")
+
+    def test_token_vencido_y_barrido(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from apps.libretas.models import UgelUpload
+        from apps.libretas.services import ugel_uploads
+
+        a = ugel_uploads.registrar(self._archivo(b"viejo"))
+        UgelUpload.objects.filter(token=a.token).update(expira_en=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(ugel_uploads.resolver(str(a.token)))
+        self.assertIsNone(ugel_uploads.resolver("no-es-uuid"))
+
+        os.utime(a.ruta, (0, 0))  # fuera del período de gracia
+        otro = os.path.join(self.dir.name, "ajeno.xlsx")
+        open(otro, "wb").close()
+        os.utime(otro, (0, 0))
+        self.assertEqual(ugel_uploads.barrer(), {"tokens": 1, "archivos": 1})
+        self.assertFalse(os.path.exists(a.ruta))
+        self.assertTrue(os.path.exists(otro))  # solo se tocan archivos del registro
+
+    def test_cuota_desaloja_los_menos_usados(self):
+        from django.test import override_settings
+        from apps.libretas.services import ugel_uploads
+
+        viejo = ugel_uploads.registrar(self._archivo(b"a" * 10))
+        usado = ugel_uploads.registrar(self._archivo(b"b" * 10))
+        ugel_uploads.resolver(str(viejo.token))  # 'usado' pasa a ser el menos reciente
+        with override_settings(LIBRETAS_UGEL_UPLOADS_MAX_BYTES=25):
+            nuevo = ugel_uploads.registrar(self._archivo(b"c" * 10))
+
+        self.assertIsNotNone(ugel_uploads.resolver(str(viejo.token)))
+        self.assertIsNone(ugel_uploads.resolver(str(usado.token)))
+        self.assertFalse(os.path.exists(usado.ruta))
+        self.assertIsNotNone(ugel_uploads.resolver(str(nuevo.token)))
+
+    def test_download_resuelve_token_de_bd(self):
+        from apps.libretas.views import ugel as vistas
+
+        wb = Workbook()
+        wb.active.append(["alumnoId", "alumno", "B1", "B2", "B3", "B4", "curso"])
+        wb.active.append([1, "Ana", 15, 16])
+        from io import BytesIO
+        buf = BytesIO()
+        wb.save(buf)
+        token = Client().post("/api/libretas/ugel/upload", {"file": self._archivo(buf.getvalue())}).json()["token"]
+
+        self.assertFalse(hasattr(vistas, "_UPLOAD_TOKENS"))
+        resp = Client().get(f"/api/libretas/ugel/download?token={token}")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("RegNotas.xlsx", resp["Content-Disposition"])
+
+
+class ConsolidadoHojasTests(TestCase):
+    def _xlsx(self):
+        wb = Workbook()
+        encabezado = ["alumnoId", "alumno", "B1", "B2", "B3", "B4", "curso", "promedio", "letra", "comentario"]
+        hojas = {
+            "1": [[1, "Ana", 15, 16], [2, "Bruno", 18, 19, 17]],
+            "2": [[3, "Carla", 10, 10, 10, 10], [4, "Diego", 12, 14]],
+            "3": [[5, "Elena", 20, 19]],
+        }
+        wb.remove(wb.active)
+        for nombre, filas in hojas.items():
+            ws = wb.create_sheet(nombre)
+            ws.append(encabezado)
+            for f in filas:
+                ws.append(f)
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
+        tmp.close()
+        wb.save(tmp.name)
+        self.addCleanup(os.unlink, tmp.name)
+        return tmp.name
+
+    def test_pool_da_lo_mismo_que_secuencial(self):
+        from django.test import override_settings
+        from apps.libretas.services.ugel_service import construir_consolidado_hojas
+
+        path = self._xlsx()
+        with override_settings(LIBRETAS_UGEL_WORKERS=1):
+            secuencial = construir_consolidado_hojas(path)
+        with override_settings(LIBRETAS_UGEL_WORKERS=2):
+            paralelo = construir_consolidado_hojas(path)
+
+        self.assertEqual(list(paralelo), ["1", "2", "3"])
+        self.assertEqual(paralelo, secuencial)
+        self.assertEqual([r["alumnoId"] for r in paralelo["2"]], [3, 4])
+        self.assertEqual(list(construir_consolidado_hojas(path, hojas=["3", "1"])), ["1", "3"])
+        with self.assertRaises(KeyError):
+            construir_consolidado_hojas(path, hojas=["9"])
+
+    def test_export_todas_escribe_cada_hoja(self):
+        from io import BytesIO
+        from django.test import override_settings
+        from openpyxl import load_workbook
+
+        path = self._xlsx()
+        for modo in ("openpyxl", "ooxml"):
+            with override_settings(LIBRETAS_UGEL_WORKERS=1):
+                resp = Client().post("/api/libretas/ugel/export", {"uploadId": path, "todas": "1", "modo": modo})
+            self.assertEqual(resp.status_code, 200, modo)
+            wb = load_workbook(BytesIO(resp.content))
+            self.assertEqual((wb["1"]["H2"].value, wb["1"]["I2"].value), (15.5, "A"), modo)
+            self.assertEqual((wb["2"]["H3"].value, wb["2"]["I3"].value), (13.0, "B"), modo)
+            self.assertEqual((wb["3"]["H2"].value, wb["3"]["I2"].value), (19.5, "AD"), modo)
+
+
+class UgelExportJobTests(TestCase):
+    def setUp(self):
+        from django.test import override_settings
+
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        ajustes = override_settings(UPLOAD_TMP_DIR=self.dir.name + "/uploads",
+                                    LIBRETAS_UGEL_EXPORTS_DIR=self.dir.name + "/exports",
+                                    LIBRETAS_UGEL_WORKERS=1)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        wb = Workbook()
+        wb.active.title = "1"
+        wb.active.append(["alumnoId", "alumno", "B1", "B2", "B3", "B4", "curso", "promedio", "letra", "comentario"])
+        wb.active.append([1, "Ana", 15, 16])
+        wb.active.append([2, "Bruno", 18, 19, 17])
+        from io import BytesIO
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        buf = BytesIO()
+        wb.save(buf)
+        resp = self.client.post("/api/libretas/ugel/upload",
+                                {"file": SimpleUploadedFile("RegNotas_1A.xlsx", buf.getvalue())})
+        self.token = resp.json()["token"]
+
+    def test_job_se_procesa_y_descarga_con_nombre_original(self):
+        from io import BytesIO
+        from openpyxl import load_workbook
+        from apps.libretas.services import ugel_export_jobs
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            resp = self.client.post("/api/libretas/ugel/export/jobs", {"uploadId": self.token})
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(len(callbacks), 1)
+        job_id = resp.json()["id"]
+        self.assertEqual(resp.json()["estado"], "PENDIENTE")
+        self.assertEqual(self.client.get(f"/api/libretas/ugel/export/jobs/{job_id}/xlsx").status_code, 409)
+
+        ugel_export_jobs.procesar_job(job_id)
+
+        estado = self.client.get(f"/api/libretas/ugel/export/jobs/{job_id}").json()
+        self.assertEqual((estado["estado"], estado["procesados"], estado["total"], estado["progreso"]),
+                         ("COMPLETADO", 2, 2, 100.0))
+        self.assertIn("descarga", estado)
+
+        resp = self.client.get(f"/api/libretas/ugel/export/jobs/{job_id}/xlsx")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("RegNotas_1A.xlsx", resp["Content-Disposition"])
+        ws = load_workbook(BytesIO(b"".join(resp.streaming_content)))["1"]
+        self.assertEqual((ws["H3"].value, ws["I3"].value), (18.0, "AD"))
+
+    def test_reanuda_jobs_huerfanos_y_no_duplica_los_vivos(self):
+        from datetime import timedelta
+        from unittest import mock
+        from django.utils import timezone
+        from apps.libretas.models import UgelExportJob
+        from apps.libretas.services import ugel_export_jobs, ugel_uploads
+
+        ruta = ugel_uploads.resolver(self.token).ruta
+        hace_rato = timezone.now() - timedelta(hours=1)
+        huerfano = UgelExportJob.objects.create(ruta=ruta, nombre_original="a.xlsx", estado="EN_PROCESO",
+                                                latido=hace_rato, intentos=1)
+        vivo = UgelExportJob.objects.create(ruta=ruta, nombre_original="b.xlsx", estado="EN_PROCESO",
+                                            latido=timezone.now(), intentos=1)
+        perdido = UgelExportJob.objects.create(ruta=ruta, nombre_original="c.xlsx")
+        UgelExportJob.objects.filter(pk=perdido.pk).update(creado_en=hace_rato)
+        agotado = UgelExportJob.objects.create(ruta=ruta, nombre_original="d.xlsx", estado="EN_PROCESO",
+                                               latido=hace_rato, intentos=3)
+
+        with mock.patch.object(ugel_export_jobs, "encolar_job") as encolar:
+            ids = ugel_export_jobs.reanudar_pendientes()
+        self.assertEqual(sorted(ids), sorted([str(huerfano.id), str(perdido.id)]))
+        self.assertEqual(encolar.call_count, 2)
+        self.assertEqual(UgelExportJob.objects.get(pk=agotado.pk).estado, "ERROR")
+
+        ugel_export_jobs.procesar_job(vivo.id)  # otro worker lo tiene: no se toma
+        self.assertEqual(UgelExportJob.objects.get(pk=vivo.pk).estado, "EN_PROCESO")
+        ugel_export_jobs.procesar_job(huerfano.id)
+        job = UgelExportJob.objects.get(pk=huerfano.pk)
+        self.assertEqual((job.estado, job.intentos), ("COMPLETADO", 2))
+
+    def test_job_de_una_hoja_avanza_por_bloque_de_filas(self):
+        from unittest import mock
+        from django.test import override_settings
+        from apps.libretas.models import UgelExportJob
+        from apps.libretas.services import ugel_export_jobs, ugel_service
+
+        with self.captureOnCommitCallbacks(execute=False):
+            job_id = self.client.post("/api/libretas/ugel/export/jobs", {"uploadId": self.token}).json()["id"]
+        vistos = []
+        original = ugel_export_jobs.construir_consolidado
+
+        def consolidar(*args, al_avanzar=None, **kwargs):
+            def espiar(leidas):
+                al_avanzar(leidas)
+                vistos.append(UgelExportJob.objects.get(pk=job_id).procesados)
+            return original(*args, al_avanzar=espiar, **kwargs)
+
+        with override_settings(LIBRETAS_UGEL_CACHE=False), mock.patch.object(ugel_service, "_AVANCE_FILAS", 1), \
+                mock.patch.object(ugel_export_jobs, "construir_consolidado", consolidar):
+            ugel_export_jobs.procesar_job(job_id)
+        self.assertEqual(vistos, [1, 2])
+        self.assertEqual(UgelExportJob.objects.get(pk=job_id).estado, "COMPLETADO")
+
+    def test_limpieza_borra_exports_terminados_y_su_archivo(self):
+        import time
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from apps.libretas.models import UgelExportJob
+        from apps.libretas.services import ugel_export_jobs, ugel_uploads
+
+        ruta = ugel_uploads.resolver(self.token).ruta
+        viejo = UgelExportJob.objects.create(ruta=ruta, nombre_original="a.xlsx")
+        nuevo = UgelExportJob.objects.create(ruta=ruta, nombre_original="b.xlsx")
+        ugel_export_jobs.procesar_job(viejo.id)
+        ugel_export_jobs.procesar_job(nuevo.id)
+        UgelExportJob.objects.filter(pk=viejo.pk).update(finalizado_en=timezone.now() - timedelta(days=2))
+        viejo.refresh_from_db()
+        nuevo.refresh_from_db()
+        huerfano = ugel_export_jobs.get_exports_dir() / "tmpabc123.tmp"
+        huerfano.write_bytes(b"x")
+        hace_dias = time.time() - 3 * 24 * 3600
+        os.utime(huerfano, (hace_dias, hace_dias))
+
+        out = StringIO()
+        call_command("limpiar_uploads_ugel", stdout=out)
+        self.assertIn("Exports UGEL: 1 jobs y 2 archivos eliminados", out.getvalue())
+        self.assertFalse(UgelExportJob.objects.filter(pk=viejo.pk).exists())
+        self.assertFalse(os.path.exists(viejo.archivo))
+        self.assertFalse(huerfano.exists())
+        self.assertTrue(os.path.exists(nuevo.archivo))
+        self.assertEqual(self.client.get(f"/api/libretas/ugel/export/jobs/{viejo.id}/xlsx").status_code, 404)
+
+    def test_job_todas_las_hojas_y_token_invalido(self):
+        from apps.libretas.models import UgelExportJob
+        from apps.libretas.services import ugel_export_jobs
+
+        with self.captureOnCommitCallbacks(execute=False):
+            resp = self.client.post("/api/libretas/ugel/export/jobs", {"uploadId": self.token, "todas": "1"})
+        ugel_export_jobs.procesar_job(resp.json()["id"])
+        job = UgelExportJob.objects.get(pk=resp.json()["id"])
+        self.assertTrue(job.todas)
+        self.assertEqual((job.estado, job.procesados), ("COMPLETADO", 2))
+
+        resp = self.client.post("/api/libretas/ugel/export/jobs", {"uploadId": "no-existe"})
+        self.assertEqual(resp.status_code, 400)
+        from apps.libretas.services import ugel_uploads
+        ruta = ugel_uploads.resolver(self.token).ruta  # existe, pero no es un token
+        resp = self.client.post("/api/libretas/ugel/export/jobs", {"uploadId": ruta})
+        self.assertEqual((resp.status_code, resp.json()["code"]), (400, "TOKEN_INVALID"))
+        self.assertEqual(UgelExportJob.objects.count(), 1)
+        import uuid
+        resp = self.client.get(f"/api/libretas/ugel/export/jobs/{uuid.uuid4()}")
+        self.assertEqual((resp.status_code, resp.json()["code"]), (404, "JOB_NOT_FOUND"))
+
+
+class UgelExcelBdTests(TestCase):
+    def setUp(self):
+        from apps.libretas.models import Alumno, Asignatura, AsignaturaTrabajada, GradoTrabajado, Nota
+
+        GradoTrabajado.objects.create(idgrado_trabajado=31, grado=3, seccion="A", anio=2025)
+        GradoTrabajado.objects.create(idgrado_trabajado=32, grado=3, seccion="B", anio=2025)
+        GradoTrabajado.objects.create(idgrado_trabajado=21, grado=3, seccion="A", anio=2024)
+        mat = Asignatura.objects.create(idasignatura=1, area="MATEMÁTICA", nombre="ARITMÉTICA")
+        com = Asignatura.objects.create(idasignatura=2, area="COMUNICACIÓN", nombre="GRAMÁTICA")
+        nota = 1
+        for gt, apellidos in ((31, "ZEGARRA"), (31, "ALVA"), (32, "BRAVO"), (21, "CASTRO")):
+            alumno = Alumno.objects.create(idalumno=gt * 10 + nota, nombres="N", apellidos=apellidos,
+                                           dni=str(nota), idgrado_trabajado=gt)
+            for asig, bims in ((mat, {1: [14, 16], 2: [18]}), (com, {1: [10]})):
+                at, _ = AsignaturaTrabajada.objects.get_or_create(
+                    idasignatura_trabajada=gt * 10 + asig.idasignatura,
+                    defaults={"idgrado_trabajado": gt, "idasignatura": asig})
+                for bim, cals in bims.items():
+                    for c in cals:
+                        Nota.objects.create(idnota=nota, calificacion=c, bimestre=bim,
+                                            idasignatura_trabajada=at, idalumno=alumno)
+                        nota += 1
+
+    def test_excel_desde_bd_por_grado_seccion_anio(self):
+        from io import BytesIO
+        from openpyxl import load_workbook
+
+        resp = self.client.get("/api/libretas/ugel/excel?grado=3&seccion=A&anio=2025")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("UGEL_G3_SA_2025.xlsx", resp["Content-Disposition"])
+        ws = load_workbook(BytesIO(b"".join(resp.streaming_content)))["Grado 3"]
+        filas = [list(r) for r in ws.iter_rows(min_row=2, values_only=True)]
+        self.assertEqual([(f[1], f[6]) for f in filas], [
+            ("ALVA, N", "ARITMÉTICA"), ("ALVA, N", "GRAMÁTICA"),
+            ("ZEGARRA, N", "ARITMÉTICA"), ("ZEGARRA, N", "GRAMÁTICA"),
+        ])
+        self.assertEqual(filas[0][2:6], [15.0, 18.0, None, None])
+        self.assertEqual(filas[0][7:10], [16.5, "A", None])
+        self.assertEqual(filas[1][7:9], [10.0, "C"])
+
+        todas = self.client.get("/api/libretas/ugel/excel?grado=3&seccion=*&anio=2025")
+        ws = load_workbook(BytesIO(b"".join(todas.streaming_content)))["Grado 3"]
+        self.assertEqual(ws.max_row - 1, 6)
+
+        self.assertEqual(self.client.get("/api/libretas/ugel/excel?grado=3&anio=dos").status_code, 400)
+
+    def test_mismo_redondeo_que_la_libreta(self):
+        from decimal import Decimal
+        from io import BytesIO
+        from openpyxl import load_workbook
+        from apps.libretas.models import Alumno, AsignaturaTrabajada, GradoTrabajado, Nota
+        from apps.libretas.services import ugel_reporte
+        from apps.libretas.services.consolidacion_service import ConsolidacionService
+
+        GradoTrabajado.objects.create(idgrado_trabajado=41, grado=4, seccion="A", anio=2025)
+        at = AsignaturaTrabajada.objects.create(idasignatura_trabajada=411, idgrado_trabajado=41, idasignatura_id=1)
+        alumno = Alumno.objects.create(idalumno=900, nombres="N", apellidos="RAMOS", dni="900", idgrado_trabajado=41)
+        # 12.125 en el bimestre 1: HALF_UP da 12.13 (round() daba 12.12).
+        for idnota, cal in ((900, "12.12"), (901, "12.13")):
+            Nota.objects.create(idnota=idnota, calificacion=Decimal(cal), bimestre=1, idasignatura_trabajada=at,
+                                idalumno=alumno)
+
+        libreta = ConsolidacionService.consolidar_bimestre("4", "A", 1)[0]["asignaturas"][0]
+        destino = BytesIO()
+        ugel_reporte.escribir_excel_ugel(destino, "4", "A", 2025)
+        fila = [c.value for c in load_workbook(destino)["Grado 4"][2]]
+        self.assertEqual(libreta["promedio"], 12.13)
+        self.assertEqual((fila[2], fila[7], fila[8]), (libreta["promedio"], libreta["promedio"], libreta["letra"]))
+
+    def test_usa_workbook_write_only_y_lectura_por_lotes(self):
+        from io import BytesIO
+        from unittest import mock
+        from django.db.models.query import QuerySet
+        from apps.libretas.services import ugel_reporte
+
+        with mock.patch.object(ugel_reporte, "Workbook", wraps=ugel_reporte.Workbook) as wb, \
+                mock.patch.object(QuerySet, "iterator", autospec=True, side_effect=QuerySet.iterator) as it:
+            n = ugel_reporte.escribir_excel_ugel(BytesIO(), "3", "A", 2025)
+        self.assertEqual(n, 4)
+        wb.assert_called_once_with(write_only=True)
+        self.assertEqual(it.call_args.kwargs, {"chunk_size": 2000})
+
+
+class CacheConsolidadoTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        ajustes = override_settings(LIBRETAS_UGEL_CACHE_DIR=self.dir.name, LIBRETAS_UGEL_CACHE_MAX_BYTES=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def _xlsx(self, filas, nombre=None):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "1"
+        ws.append(["alumnoId", "alumno", "B1", "B2", "B3", "B4", "curso"])
+        for f in filas:
+            ws.append(f)
+        if nombre:
+            path = os.path.join(self.dir.name, nombre)
+        else:
+            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
+            tmp.close()
+            path = tmp.name
+            self.addCleanup(os.unlink, path)
+        wb.save(path)
+        return path
+
+    def test_mismo_contenido_no_vuelve_a_parsear(self):
+        import shutil
+        from unittest import mock
+        from apps.libretas.services import ugel_service
+
+        path = self._xlsx([[1, "Ana", 15, 16, None, None, "Mat"], [2, "Bruno", 18, 19, 17, None, "Com"]])
+        copia = os.path.join(self.dir.name, "copia.xlsx")
+        shutil.copyfile(path, copia)
+
+        primero = ugel_service.construir_consolidado(path, "1", "mat")
+        with mock.patch.object(ugel_service, "abrir_lectura") as abrir, \
+                mock.patch.object(ugel_service, "promedio_filas") as promedio:
+            repetido = ugel_service.construir_consolidado(copia, "1", "mat")
+        abrir.assert_not_called()
+        promedio.assert_not_called()
+        self.assertEqual(repetido, primero)
+        self.assertEqual(repetido[0]["curso"], "Mat")
+
+        # Otro curso u otro contenido es otra entrada.
+        self.assertEqual([r["alumnoId"] for r in ugel_service.construir_consolidado(copia, "1", "Com")], [2])
+        otro = self._xlsx([[1, "Ana", 20, 20, None, None, "Mat"]])
+        self.assertEqual(ugel_service.construir_consolidado(otro, "1", "mat")[0]["promedio"], 20.0)
+
+        with override_settings(LIBRETAS_UGEL_CACHE=False):
+            with mock.patch.object(ugel_service, "abrir_lectura", wraps=ugel_service.abrir_lectura) as abrir:
+                ugel_service.construir_consolidado(copia, "1", "mat")
+            abrir.assert_called_once()
+
+    def test_cache_caliente_no_carga_el_workbook(self):
+        from datetime import timedelta
+        from unittest import mock
+        from django.utils import timezone
+        from apps.libretas.models import UgelUpload
+        from apps.libretas.services import ugel_service, ugel_sesion
+
+        ugel_sesion.limpiar_sesiones()
+        self.addCleanup(ugel_sesion.limpiar_sesiones)
+        path = self._xlsx([[1, "Ana", 15, 16, None, None, "Mat"]])
+        token = UgelUpload.objects.create(ruta=path, nombre_original="RegNotas.xlsx", sha256="0" * 64,
+                                          expira_en=timezone.now() + timedelta(hours=1)).token
+        ugel_service.construir_consolidado(path, "1", "Mat")  # calienta el cache
+
+        sesion = ugel_sesion.sesion_diferida(token, path)
+        with mock.patch.object(ugel_sesion, "load_workbook") as carga:
+            filas = ugel_service.construir_consolidado(path, "1", "Mat", sesion=sesion)
+            resp = Client().post("/api/libretas/ugel/export", {"uploadId": token, "grado": "1", "curso": "Mat",
+                                                                "modo": "ooxml"})
+        carga.assert_not_called()
+        self.assertFalse(sesion.cargada)
+        self.assertEqual(filas[0]["promedio"], 15.5)
+        self.assertEqual(resp.status_code, 200)
+
+    def test_lru_respeta_el_limite(self):
+        import time
+        from apps.libretas.services.pdf_cache import CacheDisco
+
+        cache = CacheDisco(self.dir.name, sufijo=".json", max_bytes=25)
+        cache.put("aa1", b"x" * 10)
+        cache.put("bb2", b"x" * 10)
+        viejo = time.time() - 100
+        os.utime(cache.ruta("aa1"), (viejo, viejo))
+        os.utime(cache.ruta("bb2"), (viejo - 10, viejo - 10))
+        self.assertIsNotNone(cache.get("aa1"))  # renueva su uso: bb2 pasa a ser la menos usada
+        cache.put("cc3", b"x" * 10)
+        self.assertIsNone(cache.get("bb2"))
+        self.assertIsNotNone(cache.get("aa1"))
+        self.assertIsNotNone(cache.get("cc3"))
+
+    def test_upload_del_registro_usa_el_hash_del_nombre(self):
+        import hashlib
+        from apps.libretas.services.ugel_cache import hash_archivo
+
+        path = self._xlsx([[1, "Ana", 15, 16]])
+        with open(path, "rb") as f:
+            sha = hashlib.sha256(f.read()).hexdigest()
+        self.assertEqual(hash_archivo(path), sha)
+        registrado = self._xlsx([[1, "Ana", 15, 16]], nombre=f"{'a' * 64}.xlsx")
+        self.assertEqual(hash_archivo(registrado), "a" * 64)
+
+
+class UploadPartesTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        ajustes = override_settings(UPLOAD_TMP_DIR=self.dir.name, LIBRETAS_UGEL_UPLOADS_MAX_BYTES=0,
+                                    LIBRETAS_UGEL_UPLOAD_PARTE_MAX_BYTES=4096)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client = Client()
+
+    def _contenido(self):
+        from io import BytesIO
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "1"
+        ws.append(["alumnoId", "alumno", "B1", "B2", "B3", "B4", "curso", "promedio", "letra", "comentario"])
+        for i in range(200):
+            ws.append([i, f"Alumno {i}", 15, 16, 14, 13, "Mat"])
+        stream = BytesIO()
+        wb.save(stream)
+        return stream.getvalue()
+
+    def _iniciar(self, data, nombre="RegNotas.xlsx"):
+        import json
+        resp = self.client.post("/api/libretas/ugel/upload/partes",
+                                json.dumps({"filename": nombre, "size": len(data)}), content_type="application/json")
+        self.assertEqual(resp.status_code, 201, resp.content)
+        return resp.json()
+
+    def _parte(self, upload_id, offset, datos):
+        return self.client.put(f"/api/libretas/ugel/upload/partes/{upload_id}?offset={offset}", datos,
+                               content_type="application/octet-stream")
+
+    def _finalizar(self, upload_id, sha):
+        import json
+        return self.client.post(f"/api/libretas/ugel/upload/partes/{upload_id}/finalizar",
+                                json.dumps({"sha256": sha}), content_type="application/json")
+
+    def test_upload_reanudable_completo(self):
+        import hashlib
+        data = self._contenido()
+        inicio = self._iniciar(data)
+        uid, parte = inicio["uploadId"], inicio["chunkMax"]
+        self.assertEqual((inicio["offset"], parte), (0, 4096))
+
+        self.assertEqual(self._parte(uid, 0, data[:parte]).json()["offset"], parte)
+        # Reintento de la misma parte (se cortó la respuesta): indica desde dónde seguir.
+        resp = self._parte(uid, 0, data[:parte])
+        self.assertEqual((resp.status_code, resp.json()["code"], resp.json()["offset"]), (409, "OFFSET_MISMATCH", parte))
+        self.assertEqual(self._finalizar(uid, "0" * 64).status_code, 409)  # incompleto
+
+        offset = self.client.get(f"/api/libretas/ugel/upload/partes/{uid}").json()["offset"]
+        while offset < len(data):
+            resp = self._parte(uid, offset, data[offset:offset + parte])
+            self.assertEqual(resp.status_code, 200, resp.content)
+            offset = resp.json()["offset"]
+
+        resp = self._finalizar(uid, hashlib.sha256(data).hexdigest())
+        self.assertEqual(resp.status_code, 200, resp.content)
+        self.assertEqual((resp.json()["filename"], resp.json()["sheets"]), ("RegNotas.xlsx", ["1"]))
+        with open(os.path.join(self.dir.name, f"{hashlib.sha256(data).hexdigest()}.xlsx"), "rb") as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(
+            self.client.get(f"/api/libretas/ugel/download?token={resp.json()['token']}").status_code, 200)
+        self.assertEqual(self.client.get(f"/api/libretas/ugel/upload/partes/{uid}").status_code, 404)
+
+    def test_partes_concurrentes_con_el_mismo_offset(self):
+        from io import BytesIO
+        from apps.libretas.services import ugel_upload_parcial
+
+        data = self._contenido()
+        uid = self._iniciar(data)["uploadId"]
+
+        class ParteLenta(BytesIO):
+            # Mientras esta parte se recibe, otra con el mismo offset termina primero.
+            def read(self, n=-1):
+                if self.tell() == 0:
+                    ugel_upload_parcial.agregar(uid, 0, BytesIO(data[:100]))
+                return super().read(n)
+
+        with self.assertRaises(ugel_upload_parcial.ErrorSubida) as ctx:
+            ugel_upload_parcial.agregar(uid, 0, ParteLenta(data[:3000]))
+        self.assertEqual((ctx.exception.code, ctx.exception.extra["offset"]), ("OFFSET_MISMATCH", 100))
+        with open(os.path.join(self.dir.name, f"ugel_parcial_{uid.replace('-', '')}.part"), "rb") as f:
+            self.assertEqual(f.read(), data[:100])
+        self.assertEqual([n for n in os.listdir(self.dir.name) if n.startswith("ugel_parte_")], [])
+
+    def test_limites_checksum_y_estructura(self):
+        import hashlib
+        import io
+        import zipfile
+        from apps.libretas.models import UgelUpload
+
+        with override_settings(LIBRETAS_UGEL_UPLOAD_MAX_BYTES=10):
+            import json
+            resp = self.client.post("/api/libretas/ugel/upload/partes", json.dumps({"filename": "a.xlsx", "size": 11}),
+                                    content_type="application/json")
+            self.assertEqual((resp.status_code, resp.json()["code"]), (413, "FILE_TOO_LARGE"))
+
+        data = self._contenido()
+        uid = self._iniciar(data)["uploadId"]
+        resp = self._parte(uid, 0, data[:5000])  # más que chunkMax
+        self.assertEqual((resp.status_code, resp.json()["code"]), (413, "CHUNK_TOO_LARGE"))
+        self.assertEqual(self.client.get(f"/api/libretas/ugel/upload/partes/{uid}").json()["offset"], 0)
+
+        # Checksum que no coincide: se descarta.
+        pequeno = data[:100]
+        uid = self._iniciar(pequeno)["uploadId"]
+        self._parte(uid, 0, pequeno)
+        resp = self._finalizar(uid, hashlib.sha256(b"otro").hexdigest())
+        self.assertEqual(resp.json()["code"], "CHECKSUM_MISMATCH")
+        self.assertEqual(self.client.get(f"/api/libretas/ugel/upload/partes/{uid}").status_code, 404)
+
+        # Zip sin workbook: no es un .xlsx.
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("[Content_Types].xml", "<Types/>")
+        falso = buf.getvalue()
+        uid = self._iniciar(falso)["uploadId"]
+        self._parte(uid, 0, falso)
+        resp = self._finalizar(uid, hashlib.sha256(falso).hexdigest())
+        self.assertEqual((resp.status_code, resp.json()["code"]), (400, "INVALID_XLSX"))
+
+        with override_settings(LIBRETAS_UGEL_UPLOAD_MAX_DESCOMPRIMIDO=1000):
+            uid = self._iniciar(data)["uploadId"]
+            for offset in range(0, len(data), 4096):
+                self._parte(uid, offset, data[offset:offset + 4096])
+            resp = self._finalizar(uid, hashlib.sha256(data).hexdigest())
+            self.assertEqual((resp.status_code, resp.json()["code"]), (413, "FILE_TOO_LARGE"))
+        self.assertFalse(UgelUpload.objects.exists())
+        self.assertEqual([n for n in os.listdir(self.dir.name) if n.endswith(".xlsx")], [])
+
+    def test_barrido_respeta_uploads_en_curso(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from apps.libretas.models import UgelUploadParcial
+        from apps.libretas.services import ugel_uploads
+
+        data = self._contenido()
+        uid = self._iniciar(data)["uploadId"]
+        self._parte(uid, 0, data[:100])
+        ruta = ugel_uploads.ruta_parcial(uid)
+        os.utime(ruta, (0, 0))  # sin actividad hace mucho, pero vigente
+        ugel_uploads.barrer()
+        self.assertTrue(ruta.is_file())
+
+        UgelUploadParcial.objects.filter(pk=uid).update(expira_en=timezone.now() - timedelta(seconds=1))
+        ugel_uploads.barrer()
+        self.assertFalse(UgelUploadParcial.objects.exists())
+        self.assertFalse(ruta.is_file())
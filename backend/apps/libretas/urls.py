@@ -1,19 +1,37 @@
 # apps/libretas/urls.py
 from django.urls import path
-from .views.pdf import bimestral_pdf 
+from .views.pdf import bimestral_pdf, bimestral_zip
+from .views.lote import libreta_lote_create, libreta_lote_estado, libreta_lote_zip
 from .views.ugel import (
     ugel_consolidado_get,
     ugel_export_post,
     ugel_upload_post,
+    ugel_upload_partes_post,
+    ugel_upload_partes_item,
+    ugel_upload_partes_finalizar,
     ugel_download_get,
     ugel_excel_get,
+    ugel_export_job_post,
+    ugel_export_job_get,
+    ugel_export_job_xlsx,
 )
 
 urlpatterns = [
     path("bimestral/pdf", bimestral_pdf, name="libretas_bimestral_pdf"),
+    path("bimestral/zip", bimestral_zip, name="libretas_bimestral_zip"),
+    path("bimestral/lotes", libreta_lote_create, name="libretas_lote_create"),
+    path("bimestral/lotes/<uuid:lote_id>", libreta_lote_estado, name="libretas_lote_estado"),
+    path("bimestral/lotes/<uuid:lote_id>/zip", libreta_lote_zip, name="libretas_lote_zip"),
     path("ugel/consolidado", ugel_consolidado_get),
     path("ugel/export", ugel_export_post),
+    path("ugel/export/jobs", ugel_export_job_post, name="ugel-export-job"),
+    path("ugel/export/jobs/<uuid:job_id>", ugel_export_job_get, name="ugel-export-job-estado"),
+    path("ugel/export/jobs/<uuid:job_id>/xlsx", ugel_export_job_xlsx, name="ugel-export-job-xlsx"),
     path("ugel/upload", ugel_upload_post, name="ugel-upload"),
+    path("ugel/upload/partes", ugel_upload_partes_post, name="ugel-upload-partes"),
+    path("ugel/upload/partes/<uuid:upload_id>", ugel_upload_partes_item, name="ugel-upload-partes-item"),
+    path("ugel/upload/partes/<uuid:upload_id>/finalizar", ugel_upload_partes_finalizar,
+         name="ugel-upload-partes-finalizar"),
     path("ugel/download", ugel_download_get, name="ugel-download"),
     path("ugel/excel", ugel_excel_get, name="libretas-ugel-excel"),
 ]
@@ -0,0 +1,80 @@
+# apps/libretas/views/lote.py
+from __future__ import annotations
+
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ..models import LibretaLote
+from ..serializers.lote import LibretaLoteIn, LibretaLoteOut
+from ..services import lote_service
+
+
+class LibretaLoteCreateView(APIView):
+    """
+    POST /libretas/bimestral/lotes
+    Body: {"bimestre": 1, "grados": ["1","2"] | "all", "seccion"?, "anio"?, "nivel"?, "modo"?, "motor"?}
+    Encola la generación y responde 202 con el id del lote.
+    """
+    def post(self, request):
+        lote_service.asegurar_reanudacion()
+        ser = LibretaLoteIn(data=request.data)
+        if not ser.is_valid():
+            return Response({"code": "PARAMS_INVALIDOS", "detail": ser.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        data = ser.validated_data
+        try:
+            lote = lote_service.crear_lote(
+                bimestre=data["bimestre"],
+                grados=data["grados"],
+                seccion=str(data["seccion"]).strip().upper(),
+                anio=data["anio"],
+                nivel=data["nivel"],
+                modo=data["modo"],
+                motor=data["motor"],
+                base_url=request.build_absolute_uri("/"),
+            )
+        except ValueError as e:
+            return Response({"code": "SIN_GRADOS", "detail": str(e)},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(LibretaLoteOut(lote).data, status=status.HTTP_202_ACCEPTED)
+
+
+class LibretaLoteEstadoView(APIView):
+    """
+    GET /libretas/bimestral/lotes/<id>
+    Estado y avance (procesados/total) del lote.
+    """
+    def get(self, request, lote_id):
+        lote_service.asegurar_reanudacion()
+        lote = get_object_or_404(LibretaLote, pk=lote_id)
+        data = LibretaLoteOut(lote).data
+        if lote.estado == "COMPLETADO":
+            data["descarga"] = request.build_absolute_uri(f"{request.path.rstrip('/')}/zip")
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class LibretaLoteZipView(APIView):
+    """
+    GET /libretas/bimestral/lotes/<id>/zip
+    Descarga el ZIP cuando el lote terminó.
+    """
+    def get(self, request, lote_id):
+        lote = get_object_or_404(LibretaLote, pk=lote_id)
+        if lote.estado != "COMPLETADO" or not lote.archivo:
+            return Response({"code": "LOTE_NO_TERMINADO", "detail": f"Estado actual: {lote.estado}"},
+                            status=status.HTTP_409_CONFLICT)
+        try:
+            f = open(lote.archivo, "rb")
+        except FileNotFoundError:
+            return Response({"code": "ARCHIVO_NO_ENCONTRADO", "detail": "El ZIP ya no está disponible."},
+                            status=status.HTTP_410_GONE)
+        return FileResponse(f, as_attachment=True, filename=f"libretas_B{lote.bimestre}.zip",
+                            content_type="application/zip")
+
+
+libreta_lote_create = LibretaLoteCreateView.as_view()
+libreta_lote_estado = LibretaLoteEstadoView.as_view()
+libreta_lote_zip = LibretaLoteZipView.as_view()
@@ -2,45 +2,24 @@ from __future__ import annotations
 from typing import Any, Dict
 
 from django.conf import settings
-from django.http import HttpResponse
-from django.shortcuts import render
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 
-# Si tienes WeasyPrint instalado, se usará PDF; si no, devuelve HTML.
-try:
-    from weasyprint import HTML
-    _HAS_WEASY = True
-except Exception:
-    _HAS_WEASY = False
-
 from ..services.pdf_prechecks import verificar_cierre_bimestre, verificar_examen_bimestral
 from ..services.consolidacion_service import ConsolidacionService
+from ..services.libreta_render import (
+    construir_contexto, iter_pdfs_por_alumno, nombre_pdf_alumno, render_pdf, resolver_modo, resolver_nivel,
+)
+from ..services.zip_stream import iter_zip
+from ..services.pdf_cache import clave_libreta, coincide_if_none_match, etag_de, get_pdf_cache
+from ..services.pdf_engines import get_motor
+from ..services.pdf_metricas import etapa, medir
 
 
-def _resolver_nivel(grado: str, nivel_param: str) -> str:
-    """
-    Resuelve el nivel según:
-      1) override por ?nivel= (inicial|primaria|secundaria)
-      2) heurística por 'grado'
-    """
-    if nivel_param in {"inicial", "primaria", "secundaria"}:
-        return nivel_param
-
-    g = (grado or "").strip().lower()
-    # Inicial (puede venir como 3/4/5 años o texto explícito)
-    if any(x in g for x in ["inicial", "3", "4", "5"]) and "sec" not in g:
-        # si es "3", "4", "5" y NO es "sec", interpretamos inicial
-        return "inicial"
-    # Primaria (1..6)
-    if g in {"1", "2", "3", "4", "5", "6"}:
-        return "primaria"
-    # Secundaria (algunas variantes comunes)
-    if g in {"1s", "1sec", "1 secundaria", "2s", "3s", "4s", "5s"} or "secund" in g:
-        return "secundaria"
-    # Por defecto, primaria
-    return "primaria"
+# Compat: la heurística vive ahora en services.libreta_render
+_resolver_nivel = resolver_nivel
 
 
 class BimestralPreviewView(APIView):
@@ -78,12 +57,21 @@ from rest_framework.permissions import AllowAny
 
 class BimestralPDFView(APIView):
     """
-    GET /libretas/bimestral/pdf?grado=..&bimestre=..[&nivel=..][&curso=..]
+    GET /libretas/bimestral/pdf?grado=..&bimestre=..[&nivel=..][&curso=..][&modo=..][&motor=..]
     Genera el PDF real eligiendo plantilla por nivel (inicial/primaria/secundaria).
     - Detección automática por 'grado', con override por ?nivel=.
+    - ?modo=paralelo renderiza una hoja por alumno en un pool de procesos;
+      ?modo=incremental solo re-renderiza alumnos con notas modificadas.
+    - ?motor=weasyprint|reportlab (default: settings.LIBRETAS_PDF_MOTOR).
+    - Cache en disco por contenido, con ETag / If-None-Match (304).
+    - Header Server-Timing con tiempo y queries por etapa (ver pdf_metricas).
     """
     permission_classes = [AllowAny]  # Temporalmente permitimos acceso sin autenticación
-    def get(self, request):
+
+    def _preparar_contexto(self, request):
+        """
+        Prechecks + nivel + consolidación. Retorna (error_response, contexto).
+        """
         q = request.query_params
         grado = str(q.get("grado", "") or "").strip()
         curso = str(q.get("curso", "") or "").strip()
@@ -93,95 +81,114 @@ class BimestralPDFView(APIView):
             bimestre = 1
         nivel_param = str(q.get("nivel", "") or "").lower().strip()
 
-        try:
-            # 1) Prechecks (compat con helpers que piden 'seccion' y 'curso').
-            #    Usamos 'grado' como 'seccion' para no romper helpers.
+        # 1) Prechecks (compat con helpers que piden 'seccion' y 'curso').
+        #    Usamos 'grado' como 'seccion' para no romper helpers.
+        with etapa("prechecks"):
             cierre_ok = verificar_cierre_bimestre(grado, bimestre)
             examen_ok = verificar_examen_bimestral(grado, curso, bimestre)
-        except Exception as e:
-            raise
 
         # Si estás en modo real (USE_FAKE_DATA=False), bloquea con códigos claros
         if not cierre_ok:
             return Response({"code": "BIMESTRE_INVALIDO", "detail": "Bimestre fuera de rango o no cerrado."},
-                            status=status.HTTP_400_BAD_REQUEST)
+                            status=status.HTTP_400_BAD_REQUEST), None
         if not settings.USE_FAKE_DATA and not examen_ok:
             return Response({"code": "EXAMEN_FALTANTE", "detail": "Falta examen bimestral para el curso/section."},
-                            status=status.HTTP_400_BAD_REQUEST)
+                            status=status.HTTP_400_BAD_REQUEST), None
 
         # 2) Nivel resuelto
         nivel = _resolver_nivel(grado, nivel_param)
 
         # 3) Obtener datos consolidados (ahora devuelve lista de consolidaciones)
         seccion = str(q.get("seccion", "A")).strip().upper()
-        consolidados = ConsolidacionService.consolidar_bimestre(grado, seccion, bimestre)
+        with etapa("consolidacion"):
+            consolidados = ConsolidacionService.consolidar_bimestre(grado, seccion, bimestre)
 
-        # 4) Plantilla: usamos una plantilla genérica que repite la hoja por alumno
-        if nivel == "inicial":
-            titulo = "BOLETA DE NOTAS 2025 – EDUCACIÓN INICIAL"
-        elif nivel == "secundaria":
-            titulo = "BOLETA DE NOTAS 2025 – EDUCACIÓN SECUNDARIA"
-        else:
-            titulo = "BOLETA DE NOTAS 2025 – EDUCACIÓN PRIMARIA"
+        # 4) Contexto común: la plantilla multi repite la hoja por alumno
+        contexto: Dict[str, Any] = construir_contexto(grado, seccion, bimestre, nivel, consolidados)
+        return None, contexto
 
-        contexto: Dict[str, Any] = {
-            "grado": grado,
-            "seccion": seccion,
-            "bimestre": bimestre,
-            "titulo": titulo,
-            "consolidados": consolidados,
-            "tutora_nombre": "Miss Dina Torres",
-            "nivel": nivel,
-        }
-
-        # 5) Renderizar la plantilla multi (cada consolidado -> una hoja)
-        template = "libretas/bimestral_multi.html"
-        try:
-            html_resp = render(request, template, contexto)
-            html_str = html_resp.content.decode("utf-8")
-        except Exception:
-            # Si el render falla, devolver error 500 para depuración
-            raise
+    def get(self, request):
+        with medir("bimestral_pdf") as m:
+            resp = self._responder(request, m)
+        resp["Server-Timing"] = m.server_timing()
+        return resp
 
-        if _HAS_WEASY:
-            html = HTML(string=html_str, base_url=request.build_absolute_uri("/"))
-            pdf_bytes = html.write_pdf()
-            resp = HttpResponse(pdf_bytes, content_type="application/pdf")
+    def _responder(self, request, m):
+        error, contexto = self._preparar_contexto(request)
+        if error is not None:
+            return error
+        q = request.query_params
+        nivel, grado, bimestre = contexto["nivel"], contexto["grado"], contexto["bimestre"]
+
+        # 5) Cache por contenido: mismo consolidado + plantilla + nivel + motor => mismo PDF
+        motor = get_motor(str(q.get("motor", "") or ""))
+        clave = clave_libreta(contexto, motor.nombre)
+        etag = etag_de(clave)
+        if coincide_if_none_match(request.headers.get("If-None-Match", ""), etag):
+            resp = HttpResponseNotModified()
+            resp["ETag"] = etag
+            return resp
+
+        # 6) Render (simple / paralelo / incremental, según ?modo= o settings)
+        modo = resolver_modo(str(q.get("modo", "") or ""))
+        m.anotar(grado=grado, bimestre=bimestre, nivel=nivel, alumnos=len(contexto["consolidados"]),
+                 motor=motor.nombre, modo=modo)
+        if motor.disponible:
+            cache = get_pdf_cache()
+            cacheado = cache.get(clave)
+            if cacheado is not None:
+                m.anotar(cache="hit", bytes=cacheado.stat().st_size)
+                resp = FileResponse(open(cacheado, "rb"), content_type="application/pdf")
+            else:
+                pdf_bytes = render_pdf(contexto, request.build_absolute_uri("/"), modo=modo,
+                                       motor=motor.nombre, request=request)
+                cache.put(clave, pdf_bytes)
+                m.anotar(cache="miss", bytes=len(pdf_bytes))
+                resp = HttpResponse(pdf_bytes, content_type="application/pdf")
         else:
             resp = HttpResponse(_fake_pdf_bytes(), content_type="application/pdf")
+        resp["ETag"] = etag
+        resp["Cache-Control"] = "private, no-cache"
 
-        # 6) Nombre de archivo
+        # 7) Nombre de archivo
         filename = f'boleta_{nivel}_G{grado}_B{bimestre}.pdf'
         # Usa "inline" para ver en navegador; cambia a "attachment" si quieres descarga directa
         resp["Content-Disposition"] = f'inline; filename="{filename}"'
         return resp
+
+
+class BimestralZipView(BimestralPDFView):
+    """
+    GET /libretas/bimestral/zip?grado=..&bimestre=..[&nivel=..][&seccion=..][&motor=..]
+    Mismos parámetros que bimestral/pdf, pero responde un ZIP con un PDF por
+    alumno. Se transmite (StreamingHttpResponse) a medida que cada boleta se
+    genera: el archivo completo nunca se arma en memoria.
+    """
+    def get(self, request):
+        error, contexto = self._preparar_contexto(request)
+        if error is not None:
+            return error
+
+        motor = get_motor(str(request.query_params.get("motor", "") or ""))
+        if motor.disponible:
+            pdfs = iter_pdfs_por_alumno(contexto, request.build_absolute_uri("/"), motor=motor.nombre,
+                                        request=request)
+        else:
+            pdfs = ((nombre_pdf_alumno(i, c), _fake_pdf_bytes())
+                    for i, c in enumerate(contexto["consolidados"], start=1))
+
+        resp = StreamingHttpResponse(iter_zip(pdfs), content_type="application/zip")
+        filename = f'boletas_{contexto["nivel"]}_G{contexto["grado"]}_B{contexto["bimestre"]}.zip'
+        resp["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return resp
 # --- helpers para compatibilidad con urls/tests que esperan funciones ---
 def _fake_pdf_bytes() -> bytes:
     return b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n1 0 obj\n<<>>\nendobj\ntrailer\n<<>>\n%%EOF\n"
 
-# Si tus tests exigen siempre PDF (aunque no tengas WeasyPrint),
-# fuerza la salida a PDF usando _fake_pdf_bytes() cuando no haya Weasy:
-from django.http import HttpResponse
-
 # Alias compatibles con import en urls.py
 bimestral_preview = BimestralPreviewView.as_view()
+bimestral_zip = BimestralZipView.as_view()
 
-# Envolvemos BimestralPDFView para asegurar application/pdf aun sin WeasyPrint
-def bimestral_pdf(request, *args, **kwargs):
-    view = BimestralPDFView.as_view()
-
-    if not _HAS_WEASY:
-        # Ejecuta la lógica para validar y armar contexto,
-        # pero como no hay WeasyPrint, devolvemos un PDF mínimo.
-        # Reusamos la propia view para los checks y filename.
-        # Llamamos a la view para obtener filename del header que arma.
-        # Si prefieres evitar hacerlo doble, puedes copiar la lógica aquí.
-        resp = view(request, *args, **kwargs)
-        # Si vino text/html, lo reemplazamos por PDF fake manteniendo filename
-        filename = resp.headers.get("Content-Disposition", 'inline; filename="boleta_mock.pdf"')
-        pdf_resp = HttpResponse(_fake_pdf_bytes(), content_type="application/pdf")
-        pdf_resp["Content-Disposition"] = filename
-        return pdf_resp
-
-    # Con WeasyPrint instalado, ejecuta normalmente la CBV
-    return view(request, *args, **kwargs)
+# Sin el motor pedido (p.ej. WeasyPrint sin librerías del sistema) la CBV ya
+# responde un PDF mínimo con el mismo filename, así que basta con delegar.
+bimestral_pdf = BimestralPDFView.as_view()
@@ -1,34 +1,32 @@
 # apps/libretas/views/ugel.py
 from __future__ import annotations
 import json
-import os
 import tempfile
-import uuid
 from pathlib import Path
 from typing import Optional
 
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, JsonResponse, HttpResponse
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 
-from ..services.ugel_service import leer_base, construir_consolidado, exportar_excel
+from ..services.ugel_service import (
+    leer_base, construir_consolidado, construir_consolidado_hojas, exportar_excel, exportar_excel_hojas,
+)
+from ..services.ugel_reporte import escribir_excel_ugel
+from ..services.ugel_sesion import sesion_diferida
+from ..models import UgelExportJob
+from ..services import ugel_export_jobs, ugel_upload_parcial, ugel_uploads
+from ..services.ugel_upload_parcial import ErrorSubida
 from ..services.pdf_prechecks import verificar_cierre_bimestre
 
 
-# Almacenamiento temporal para uploads (en real: usar S3 o directorio MEDIA_ROOT)
-UPLOAD_TMP_DIR = getattr(settings, 'UPLOAD_TMP_DIR', tempfile.gettempdir())
-os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
-
-# Mapeo token -> (path, original_filename)
-_UPLOAD_TOKENS: dict[str, tuple[str, str]] = {}
-
-
 @require_http_methods(["POST"])
 def ugel_upload_post(request):
     """
     POST /libretas/ugel/upload
     Recibe .xlsx (request.FILES["file"]), guarda en UPLOAD_TMP_DIR,
-    preserva original_filename, devuelve token y filename.
+    preserva original_filename, devuelve token y filename. El token queda
+    en BD (UgelUpload): lo resuelve cualquier worker hasta que vence.
     Respuesta: {"token": "<uuid>", "filename": "<original>"}
     """
     if "file" not in request.FILES:
@@ -47,15 +45,9 @@ def ugel_upload_post(request):
             status=400
         )
 
-    # Generar token y guardar
-    token = str(uuid.uuid4())
-    temp_path = os.path.join(UPLOAD_TMP_DIR, f"{token}.xlsx")
-
+    # Guardar (deduplicado por contenido) y generar token
     try:
-        with open(temp_path, "wb") as f:
-            for chunk in uploaded_file.chunks():
-                f.write(chunk)
-        _UPLOAD_TOKENS[token] = (temp_path, original_filename)
+        token = str(ugel_uploads.registrar(uploaded_file, original_filename).token)
     except Exception as e:
         return JsonResponse(
             {"code": "UPLOAD_ERROR", "detail": str(e)},
@@ -68,6 +60,93 @@ def ugel_upload_post(request):
     )
 
 
+def _error_subida(e: ErrorSubida) -> JsonResponse:
+    return JsonResponse({"code": e.code, "detail": e.detail, **e.extra}, status=e.status)
+
+
+def _parcial_a_dict(parcial) -> dict:
+    return {
+        "uploadId": str(parcial.id),
+        "filename": parcial.nombre_original,
+        "size": parcial.tamano,
+        "offset": parcial.recibidos,
+        "chunkMax": ugel_upload_parcial.max_parte(),
+        "expira_en": parcial.expira_en.isoformat(),
+    }
+
+
+@require_http_methods(["POST"])
+def ugel_upload_partes_post(request):
+    """
+    POST /libretas/ugel/upload/partes  {"filename": "...", "size": <bytes>}
+    Inicia un upload por partes (reanudable). Responde 201 con uploadId,
+    offset (0) y chunkMax (bytes máximos por parte).
+    """
+    payload = _payload(request)
+    filename = str(request.POST.get("filename", "") or payload.get("filename", "")).strip()
+    try:
+        size = int(request.POST.get("size", "") or payload.get("size", ""))
+    except (TypeError, ValueError):
+        return JsonResponse(
+            {"code": "INVALID_PARAMS", "detail": "size debe ser numérico (bytes)"},
+            status=400
+        )
+    try:
+        parcial = ugel_upload_parcial.iniciar(filename, size)
+    except ErrorSubida as e:
+        return _error_subida(e)
+    return JsonResponse(_parcial_a_dict(parcial), status=201)
+
+
+@require_http_methods(["GET", "PUT", "DELETE"])
+def ugel_upload_partes_item(request, upload_id):
+    """
+    /libretas/ugel/upload/partes/<id>
+      GET: offset actual (desde dónde retomar tras un corte).
+      PUT ?offset=N (o header Upload-Offset): el cuerpo crudo es la parte
+          que empieza en N; se escribe directo al disco. Responde el nuevo
+          offset, o 409 OFFSET_MISMATCH con el offset esperado.
+      DELETE: cancela el upload.
+    """
+    try:
+        if request.method == "DELETE":
+            ugel_upload_parcial.descartar(upload_id)
+            return HttpResponse(status=204)
+        if request.method == "GET":
+            return JsonResponse(_parcial_a_dict(ugel_upload_parcial.obtener(upload_id)), status=200)
+        try:
+            offset = int(request.GET.get("offset", "") or request.headers.get("Upload-Offset", ""))
+        except ValueError:
+            return JsonResponse(
+                {"code": "INVALID_PARAMS", "detail": "Falta offset numérico (?offset= o Upload-Offset)"},
+                status=400
+            )
+        parcial = ugel_upload_parcial.agregar(upload_id, offset, request)
+    except ErrorSubida as e:
+        return _error_subida(e)
+    return JsonResponse(_parcial_a_dict(parcial), status=200)
+
+
+@require_http_methods(["POST"])
+def ugel_upload_partes_finalizar(request, upload_id):
+    """
+    POST /libretas/ugel/upload/partes/<id>/finalizar  {"sha256": "<hex>"}
+    Verifica checksum y estructura del .xlsx y lo registra como un upload
+    normal. Respuesta: {"token", "filename", "sheets"} (el token sirve en
+    ugel/download, ugel/export y ugel/export/jobs).
+    """
+    payload = _payload(request)
+    sha256 = request.POST.get("sha256", "") or payload.get("sha256", "")
+    try:
+        upload, hojas = ugel_upload_parcial.finalizar(upload_id, sha256)
+    except ErrorSubida as e:
+        return _error_subida(e)
+    return JsonResponse(
+        {"token": str(upload.token), "filename": upload.nombre_original, "sheets": hojas},
+        status=200
+    )
+
+
 @require_http_methods(["GET"])
 def ugel_download_get(request):
     """
@@ -77,13 +156,14 @@ def ugel_download_get(request):
     responde con XLSX real y Content-Disposition preservando nombre original.
     """
     token = request.GET.get("token", "").strip()
-    if not token or token not in _UPLOAD_TOKENS:
+    upload = ugel_uploads.resolver(token) if token else None
+    if upload is None:
         return JsonResponse(
             {"code": "TOKEN_INVALID", "detail": "Token no encontrado o expirado"},
             status=400
         )
 
-    path, original_filename = _UPLOAD_TOKENS[token]
+    path, original_filename = upload.ruta, upload.nombre_original
 
     # Opcional: aplicar validaciones de precondición
     # if not settings.USE_FAKE_DATA:
@@ -91,10 +171,13 @@ def ugel_download_get(request):
     #         return JsonResponse({...}, status=400)
 
     try:
+        # Una sola carga del archivo para consolidar y exportar, y ninguna si
+        # el consolidado sale de ugel_cache y el export no necesita el workbook
+        sesion = sesion_diferida(token, path)
         # Construir consolidado desde el archivo
-        consolidado = construir_consolidado(path, grado="1", curso="")
+        consolidado = construir_consolidado(path, grado="1", curso="", sesion=sesion)
         # Exportar XLSX con resultados
-        xlsx_bytes = exportar_excel(path, consolidado, comentarios=[])
+        xlsx_bytes = exportar_excel(path, consolidado, comentarios=[], sesion=sesion)
 
         resp = HttpResponse(
             xlsx_bytes,
@@ -113,54 +196,39 @@ def ugel_download_get(request):
 def ugel_excel_get(request):
     """
     GET /libretas/ugel/excel?grado=..&seccion=..&anio=..
-    (Opcional) Genera un XLSX directamente sin upload,
-    para demo o descarga manual de consolidados.
-    Por ahora: responde con XLSX fake o se salta.
+    Genera el XLSX UGEL del grado/sección/año desde la BD (sin upload):
+    una fila por alumno × asignatura con B1..B4, promedio y letra.
+    Se escribe en modo write_only a un archivo temporal y se transmite
+    por partes, así la memoria no crece con la cantidad de filas.
     """
     grado = request.GET.get("grado", "1").strip()
     seccion = request.GET.get("seccion", "A").strip()
     anio = request.GET.get("anio", "2025").strip()
-
-    # En real, construirías consolidado desde BD
-    # Para S2: mock simple
     try:
-        # Mock: crear un XLSX vacío o mínimo
-        from openpyxl import Workbook
-        from io import BytesIO
-
-        wb = Workbook()
-        ws = wb.active
-        if ws is None:
-            ws = wb.create_sheet("Grado 1")
-        ws.title = f"Grado {grado}"
-        ws["A1"] = "alumnoId"
-        ws["B1"] = "alumno"
-        ws["C1"] = "B1"
-        ws["D1"] = "B2"
-        ws["E1"] = "B3"
-        ws["F1"] = "B4"
-        ws["G1"] = "curso"
-        ws["H1"] = "promedio"
-        ws["I1"] = "letra"
-        ws["J1"] = "comentario"
-
-        stream = BytesIO()
-        wb.save(stream)
-        xlsx_bytes = stream.getvalue()
-
-        resp = HttpResponse(
-            xlsx_bytes,
-            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        anio_num = int(anio) if anio else None
+    except ValueError:
+        return JsonResponse(
+            {"code": "INVALID_PARAMS", "detail": "anio debe ser numérico"},
+            status=400
         )
-        filename = f"UGEL_G{grado}_S{seccion}_{anio}.xlsx"
-        resp["Content-Disposition"] = f'attachment; filename="{filename}"'
-        return resp
+
+    tmp = tempfile.TemporaryFile(suffix=".xlsx")  # se borra solo al cerrarse
+    try:
+        escribir_excel_ugel(tmp, grado, seccion, anio_num)
+        tmp.seek(0)
     except Exception as e:
+        tmp.close()
         return JsonResponse(
             {"code": "GENERATION_ERROR", "detail": str(e)},
             status=500
         )
 
+    filename = f"UGEL_G{grado}_S{seccion}_{anio}.xlsx"
+    return FileResponse(
+        tmp, as_attachment=True, filename=filename,
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+
 
 # Alias para compatibilidad con urls.py (si lo necesitas)
 ugel_upload = ugel_upload_post
@@ -197,20 +265,39 @@ def ugel_consolidado_get(request):
     return JsonResponse(data, status=200)
 
 
+def _payload(request) -> dict:
+    if request.content_type and "application/json" in request.content_type:
+        try:
+            return json.loads(request.body.decode("utf-8"))
+        except Exception:
+            return {}
+    return {}
+
+
+def _resolver_upload(upload_id: str) -> tuple[str, str]:
+    """
+    uploadId -> (path, original_filename).
+    Si es un token vigente, se resuelve desde UgelUpload; si no, se asume que
+    es una ruta directa (compatibilidad).
+    """
+    upload = ugel_uploads.resolver(upload_id)
+    if upload is not None:
+        return upload.ruta, upload.nombre_original
+    from ..services.storage import resolve_original_filename
+    return upload_id, resolve_original_filename(upload_id)
+
+
 @require_http_methods(["POST"])
 def ugel_export_post(request):
     """
     POST /libretas/ugel/export
     (Compatibilidad) Export directo tomando un archivo ya subido (uploadId=token)
     y respondiendo el XLSX con Prom/Letra/Comentario usando servicio real.
-    Acepta uploadId, grado, curso por form o JSON.
+    Acepta uploadId, grado, curso y modo (openpyxl | ooxml) por form o JSON.
+    Con todas=1 consolida todas las hojas (una por grado, en paralelo) y las
+    escribe en el mismo archivo.
     """
-    payload = {}
-    if request.content_type and "application/json" in request.content_type:
-        try:
-            payload = json.loads(request.body.decode("utf-8"))
-        except Exception:
-            payload = {}
+    payload = _payload(request)
     upload_id = request.POST.get("uploadId") or payload.get("uploadId")
     
     if not upload_id:
@@ -221,22 +308,22 @@ def ugel_export_post(request):
 
     grado = request.POST.get("grado", "") or payload.get("grado", "")
     curso = request.POST.get("curso", "") or payload.get("curso", "")
+    modo = request.POST.get("modo", "") or payload.get("modo", "")  # openpyxl | ooxml (vacío = settings)
+    todas = str(request.POST.get("todas", "") or payload.get("todas", "")).lower() in ("1", "true", "si", "sí")
 
-    # Si upload_id es un token UUID, resolver desde _UPLOAD_TOKENS
-    # Si es una ruta directa, usar directamente
-    if upload_id in _UPLOAD_TOKENS:
-        path, original_filename = _UPLOAD_TOKENS[upload_id]
-    else:
-        # Asumir que upload_id es una ruta completa (para compatibilidad)
-        path = upload_id
-        from ..services.storage import resolve_original_filename
-        original_filename = resolve_original_filename(upload_id)
+    path, original_filename = _resolver_upload(upload_id)
 
     try:
         # Usar servicio real: construir_consolidado + exportar_excel
-        consolidado = construir_consolidado(path, grado=grado, curso=curso)
         comentarios = []  # Mock: cuando conecten BD real, mapear por alumnoId
-        xlsx_bytes = exportar_excel(path, consolidado, comentarios)
+        if todas:
+            # Las hojas se leen en los workers del pool; el archivo se abre una vez más para escribir.
+            consolidados = construir_consolidado_hojas(path, curso=curso)
+            xlsx_bytes = exportar_excel_hojas(path, consolidados, comentarios, modo=modo or None)
+        else:
+            sesion = sesion_diferida(upload_id, path)
+            consolidado = construir_consolidado(path, grado=grado, curso=curso, sesion=sesion)
+            xlsx_bytes = exportar_excel(path, consolidado, comentarios, sesion=sesion, modo=modo or None)
 
         resp = HttpResponse(
             xlsx_bytes,
@@ -249,3 +336,93 @@ def ugel_export_post(request):
             {"code": "EXPORT_ERROR", "detail": str(e)},
             status=500
         )
+
+
+def _job_a_dict(request, job) -> dict:
+    data = {
+        "id": str(job.id),
+        "estado": job.estado,
+        "filename": job.nombre_original,
+        "total": job.total,
+        "procesados": job.procesados,
+        "progreso": round(100.0 * job.procesados / job.total, 1) if job.total else 0.0,
+        "error": job.error,
+        "creado_en": job.creado_en.isoformat() if job.creado_en else None,
+        "finalizado_en": job.finalizado_en.isoformat() if job.finalizado_en else None,
+    }
+    if job.estado == "COMPLETADO":
+        data["descarga"] = request.build_absolute_uri(f"/api/libretas/ugel/export/jobs/{job.id}/xlsx")
+    return data
+
+
+@require_http_methods(["POST"])
+def ugel_export_job_post(request):
+    """
+    POST /libretas/ugel/export/jobs
+    Mismos parámetros que ugel/export (uploadId, grado, curso, modo, todas),
+    pero el export corre en segundo plano: responde 202 con el id del job.
+    uploadId tiene que ser un token vigente del registro (sin rutas directas).
+    """
+    ugel_export_jobs.asegurar_reanudacion()
+    payload = _payload(request)
+    upload_id = request.POST.get("uploadId") or payload.get("uploadId")
+    if not upload_id:
+        return JsonResponse(
+            {"code": "UPLOAD_ID_REQUIRED", "detail": "Falta uploadId (token del archivo)"},
+            status=400
+        )
+    # Solo tokens del registro: el job no acepta rutas del disco.
+    upload = ugel_uploads.resolver(upload_id)
+    if upload is None:
+        return JsonResponse(
+            {"code": "TOKEN_INVALID", "detail": "Token no encontrado o expirado"},
+            status=400
+        )
+    try:
+        job = ugel_export_jobs.crear_job(
+            upload.ruta, upload.nombre_original,
+            grado=request.POST.get("grado", "") or payload.get("grado", ""),
+            curso=request.POST.get("curso", "") or payload.get("curso", ""),
+            modo=request.POST.get("modo", "") or payload.get("modo", ""),
+            todas=str(request.POST.get("todas", "") or payload.get("todas", "")).lower() in ("1", "true", "si", "sí"),
+        )
+    except FileNotFoundError:
+        return JsonResponse(
+            {"code": "TOKEN_INVALID", "detail": "Token no encontrado o expirado"},
+            status=400
+        )
+    return JsonResponse(_job_a_dict(request, job), status=202)
+
+
+@require_http_methods(["GET"])
+def ugel_export_job_get(request, job_id):
+    """
+    GET /libretas/ugel/export/jobs/<id>
+    Estado y avance (filas procesadas / total) del export.
+    """
+    ugel_export_jobs.asegurar_reanudacion()
+    job = UgelExportJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({"code": "JOB_NOT_FOUND", "detail": "Export no encontrado"}, status=404)
+    return JsonResponse(_job_a_dict(request, job), status=200)
+
+
+@require_http_methods(["GET"])
+def ugel_export_job_xlsx(request, job_id):
+    """
+    GET /libretas/ugel/export/jobs/<id>/xlsx
+    Descarga el .xlsx terminado con el nombre original del upload.
+    """
+    job = UgelExportJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({"code": "JOB_NOT_FOUND", "detail": "Export no encontrado"}, status=404)
+    if job.estado != "COMPLETADO" or not job.archivo:
+        return JsonResponse({"code": "JOB_NOT_FINISHED", "detail": f"Estado actual: {job.estado}"}, status=409)
+    try:
+        f = open(job.archivo, "rb")
+    except FileNotFoundError:
+        return JsonResponse({"code": "FILE_GONE", "detail": "El archivo ya no está disponible."}, status=410)
+    return FileResponse(
+        f, as_attachment=True, filename=job.nombre_original,
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
@@ -108,5 +108,36 @@ REST_FRAMEWORK = {
     ],
 }
 
+# === Libretas PDF ===
+# "simple" (un documento por grado), "paralelo" (una hoja por alumno en un pool de procesos)
+# o "incremental" (solo re-renderiza alumnos con notas modificadas)
+LIBRETAS_PDF_MODO = os.getenv("LIBRETAS_PDF_MODO", "simple")
+LIBRETAS_PDF_MOTOR = os.getenv("LIBRETAS_PDF_MOTOR", "weasyprint")  # weasyprint | reportlab
+LIBRETAS_PDF_WORKERS = int(os.getenv("LIBRETAS_PDF_WORKERS", "0"))  # 0 = os.cpu_count()
+LIBRETAS_PDF_CACHE_DIR = MEDIA_ROOT / "libretas_cache"  # PDFs cacheados por hash de contenido
+LIBRETAS_PDF_CACHE_MAX_BYTES = int(os.getenv("LIBRETAS_PDF_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))  # LRU; 0 = sin límite
+LIBRETAS_LOTES_DIR = MEDIA_ROOT / "libretas_lotes"      # ZIPs de generación masiva
+LIBRETAS_LOTE_WORKERS = int(os.getenv("LIBRETAS_LOTE_WORKERS", "2"))
+LIBRETAS_LOTE_LATIDO_SEG = int(os.getenv("LIBRETAS_LOTE_LATIDO_SEG", "300"))  # sin latido = lote huérfano
+LIBRETAS_LOTE_TTL = int(os.getenv("LIBRETAS_LOTE_TTL", str(24 * 3600)))  # segundos desde que terminó el lote
+LIBRETAS_RESUMEN_VERIFICAR = os.getenv("LIBRETAS_RESUMEN_VERIFICAR", "True") == "True"  # cuadra resumen vs nota al consolidar
+LIBRETAS_UGEL_SESIONES_MAX = int(os.getenv("LIBRETAS_UGEL_SESIONES_MAX", "8"))  # workbooks UGEL en memoria
+LIBRETAS_UGEL_SESION_TTL = int(os.getenv("LIBRETAS_UGEL_SESION_TTL", "600"))    # segundos
+LIBRETAS_UGEL_WORKERS = int(os.getenv("LIBRETAS_UGEL_WORKERS", "0"))  # hojas en paralelo; 0 = os.cpu_count()
+LIBRETAS_UGEL_EXPORT_MODO = os.getenv("LIBRETAS_UGEL_EXPORT_MODO", "openpyxl")  # openpyxl | ooxml
+LIBRETAS_UGEL_UPLOAD_TTL = int(os.getenv("LIBRETAS_UGEL_UPLOAD_TTL", str(24 * 3600)))  # segundos de vida del token
+LIBRETAS_UGEL_UPLOADS_MAX_BYTES = int(os.getenv("LIBRETAS_UGEL_UPLOADS_MAX_BYTES", str(1024 ** 3)))  # 0 = sin límite
+LIBRETAS_UGEL_UPLOAD_MAX_BYTES = int(os.getenv("LIBRETAS_UGEL_UPLOAD_MAX_BYTES", str(100 * 1024 ** 2)))  # upload por partes
+LIBRETAS_UGEL_UPLOAD_PARTE_MAX_BYTES = int(os.getenv("LIBRETAS_UGEL_UPLOAD_PARTE_MAX_BYTES", str(8 * 1024 ** 2)))
+LIBRETAS_UGEL_UPLOAD_MAX_DESCOMPRIMIDO = int(os.getenv("LIBRETAS_UGEL_UPLOAD_MAX_DESCOMPRIMIDO", str(1024 ** 3)))  # anti zip-bomb
+LIBRETAS_UGEL_UPLOAD_PARCIAL_TTL = int(os.getenv("LIBRETAS_UGEL_UPLOAD_PARCIAL_TTL", str(24 * 3600)))  # desde la última parte
+LIBRETAS_UGEL_EXPORTS_DIR = MEDIA_ROOT / "ugel_exports"  # .xlsx de exports asíncronos
+LIBRETAS_UGEL_EXPORT_TTL = int(os.getenv("LIBRETAS_UGEL_EXPORT_TTL", str(24 * 3600)))  # segundos desde que terminó el job
+LIBRETAS_UGEL_JOB_WORKERS = int(os.getenv("LIBRETAS_UGEL_JOB_WORKERS", "2"))
+LIBRETAS_UGEL_JOB_LATIDO_SEG = int(os.getenv("LIBRETAS_UGEL_JOB_LATIDO_SEG", "300"))  # sin latido = job huérfano
+LIBRETAS_UGEL_CACHE = os.getenv("LIBRETAS_UGEL_CACHE", "True") == "True"  # consolidados cacheados por hash del archivo
+LIBRETAS_UGEL_CACHE_DIR = MEDIA_ROOT / "ugel_cache"
+LIBRETAS_UGEL_CACHE_MAX_BYTES = int(os.getenv("LIBRETAS_UGEL_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))  # LRU; 0 = sin límite
+
 # === Default PK type ===
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"